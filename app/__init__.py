@@ -2,8 +2,14 @@ from flask import Flask
 from flask_restx import Api  # Swagger + Routing
 
 # Blueprint routes
-from app.routes.cookie_routes import cookie_routes, cookie_ns
+from app.routes.cookie_routes import cookie_routes, cookie_ns, catalog_pricing
 from app.routes.order_routes import order_routes, order_ns
+from app.routes.cache_routes import cache_ns
+from app.routes.caching import list_cache
+from app.routes import cookie_routes as cookie_routes_module, order_routes as order_routes_module
+from app.cli import register_commands
+from app.metrics import register_metrics
+from app.profiling import register_profiler
 
 # Create the Swagger API object
 api = Api(
@@ -12,8 +18,101 @@ api = Api(
     description="Cookie Shop API Assessment",
 )
 
-def create_app():
+# Default settings (override by passing a config dict to create_app)
+DEFAULT_CONFIG = {
+    'STORAGE_BACKEND': 'memory',    # 'memory' (module-level demo stores), 'sqlite' or 'columnar' (needs numpy)
+    'SQLITE_PATH': 'cookie_shop.db',    # Database file for the 'sqlite' backend, shared by all workers
+    'JOURNAL_DIR': None,    # Directory for the 'memory' backend's write-ahead log and snapshots (None = no persistence)
+    'JOURNAL_SYNC': 'group',    # 'group' (durable on return, fsyncs shared) or 'interval' (background fsync)
+    'JOURNAL_SYNC_INTERVAL': 0.05,  # Seconds between background fsyncs in 'interval' mode
+    'JOURNAL_SNAPSHOT_EVERY': 10000,    # Log records between snapshots
+    'LIST_CACHE_SIZE': 1024,    # List responses kept in the cache (0 = no caching)
+    'LIST_CACHE_TTL': 30.0,     # Seconds a cached list response is served for
+    'METRICS_ENABLED': True,    # Time requests and store operations, served at /metrics
+    'PROFILING_ENABLED': False,     # Let requests with an X-Profile header be profiled (see app/profiling.py)
+    'PROFILING_TOKEN': None,    # When set, X-Profile must carry this token (None = any X-Profile header)
+    'PROFILE_ALL_REQUESTS': False,  # Profile every request, not just those asking (needs PROFILE_DIR)
+    'PROFILE_DIR': None,    # Directory to write profiles to (None = send the profile back instead of the response)
+}
+
+
+def use_stores(cookie_store, order_store):
+    '''
+        Point the routes and the pricing service at the given cookie and order stores
+    '''
+    catalog_pricing.unsubscribe(order_routes_module.orders.reprice_cookie)
+
+    cookie_routes_module.cookies = cookie_store
+    catalog_pricing.catalog = cookie_store
+    order_routes_module.orders = order_store
+    order_store.pricing = catalog_pricing
+
+    catalog_pricing.subscribe(order_store.reprice_cookie)
+
+    # Another store's collection tags could collide with the old one's
+    list_cache.invalidate('cookies', 'orders')
+
+
+def configure_storage(app):
+    '''
+        Set up the storage backend chosen by app.config['STORAGE_BACKEND']
+    '''
+    backend = app.config['STORAGE_BACKEND']
+
+    if backend == 'memory':
+        if not app.config['JOURNAL_DIR']:
+            return  # The in-memory stores are set up when the routes are imported
+
+        from app.store.journal import Journal
+        from app.store.journaled_store import open_journaled_stores
+
+        journal = Journal(
+            app.config['JOURNAL_DIR'],
+            sync=app.config['JOURNAL_SYNC'],
+            sync_interval=app.config['JOURNAL_SYNC_INTERVAL'],
+            snapshot_every=app.config['JOURNAL_SNAPSHOT_EVERY'],
+        )
+        app.extensions['journal'] = journal
+
+        # A brand new journal starts from the demo data
+        use_stores(*open_journaled_stores(
+            journal,
+            seed_cookies=list(cookie_routes_module.cookies.values()),
+            seed_orders=list(order_routes_module.orders.values()),
+        ))
+        return
+
+    if backend == 'sqlite':
+        from app.store.sqlite_store import SqliteDatabase, SqliteCookieStore, SqliteOrderStore
+
+        database = SqliteDatabase(app.config['SQLITE_PATH'])
+        use_stores(SqliteCookieStore(database), SqliteOrderStore(database))
+        return
+
+    if backend == 'columnar':
+        from app.store.columnar_order_store import ColumnarOrderStore
+
+        # In-memory cookies as usual, orders in NumPy columns for fast filtering. Starts from the demo orders
+        order_store = ColumnarOrderStore(catalog_pricing)
+        order_store.add_many(list(order_routes_module.orders.values()))
+        use_stores(cookie_routes_module.cookies, order_store)
+        return
+
+    raise ValueError(f"Unknown STORAGE_BACKEND: {backend}. Options: memory, sqlite, columnar")
+
+
+def create_app(config=None):
     app = Flask(__name__)
+    app.config.update(DEFAULT_CONFIG)
+    if config:
+        app.config.update(config)
+
+    # Pick the storage backend
+    configure_storage(app)
+    list_cache.configure(app.config['LIST_CACHE_SIZE'], app.config['LIST_CACHE_TTL'])
+
+    # Request and store timings (after the stores are picked, so those are the ones timed)
+    register_metrics(app)
 
     # Register Flask Blueprints
     app.register_blueprint(cookie_routes, url_prefix='/api')
@@ -23,5 +122,12 @@ def create_app():
     api.init_app(app)
     api.add_namespace(cookie_ns, path='/api/cookies')
     api.add_namespace(order_ns, path='/api/orders')
+    api.add_namespace(cache_ns, path='/api/cache')
+
+    # CLI commands (e.g. flask --app run import-cookies)
+    register_commands(app)
+
+    # Opt-in request profiling (after the routes, since it wraps their views)
+    register_profiler(app)
 
-    return app
\ No newline at end of file
+    return app
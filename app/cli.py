@@ -0,0 +1,67 @@
+'''
+    Flask CLI commands (run with `flask --app run <command>`)
+'''
+import time
+import click
+from app.routes import cookie_routes as cookie_routes_module
+from app.services.catalog_import import IMPORT_FORMATS, IMPORT_BATCH_SIZE, detect_format, import_cookies
+
+
+PROGRESS_EVERY = 5.0    # Seconds between progress lines during a long import
+
+
+def register_commands(app):
+    '''
+        Attach the shop's CLI commands to the app
+    '''
+
+    @app.cli.command('import-cookies')
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--format', 'file_format', type=click.Choice(IMPORT_FORMATS), help='File format (default: from the extension)')
+    @click.option('--batch-size', type=click.IntRange(min=1), default=IMPORT_BATCH_SIZE, show_default=True, help='Cookies written per store batch')
+    def import_cookies_command(path, file_format, batch_size):
+        '''
+            Import cookies from a CSV or NDJSON file into the configured store
+        '''
+        if not persists_cookies(app.config):
+            raise click.UsageError(
+                "The configured store keeps cookies in memory only, so the import would be lost when this command exits. "
+                "Use the 'sqlite' STORAGE_BACKEND, or the 'memory' one with a JOURNAL_DIR."
+            )
+
+        file_format = file_format or detect_format(path)
+        if file_format is None:
+            raise click.UsageError(f"Can't tell the format of {path} from its extension, pass --format.")
+
+        last_report = [time.perf_counter()]
+
+        def progress(report):
+            now = time.perf_counter()
+            if now - last_report[0] >= PROGRESS_EVERY:
+                last_report[0] = now
+                click.echo(f"... {report['rows']:,} rows read, {report['rows_per_second']:,.0f} rows/sec", err=True)
+
+        try:
+            with open(path, newline='', encoding='utf-8') as stream:
+                report = import_cookies(stream, cookie_routes_module.cookies, file_format, batch_size, progress=progress)
+        except ValueError as e:
+            raise click.ClickException(str(e))
+
+        for error in report['errors']:
+            click.echo(f"line {error['line']}: {error['message']}", err=True)
+        if report['failed'] > len(report['errors']):
+            click.echo(f"... and {report['failed'] - len(report['errors'])} more bad rows", err=True)
+
+        click.echo(
+            f"Imported {report['imported']:,} of {report['rows']:,} rows ({report['failed']:,} failed) "
+            f"in {report['seconds']:.2f}s: {report['rows_per_second']:,.0f} rows/sec"
+        )
+
+
+
+# Helper Methods:
+# ------------------------ #
+
+def persists_cookies(config):
+    # Whether cookies written through the app outlive the process (the columnar backend keeps cookies in memory too)
+    return config['STORAGE_BACKEND'] == 'sqlite' or (config['STORAGE_BACKEND'] == 'memory' and bool(config['JOURNAL_DIR']))
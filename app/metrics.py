@@ -0,0 +1,145 @@
+'''
+    Request and store instrumentation, exposed in the Prometheus text format at /metrics
+'''
+import time
+from flask import Response, g, request
+from app.routes import cookie_routes as cookie_routes_module, order_routes as order_routes_module
+from app.routes.cookie_routes import catalog_pricing
+from app.routes.caching import list_cache
+from app.services.metrics import MetricsRegistry, SIZE_BUCKETS
+
+
+metrics = MetricsRegistry()     # Shared by every app in the process, like the stores
+
+metrics.describe('http_requests_total', 'counter', 'Requests handled, by route, method and status code')
+metrics.describe('http_request_duration_seconds', 'histogram', 'Time spent handling a request, by route and method')
+metrics.describe('http_request_size_bytes', 'histogram', 'Request body sizes, by route and method')
+metrics.describe('http_response_size_bytes', 'histogram', 'Response body sizes, by route and method (streamed bodies are left out)')
+metrics.describe('store_operation_duration_seconds', 'histogram', 'Time spent in a store or pricing call, by component and operation')
+
+# Store methods that get timed. Lazy queries are timed until they're used up, so the time reading matches counts too
+STORE_OPERATIONS = {
+    'cookies': ('add', 'update_cookie', 'remove', 'apply_batch', 'query', 'reserve_inventory', 'reserve_inventory_batch', 'release_inventory'),
+    'orders': ('add', 'add_many', 'set_status', 'set_statuses', 'set_cookies_and_quantities', 'query', 'count_by_status'),
+}
+
+
+def register_metrics(app):
+    '''
+        Time every request and the current stores' operations, and serve the numbers at /metrics.
+        Turned off by METRICS_ENABLED = False.
+    '''
+    if not app.config.get('METRICS_ENABLED', True):
+        return
+
+    instrument_store(cookie_routes_module.cookies, 'cookies')
+    instrument_store(order_routes_module.orders, 'orders')
+    instrument_pricing()
+
+    @app.before_request
+    def start_timer():
+        g.metrics_started = time.perf_counter()
+
+
+    @app.after_request
+    def record_request(response):
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return response
+
+        # The route pattern (e.g. /api/orders/<int:id>), not the path, so the label set stays small
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        method = request.method
+
+        metrics.histogram('http_request_duration_seconds', route=route, method=method).observe(time.perf_counter() - started)
+        metrics.counter('http_requests_total', route=route, method=method, status=response.status_code).inc()
+        if request.content_length:
+            metrics.histogram('http_request_size_bytes', SIZE_BUCKETS, route=route, method=method).observe(request.content_length)
+        if not response.is_streamed:
+            metrics.histogram('http_response_size_bytes', SIZE_BUCKETS, route=route, method=method).observe(response.calculate_content_length() or 0)
+        return response
+
+
+    @app.route('/metrics')
+    def metrics_endpoint():
+        return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+
+def instrument_store(store, component):
+    '''
+        Time a store's operations, by shadowing its methods on the instance (so isinstance and the class are
+        untouched). Safe to call again on a store that's already instrumented.
+    '''
+    if getattr(store, '_metrics_instrumented', False):
+        return
+
+    for operation in STORE_OPERATIONS[component]:
+        method = getattr(store, operation, None)
+        if method is None:
+            continue
+        timed = metrics.timed('store_operation_duration_seconds', component=component, operation=operation)
+        setattr(store, operation, _timed_iterator(method, component, operation) if operation == 'query' else timed(method))
+
+    store._metrics_instrumented = True
+
+
+
+def instrument_pricing():
+    '''
+        Time order pricing, the work behind every order's total (get_order_total_amount reads the stored result)
+    '''
+    if getattr(catalog_pricing, '_metrics_instrumented', False):
+        return
+
+    catalog_pricing.order_total = metrics.timed(
+        'store_operation_duration_seconds', component='pricing', operation='order_total'
+    )(catalog_pricing.order_total)
+    catalog_pricing._metrics_instrumented = True
+
+
+
+def collect_list_cache():
+    '''
+        The list cache's own counters, read when /metrics is scraped
+    '''
+    stats = list_cache.stats()
+    events = ('hits', 'misses', 'evictions', 'expirations', 'invalidations')
+    return [
+        ('list_cache_events_total', 'counter', 'List cache lookups and drops, by event', [({'event': event}, stats[event]) for event in events]),
+        ('list_cache_entries', 'gauge', 'List responses cached right now', [({}, stats['entries'])]),
+    ]
+
+metrics.add_collector(collect_list_cache)
+
+
+
+# Helper Methods:
+# ------------------------ #
+
+def _timed_iterator(query, component, operation):
+    # Time the call and then every step of the iteration it returns, observed once the iteration ends
+    histogram = metrics.histogram('store_operation_duration_seconds', component=component, operation=operation)
+
+    def timed_query(*args, **kwargs):
+        started = time.perf_counter()
+        results = iter(query(*args, **kwargs))
+        elapsed = time.perf_counter() - started
+
+        def timed_results():
+            nonlocal elapsed
+            try:
+                while True:
+                    step = time.perf_counter()
+                    try:
+                        item = next(results)
+                    except StopIteration:
+                        return
+                    finally:
+                        elapsed += time.perf_counter() - step
+                    yield item
+            finally:
+                histogram.observe(elapsed)
+        return timed_results()
+
+    return timed_query
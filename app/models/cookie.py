@@ -1,11 +1,16 @@
 '''
     Class to model a Cookie object
 '''
+import json
 from typing import Optional
+from app.models.id_counter import IdCounter
 
 class Cookie:
+
+    # No per-instance __dict__, which adds up with a big catalog held in memory
+    __slots__ = ('id', 'name', 'description', 'price', 'inventory_count', 'version', '_json')
     
-    _id_counter = 0  # Class-level counter to give cookie unique IDs
+    _id_counter = IdCounter()  # Class-level counter to give cookie unique IDs
 
     def __init__(self, name: str, description: str, price: float, inventory_count: int):
 
@@ -28,8 +33,7 @@ class Cookie:
 
 
         # Assign unique ID for new cookie product
-        self.id = Cookie._id_counter
-        Cookie._id_counter += 1 # Inc count for next Cookie
+        self.id = Cookie._id_counter.next()  # Atomic, so concurrent requests never share an ID
 
 
         # Cookie details
@@ -38,6 +42,28 @@ class Cookie:
         self.price = round(price, 2)     # Float
         self.inventory_count = inventory_count   # Integer
 
+        self.version = 1    # Goes up by one on every change, for ETags
+        self._json = None   # (ID, version, JSON text) cached by to_json()
+
+
+
+    @classmethod
+    def from_storage(cls, id: int, name: str, description: str, price: float, inventory_count: int, version: int = 1):
+        '''
+            Rebuild a Cookie that was already stored. Keeps its ID and version, and doesn't touch the ID counter.
+        '''
+        cookie = cls.__new__(cls)
+
+        cookie.id = id
+        cookie.name = name
+        cookie.description = description
+        cookie.price = price
+        cookie.inventory_count = inventory_count
+        cookie.version = version
+        cookie._json = None
+
+        return cookie
+
 
 
     def to_dict(self):
@@ -48,9 +74,20 @@ class Cookie:
             "id": self.id,
             "name": self.name,
             "description": self.description,
-            "price": self.price,
+            "price": float(self.price),     # A float on the wire, as the Swagger model says, even if it was given as an int
             "inventory_count": self.inventory_count
         }
+
+
+    def to_json(self):
+        """
+            The cookie encoded as JSON (the to_dict() fields, as list responses send them).
+            Cached until the cookie changes, which always moves its version.
+        """
+        cached = self._json
+        if cached is None or cached[0] != self.id or cached[1] != self.version:
+            cached = self._json = (self.id, self.version, json.dumps(self.to_dict()))
+        return cached[2]
     
 
     # Setter Methods
@@ -64,12 +101,14 @@ class Cookie:
             raise ValueError("Cookie name cannot be empty.")
         
         self.name = name
+        self.version += 1
 
     def set_description(self, description):
         if not isinstance(description, str):
             raise ValueError("Cookie description must be a string.")
         
         self.description = description
+        self.version += 1
 
     def set_price(self, price):
         if not isinstance(price, (int, float)):  # Price should be a number
@@ -79,6 +118,7 @@ class Cookie:
             raise ValueError("Cookie price cannot be negative.")
         
         self.price = float(f"{price:.2f}") # Rount to 2 decimal points for cents
+        self.version += 1
 
     def set_inventory_count(self, inventory_count):
         if not isinstance(inventory_count, int):  # Inventory should be an integer
@@ -88,6 +128,7 @@ class Cookie:
             raise ValueError("Cookie inventory count cannot be negative.")
         
         self.inventory_count = inventory_count
+        self.version += 1
 
 
 
@@ -121,7 +162,9 @@ class Cookie:
         if inventory_count is not None:
             self.inventory_count = inventory_count
             updated = True
-        
+
+        if updated:
+            self.version += 1
         return updated
 
 
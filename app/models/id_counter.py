@@ -0,0 +1,49 @@
+'''
+    Thread-safe counter for handing out unique IDs
+'''
+import threading
+
+
+class IdCounter:
+
+    def __init__(self, start: int = 0):
+
+        '''
+            Constructor for a counter whose first ID is start
+        '''
+
+        self._next_id = start
+        self._lock = threading.Lock()
+
+
+    def next(self):
+        '''
+            Hand out the next ID. Atomic, so concurrent callers never get the same one.
+        '''
+        with self._lock:
+            id = self._next_id
+            self._next_id += 1
+            return id
+
+
+    def peek(self):
+        '''
+            The ID the next call to next() will hand out
+        '''
+        return self._next_id
+
+
+    def advance_to(self, next_id: int):
+        '''
+            Make sure no ID below next_id is handed out from now on
+        '''
+        with self._lock:
+            self._next_id = max(self._next_id, next_id)
+
+
+    def reset(self, next_id: int):
+        '''
+            Set the next ID outright (for tests)
+        '''
+        with self._lock:
+            self._next_id = next_id
@@ -1,15 +1,38 @@
 '''
     Class to model an Order object
 '''
+import json
+from array import array
 from enum import Enum
 from datetime import datetime
-from app.routes.cookie_routes import CookieByID
-from app.models.cookie import Cookie
+from app.models.id_counter import IdCounter
+
+
+LINE_ITEM_LIMIT = 2 ** 32    # Cookie IDs and quantities are packed as unsigned 32-bit integers
+
+
+def pack_line_items(cookies_and_quantities: dict):
+    '''
+        Pack a map (Cookie ID --> Number) into one flat array of [ID, quantity, ID, quantity, ...],
+        a fraction of the size of a dict (and its int objects) for the one or two lines most orders have
+    '''
+    line_items = array('I')
+    for cookie_id, quantity in cookies_and_quantities.items():
+        if cookie_id >= LINE_ITEM_LIMIT or quantity >= LINE_ITEM_LIMIT:
+            raise ValueError(f"Cookie IDs and quantities must be below {LINE_ITEM_LIMIT}. Found {quantity} for cookie ID {cookie_id}.")
+        line_items.append(cookie_id)
+        line_items.append(quantity)
+    return line_items
+
 
 
 class Order:
+
+    # No per-instance __dict__, and the line items packed in an array (see pack_line_items),
+    # since millions of historical orders can be held in memory
+    __slots__ = ('id', '_line_items', 'order_date', 'deliver_date', 'status', 'total_amount', 'version', '_json')
     
-    _id_counter = 0  # Class-level counter to give orders unique IDs
+    _id_counter = IdCounter()  # Class-level counter to give orders unique IDs
 
     # Statuses for an order
     class OrderStatus(Enum):
@@ -49,14 +72,55 @@ class Order:
 
 
         # Assign unique ID for new cookie product
-        self.id = Order._id_counter
-        Order._id_counter += 1 # Inc counter for next order
+        self.id = Order._id_counter.next()   # Atomic, so concurrent requests never share an ID
 
         self.cookies_and_quantities = cookies_and_quantities    # Map (Cookie ID --> Number)
         self.order_date = order_date    # Datetime
         self.deliver_date = deliver_date    # Datetime
         self.status = status    # An instance of OrderStatus Enum
 
+        # Materialized total price, kept up to date instead of recomputed per request.
+        # Settled by the order store once the order is stored, so unchecked cookies are never priced
+        self.total_amount = 0.0     # Float
+
+        self.version = 1    # Goes up by one on every change to what to_dict() shows, for ETags
+        self._json = None   # (ID, version, JSON text) cached by to_json()
+
+
+    @classmethod
+    def from_storage(cls, id: int, cookies_and_quantities: dict, order_date: datetime, deliver_date: datetime, status: OrderStatus, total_amount: float, version: int = 1):
+        '''
+            Rebuild an Order that was already stored. Keeps its ID, stored total and version, and doesn't touch the ID counter.
+        '''
+        order = cls.__new__(cls)
+
+        order.id = id
+        order.cookies_and_quantities = cookies_and_quantities
+        order.order_date = order_date
+        order.deliver_date = deliver_date
+        order.status = status
+        order.total_amount = total_amount
+        order.version = version
+        order._json = None
+
+        return order
+
+
+
+    @property
+    def cookies_and_quantities(self):
+        '''
+            Map (Cookie ID --> Number), unpacked from the line items. A fresh dict each time, so change
+            an order's cookies with set_cookies_and_quantities rather than by editing this.
+        '''
+        line_items = self._line_items
+        return dict(zip(line_items[::2], line_items[1::2]))
+
+    @cookies_and_quantities.setter
+    def cookies_and_quantities(self, cookies_and_quantities):
+        self._line_items = pack_line_items(cookies_and_quantities)
+
+
 
     def to_dict(self):
         """
@@ -69,6 +133,17 @@ class Order:
             "deliver_date": self.deliver_date.isoformat() if isinstance(self.deliver_date, datetime) else self.deliver_date,
             "status": self.status.name,
         }
+
+
+    def to_json(self):
+        """
+            The order encoded as JSON (the to_dict() fields, as list responses send them).
+            Cached until the order changes, which always moves its version.
+        """
+        cached = self._json
+        if cached is None or cached[0] != self.id or cached[1] != self.version:
+            cached = self._json = (self.id, self.version, json.dumps(self.to_dict()))
+        return cached[2]
     
 
 
@@ -78,6 +153,7 @@ class Order:
     def set_cookies_and_quantities(self, cookies_and_quantities):
         if isinstance(cookies_and_quantities, dict):  # Validate it's a dictionary
             self.cookies_and_quantities = cookies_and_quantities
+            self.version += 1
         else:
             raise ValueError(f"cookies_and_quantities must be a dictionary, got {type(cookies_and_quantities)} instead.")
 
@@ -94,6 +170,7 @@ class Order:
                     raise ValueError(f"Each quantity value must be a non-negative integer. Found {value} for cookie ID {key}.")
                 
             self.cookies_and_quantities = cookies_and_quantities
+            self.version += 1
         else:
             raise ValueError(f"cookies_and_quantities must be a dictionary, got {type(cookies_and_quantities)} instead.")
 
@@ -101,18 +178,21 @@ class Order:
     def set_order_date(self, order_date):
         if isinstance(order_date, datetime):  # Ensure it's a datetime object
             self.order_date = order_date
+            self.version += 1
         else:
             raise ValueError(f"order_date must be a datetime object, got {type(order_date)} instead.")
 
     def set_deliver_date(self, deliver_date):
         if isinstance(deliver_date, datetime):  # Ensure it's a datetime object
             self.deliver_date = deliver_date
+            self.version += 1
         else:
             raise ValueError(f"deliver_date must be a datetime object, got {type(deliver_date)} instead.")
 
     def set_status(self, status):
         if isinstance(status, Order.OrderStatus):  # Ensure it's an instance of OrderStatus Enum
             self.status = status
+            self.version += 1
         else:
             raise ValueError(f"status must be an instance of OrderStatus Enum, got {type(status)} instead.")
 
@@ -123,30 +203,14 @@ class Order:
 
     def get_order_total_amount(self):
         '''
-        Calculate the total price of an order.
+        Get the total price of an order.
         '''
-        order_total_amount = 0
-
-        for cookie_id, cookie_quantity in self.cookies_and_quantities.items():
-
-            # Get the 
-            response_data, status_code = CookieByID().get(cookie_id)
-            if status_code == 200 and response_data:
-                try:
-                    cookie = Cookie(
-                        name=response_data['name'],
-                        description=response_data['description'],
-                        price=response_data['price'],
-                        inventory_count=response_data['inventory_count']
-                    )
-
-                    # Add to total
-                    order_total_amount += (cookie.price * cookie_quantity)
+        return self.total_amount
 
-                except Exception as e:
-                    print(f"Error creating Cookie (id:{cookie_id}) object: {e}")
 
-            else:
-                print(f"No data or request failed when getting Cookie (id:{cookie_id}) details.")
-
-        return round(order_total_amount, 2)
\ No newline at end of file
+    def refresh_total_amount(self, pricing):
+        '''
+        Recalculate the total price of an order from the current cookie prices, looked up through the given pricing service.
+        '''
+        self.total_amount = pricing.order_total(self.cookies_and_quantities)
+        return self.total_amount
@@ -0,0 +1,148 @@
+'''
+    On-demand request profiling. A request with the X-Profile header (or every request, with PROFILE_ALL_REQUESTS)
+    has its view run under cProfile, and the profile comes back as collapsed stacks, one "frame;frame;frame weight"
+    line per call path with the weight in microseconds, ready for flamegraph.pl or speedscope.
+'''
+import cProfile
+import hmac
+import os
+import pstats
+import re
+import time
+from functools import wraps
+from flask import Response, current_app, request
+
+
+PROFILE_HEADER = 'X-Profile'
+MAX_DEPTH = 200     # Deeper call paths are cut short (their time counts as the last frame's own)
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def register_profiler(app):
+    '''
+        Wrap every view of the app so requests can be profiled. Off unless PROFILING_ENABLED, and with
+        PROFILING_TOKEN set only requests whose X-Profile header carries that token are profiled.
+        Call it after the routes are registered.
+    '''
+    if not app.config['PROFILING_ENABLED']:
+        return
+
+    if app.config['PROFILE_ALL_REQUESTS'] and not app.config['PROFILE_DIR']:
+        raise ValueError("PROFILE_ALL_REQUESTS needs a PROFILE_DIR to write the profiles to.")
+    if app.config['PROFILE_DIR']:
+        os.makedirs(app.config['PROFILE_DIR'], exist_ok=True)
+
+    for endpoint, view in list(app.view_functions.items()):
+        if endpoint != 'static':
+            app.view_functions[endpoint] = profiled(view)
+
+
+
+def profiled(view):
+    '''
+        Decorate a view so it runs under cProfile when the request asks for it (see register_profiler).
+        The profile is written to PROFILE_DIR (named in the X-Profile-File header) if that's set,
+        otherwise it replaces the response body, with the view's own status in X-Profiled-Status.
+    '''
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not wants_profile():
+            return view(*args, **kwargs)
+
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        response = current_app.make_response(profiler.runcall(view, *args, **kwargs))
+        elapsed = time.perf_counter() - started
+
+        stacks = collapse_stacks(pstats.Stats(profiler))
+        profile_dir = current_app.config['PROFILE_DIR']
+        if profile_dir:
+            name = profile_file_name()
+            with open(os.path.join(profile_dir, name), 'w') as profile_file:
+                profile_file.write(stacks)
+            response.headers['X-Profile-File'] = name
+            return response
+
+        profile = Response(stacks, mimetype='text/plain')
+        profile.headers['X-Profiled-Status'] = str(response.status_code)
+        profile.headers['X-Profile-Seconds'] = f'{elapsed:.6f}'
+        return profile
+    return wrapper
+
+
+
+def wants_profile():
+    '''
+        Whether the current request should be profiled
+    '''
+    config = current_app.config
+    if config['PROFILE_ALL_REQUESTS']:
+        return True
+
+    given = request.headers.get(PROFILE_HEADER)
+    if given is None:
+        return False
+    token = config['PROFILING_TOKEN']
+    return token is None or hmac.compare_digest(given.encode(), token.encode())
+
+
+
+def collapse_stacks(stats: pstats.Stats):
+    '''
+        Turn cProfile stats into collapsed stacks. cProfile only keeps caller --> callee totals, so each
+        function's time is split between its call paths in proportion to how much each caller spent in it.
+    '''
+    callees = {}    # Maps each function to {callee: cumulative time spent in that callee when called from it}
+    roots = []
+    for function, (_, _, _, _, callers) in stats.stats.items():
+        if not callers:
+            roots.append(function)
+        for caller, (_, _, _, cumulative) in callers.items():
+            callees.setdefault(caller, {})[function] = cumulative
+
+    weights = {}    # Maps a collapsed stack to its own time in seconds
+
+    def walk(function, share, path, on_path):
+        _, _, own, cumulative, _ = stats.stats[function]
+        path = path + (frame_name(function),)
+        stack = ';'.join(path)
+        if len(path) >= MAX_DEPTH:
+            weights[stack] = weights.get(stack, 0.0) + share
+            return
+
+        scale = share / cumulative if cumulative else 0.0
+        weights[stack] = weights.get(stack, 0.0) + own * scale
+        for callee, callee_time in callees.get(function, {}).items():
+            if callee in on_path:   # Recursion: the time already counts further up this path
+                continue
+            walk(callee, callee_time * scale, path, on_path | {callee})
+
+    for root in roots:
+        if '_lsprof' in root[2]:    # The profiler's own disable() call
+            continue
+        walk(root, stats.stats[root][3], (), {root})
+
+    lines = [f'{stack} {round(seconds * 1_000_000)}' for stack, seconds in weights.items() if seconds >= 0.0000005]
+    return '\n'.join(sorted(lines)) + '\n'
+
+
+
+# Helper Methods:
+# ------------------------ #
+
+def frame_name(function):
+    # e.g. "query (app/store/order_store.py:120)", or "<built-in method builtins.sorted>"
+    filename, line, name = function
+    if filename == '~':
+        return name.replace(';', ',')
+    if filename.startswith(ROOT_DIR + os.sep):
+        filename = os.path.relpath(filename, ROOT_DIR)
+    else:
+        filename = os.path.basename(filename)
+    return f'{name} ({filename}:{line})'.replace(';', ',')
+
+def profile_file_name():
+    # Unique per request, and sortable by time: <ns since epoch>-<method>-<path>.folded
+    path = re.sub(r'[^A-Za-z0-9]+', '_', request.path).strip('_') or 'root'
+    return f'{time.time_ns()}-{request.method}-{path}.folded'
@@ -0,0 +1,36 @@
+'''
+    Cache Routes - with Swagger Namespace
+'''
+
+from flask_restx import Namespace, Resource, fields
+from app.routes.caching import list_cache
+cache_ns = Namespace('cache', description='Operations related to the list response cache') # Create RESTX Namespace
+##############################################################################################################
+
+
+
+# === Output Model for the Cache Counters === #
+cache_stats_model = cache_ns.model('CacheStats', {
+    'hits': fields.Integer(description='Lists served from the cache'),
+    'misses': fields.Integer(description='Lists built from the store'),
+    'evictions': fields.Integer(description='Entries dropped to stay under max_entries'),
+    'expirations': fields.Integer(description='Entries dropped for outliving the TTL'),
+    'invalidations': fields.Integer(description='Entries dropped because their collection changed'),
+    'entries': fields.Integer(description='Entries cached right now'),
+    'max_entries': fields.Integer(),
+    'ttl': fields.Float(description='Seconds an entry lives'),
+})
+
+
+
+@cache_ns.route('/stats')
+class CacheStats(Resource):
+
+
+    # GET /cache/stats (counters for tuning the list cache)
+    @cache_ns.response(200, 'Success', cache_stats_model)
+    def get(self):
+        '''
+        Get the list cache's hit, miss, eviction, expiration and invalidation counters
+        '''
+        return list_cache.stats(), 200
@@ -0,0 +1,69 @@
+'''
+    Response caching for the list endpoints, shared by the cookie and order routes
+'''
+from functools import wraps
+from flask import request
+from app.services.response_cache import ResponseCache
+from app.routes.serialization import EncodedJson
+
+
+MAX_CACHED_ITEMS = 1000     # Longer lists aren't cached, so one unpaginated listing can't hog the memory
+
+list_cache = ResponseCache()    # Sized by create_app from LIST_CACHE_SIZE and LIST_CACHE_TTL
+
+
+def query_key():
+    '''
+        The request's query arguments, normalized so the same query in any argument order shares an entry
+    '''
+    return tuple(sorted((name, tuple(values)) for name, values in request.args.lists()))
+
+
+
+def cached_list(namespace, get_store):
+    '''
+        Decorate a list endpoint so its 200 responses are cached per normalized query. An entry is only
+        served while the store's collection tag is the one it was built under, so any write (from any
+        endpoint or worker) is seen on the next request. Put it above marshal_with, so hits skip marshalling.
+        An encoded list (see serialization.encoded_list) is cached as the encoded text.
+    '''
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            # Read before the data is, so an entry is never tagged newer than what's in it
+            tag = get_store().collection_tag()
+            key = query_key()
+
+            response = list_cache.get(namespace, key, tag)
+            if response is not None:
+                return response
+
+            response = f(*args, **kwargs)
+            if isinstance(response, tuple) and response[1] == 200 and record_count(response[0]) <= MAX_CACHED_ITEMS:
+                list_cache.put(namespace, key, tag, response)
+            return response
+        return wrapper
+    return decorator
+
+
+
+def record_count(data):
+    return data.records if isinstance(data, EncodedJson) else len(data)
+
+
+
+def invalidates(*namespaces):
+    '''
+        Decorate a write endpoint so a successful write drops the cached lists of the given namespaces
+        straight away (the tag check would skip them anyway, this frees them sooner)
+    '''
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            response = f(*args, **kwargs)
+            status = response[1] if isinstance(response, tuple) else getattr(response, 'status_code', 200)
+            if status < 400:
+                list_cache.invalidate(*namespaces)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,69 @@
+'''
+    ETag / conditional request helpers shared by the cookie and order endpoints
+'''
+from functools import wraps
+from flask import Response, request
+from werkzeug.http import quote_etag
+from app.store.base import VersionConflict
+
+
+def not_modified(tag):
+    '''
+        The 304 response for a matching If-None-Match, carrying the ETag again
+    '''
+    return Response(status=304, headers=etag_header(tag))
+
+
+
+def is_fresh(tag):
+    '''
+        Whether the request's If-None-Match already names this tag (so the client's copy is current)
+    '''
+    return request.if_none_match.contains_weak(tag)
+
+
+
+def expected_version(store, record):
+    '''
+        Read the request's If-Match header for a write to a stored record. Returns the version the store
+        must still find when it writes, or None if there is nothing to check (no header, or *).
+        Raises VersionConflict if the header doesn't name the record's current version.
+    '''
+    if not request.if_match or request.if_match.star_tag:
+        return None
+    if not request.if_match.contains(store.record_tag(record)):
+        raise VersionConflict(record.id, record.version)
+    return record.version
+
+
+
+def etag_header(tag):
+    '''
+        Response headers carrying a tag as a strong ETag
+    '''
+    return {'ETag': quote_etag(tag)}
+
+
+
+def conditional_list(get_store):
+    '''
+        Decorate a list endpoint so it answers If-None-Match from the store's collection tag: a 304 straight
+        away if nothing has changed, without querying or serializing, and an ETag on every 200 otherwise.
+        get_store is called per request, since the store can be swapped for another backend.
+        Put it above marshal_with, so a 304 skips marshalling.
+    '''
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            # Read before the data is, so the tag is never newer than what goes into the response
+            tag = get_store().collection_tag()
+            if is_fresh(tag):
+                return not_modified(tag)
+
+            result = f(*args, **kwargs)
+            if isinstance(result, tuple) and result[1] == 200:
+                data, code, headers = (result + ({},))[:3]
+                return data, code, dict(headers, **etag_header(tag))
+            return result
+        return wrapper
+    return decorator
@@ -1,10 +1,21 @@
 '''
     Cookie Routes - with Swagger Namespace
 '''
-
+import io
 from flask import Blueprint, jsonify, request
-from flask_restx import Namespace, Resource, fields
+from flask_restx import Namespace, Resource, fields, inputs
+from werkzeug.datastructures import FileStorage
 from app.models.cookie import Cookie
+from app.services.catalog_import import IMPORT_FORMATS, detect_format, import_cookies
+from app.services.pricing import CatalogPricing
+from app.services.validation import compile_model, validates
+from app.store.base import VersionConflict
+from app.store.cookie_store import CookieStore, SORT_KEYS
+from app.routes.pagination import paginate, keyset_page, encode_cursor, decode_cursor
+from app.routes.export import ndjson_response, ndjson_negotiable
+from app.routes.conditional import conditional_list, etag_header, expected_version, is_fresh, not_modified
+from app.routes.caching import cached_list, invalidates
+from app.routes.serialization import encoded_list, encoded_record, sends_encoded_json
 cookie_routes = Blueprint('cookie_routes', __name__) # Create Blueprint
 cookie_ns = Namespace('cookies', description='Operations related to cookies') # Create RESTX Namespace
 ##############################################################################################################
@@ -13,15 +24,18 @@ cookie_ns = Namespace('cookies', description='Operations related to cookies') #
 
 # In-memory storage for demo 
 # ----------------------------------------------------------------- ##
-cookies = {}    # Maps Cookie IDs to Cookie objects
+cookies = CookieStore()    # Maps Cookie IDs to Cookie objects
 
 # Init some mock data to the storage
 cookie_1 = Cookie("Chocolate Chip", "A regular chocolate chip cookie", 2.99, 100)
 cookie_2 = Cookie("Sugar Cookie", "A regular sugar cookie", 1.50, 1000)
 
 
-cookies[cookie_1.id] = cookie_1
-cookies[cookie_2.id] = cookie_2
+cookies.add(cookie_1)
+cookies.add(cookie_2)
+
+# Pricing service the order model uses to look up cookie prices
+catalog_pricing = CatalogPricing(cookies)
 # ----------------------------------------------------------------- ##
 
 
@@ -57,6 +71,10 @@ cookie_patch_model = cookie_ns.model('CookiePatch', {
     'inventory_count': fields.Integer(description=inventory_description, example=inventory_example),
 })
 
+# === Validators for the input models, compiled once (see app/services/validation.py) === #
+cookie_input_validator = compile_model(cookie_input_model)
+cookie_patch_validator = compile_model(cookie_patch_model)
+
 # === Output Model for Cookie === #
 cookie_output_model = cookie_ns.model('OutputCookie', {
     'id': fields.Integer(required=True, description='ID of the cookie'),
@@ -66,10 +84,145 @@ cookie_output_model = cookie_ns.model('OutputCookie', {
     'inventory_count': fields.Integer(required=True, description=inventory_description, example=inventory_example),
 })
 
+# === Models for the Batch Endpoint === #
+batch_op_enum = ['create', 'patch', 'delete']
+
+cookie_batch_operation_model = cookie_ns.model('CookieBatchOperation', {
+    'op': fields.String(required=True, description='What to do', enum=batch_op_enum, example='create'),
+    'id': fields.Integer(description='ID of the cookie to patch or delete'),
+    'cookie': fields.Raw(
+        description='Cookie fields: all of them for a create, just the ones to change for a patch',
+        example={'name': name_example, 'description': description_example, 'price': price_example, 'inventory_count': inventory_example}
+    ),
+})
+
+cookie_batch_model = cookie_ns.model('CookieBatch', {
+    'atomic': fields.Boolean(default=False, description='Apply every operation or none of them'),
+    'operations': fields.List(fields.Nested(cookie_batch_operation_model), required=True),
+})
+
+cookie_batch_result_model = cookie_ns.model('CookieBatchResult', {
+    'index': fields.Integer(description='Position of the operation in the request'),
+    'op': fields.String(enum=batch_op_enum),
+    'status': fields.Integer(description='HTTP status the operation would have had on its own (424 = not applied, the batch failed)'),
+    'id': fields.Integer(description='ID of the cookie'),
+    'cookie': fields.Nested(cookie_output_model, allow_null=True, description='The cookie after a create or patch'),
+    'message': fields.String(description='Why the operation failed'),
+})
+
+cookie_batch_output_model = cookie_ns.model('CookieBatchOutput', {
+    'atomic': fields.Boolean(),
+    'applied': fields.Integer(description='Number of operations applied'),
+    'failed': fields.Integer(description='Number of operations that failed'),
+    'results': fields.List(fields.Nested(cookie_batch_result_model)),
+})
+
+# === Models for the Import Endpoint === #
+cookie_import_parser = cookie_ns.parser()
+cookie_import_parser.add_argument('file', location='files', type=FileStorage, help='CSV (with a name,description,price,inventory_count header) or NDJSON file. Or send the file as the raw request body')
+cookie_import_parser.add_argument('format', location='args', choices=IMPORT_FORMATS, help='File format (default: from the file name or Content-Type)')
+
+cookie_import_error_model = cookie_ns.model('CookieImportError', {
+    'line': fields.Integer(description='Line of the file the bad row is on'),
+    'message': fields.String(description='Why the row was skipped'),
+})
+
+cookie_import_output_model = cookie_ns.model('CookieImportOutput', {
+    'format': fields.String(enum=list(IMPORT_FORMATS)),
+    'rows': fields.Integer(description='Rows read'),
+    'imported': fields.Integer(description='Cookies added'),
+    'failed': fields.Integer(description='Rows skipped as invalid'),
+    'errors': fields.List(fields.Nested(cookie_import_error_model), description='The first of the skipped rows'),
+    'seconds': fields.Float(),
+    'rows_per_second': fields.Float(),
+})
+
 # ----------------------------------------------------------------- ##
 
 
 
+# Batch Operations
+# ----------------------------------------------------------------- ##
+
+COOKIE_FIELDS = ('name', 'description', 'price', 'inventory_count')
+BATCH_MAX_OPERATIONS = 10000    # Per request
+
+
+def parse_batch_operation(operation, deleted_ids):
+    '''
+        Validate one operation from a batch request, with the same rules as the Cookie constructor (create)
+        and setters (patch), and turn it into what the store's apply_batch takes.
+        Raises ValueError if it's invalid, or KeyError if the cookie to patch or delete doesn't exist.
+        deleted_ids collects the IDs deleted earlier in the same batch.
+    '''
+    if not isinstance(operation, dict):
+        raise ValueError('Each operation must be an object.')
+
+    kind = operation.get('op')
+    if kind not in batch_op_enum:
+        raise ValueError(f"op must be one of {', '.join(batch_op_enum)}, got {kind}.")
+
+    fields_given = operation.get('cookie')
+    if kind != 'delete':
+        if not isinstance(fields_given, dict) or not fields_given:
+            raise ValueError(f"A {kind} needs a 'cookie' object with the cookie's fields.")
+        unknown = [field for field in fields_given if field not in COOKIE_FIELDS]
+        if unknown:
+            raise ValueError(f"Unknown cookie field(s): {', '.join(map(str, unknown))}.")
+
+    if kind == 'create':
+        return ('create', Cookie(**{field: fields_given.get(field) for field in COOKIE_FIELDS}))
+
+
+    id = operation.get('id')
+    if not isinstance(id, int) or isinstance(id, bool):
+        raise ValueError(f"A {kind} needs the integer 'id' of the cookie.")
+    if id in deleted_ids or id not in cookies:
+        raise KeyError(id)
+
+    if kind == 'delete':
+        deleted_ids.add(id)
+        return ('delete', id)
+
+    # Run each given field through its setter on a scratch cookie, which also normalizes it (e.g. rounds the price)
+    scratch = Cookie.from_storage(id, None, None, None, None)
+    for field, value in fields_given.items():
+        getattr(scratch, f'set_{field}')(value)
+
+    # The patch is applied with Cookie.update_cookie, which skips empty strings, so refuse them here (as the constructor does)
+    if 'description' in fields_given and not scratch.description:
+        raise ValueError("Cookie description cannot be empty.")
+
+    return ('patch', id, {field: getattr(scratch, field) for field in fields_given})
+
+# ----------------------------------------------------------------- ##
+
+
+
+def cookie_filter_args():
+    '''
+        Read the filter and sort query arguments shared by the cookie listing and export
+    '''
+    return {
+        'name_search': request.args.get('name_search', type=str),
+        'min_price': request.args.get('min_price', type=float),
+        'max_price': request.args.get('max_price', type=float),
+        'sort': request.args.get('sort', default='id', type=str),
+    }
+
+
+def export_cookies():
+    '''
+        Stream every cookie matching the request's filters as NDJSON
+    '''
+    try:
+        matching_cookies = cookies.query(**cookie_filter_args())
+    except ValueError as e:
+        return {'message': str(e)}, 400
+    return ndjson_response(matching_cookies)
+
+
+
 @cookie_ns.route('/')
 class CookieList(Resource):
 
@@ -79,37 +232,70 @@ class CookieList(Resource):
     @cookie_ns.param('name_search', "Filter by order name.")
     @cookie_ns.param('min_price', 'Filter by minimum price (float)', type='float')
     @cookie_ns.param('max_price', 'Filter by maximum price (float)', type='float')
+    @cookie_ns.param('sort', f"Sort by one of: {', '.join(SORT_KEYS)}. Prefix with '-' for descending (e.g. -price)")
     @cookie_ns.param('page', 'Page number (starting from 1)', type='int')
     @cookie_ns.param('per_page', 'Number of cookies per page', type='int')
+    @cookie_ns.param('cursor', 'Keyset pagination: pass empty for the first page, then the X-Next-Cursor header of the previous page. Replaces page')
+    @cookie_ns.param('include_total', 'Also count every match and return it in the X-Total-Count header (bool)', type='boolean')
+    @cookie_ns.response(304, 'Not modified since the ETag in If-None-Match')
     @cookie_ns.response(400, 'Invalid input data')
+    @sends_encoded_json     # Above the rest, which pass the encoded list along as data
+    @ndjson_negotiable(export_cookies)
+    @conditional_list(lambda: cookies)
+    @cached_list('cookies', lambda: cookies)
     def get(self):
         '''
-        Get all cookies in the shop, optionally filtered by name
+        Get all cookies in the shop, optionally filtered by name.
+        With Accept: application/x-ndjson every match is streamed instead, one per line (like /export, so unpaginated).
+        Sends an ETag that changes with any cookie, so polling with If-None-Match gets a 304 until something does.
         '''
 
         # Get filter parameters or None
-        name_search = request.args.get('name_search', type=str)
-        min_price = request.args.get('min_price', type=float)
-        max_price = request.args.get('max_price', type=float)
+        filters = cookie_filter_args()
+        sort = filters['sort']
 
         # Pagination
         page = request.args.get('page', default=1, type=int)
         per_page = request.args.get('per_page', default=10, type=int)
+        include_total = request.args.get('include_total', default=False, type=inputs.boolean)
+        cursor = request.args.get('cursor', type=str)
+
+
+        # Keyset pagination: resume just past the last cookie of the previous page
+        after = None
+        if cursor:
+            try:
+                position = decode_cursor(cursor)
+                if position.get('sort') != sort:
+                    raise ValueError('Cursor was made for a different sort order.')
+                after = (position['key'], position['id'])
+
+                # The key must be comparable with the index it will be looked up in
+                key_type = str if sort.lstrip('-') == 'name' else (int, float)
+                if not isinstance(after[0], key_type) or not isinstance(after[1], int):
+                    raise ValueError('Cursor position is malformed.')
+            except (ValueError, KeyError) as e:
+                return {'message': f'Invalid cursor: {e}'}, 400
 
 
-        filtered_cookies = []
-        for cookie in cookies.values():
+        # Name search, price ranges and sorting are answered by the store's indexes
+        try:
+            matching_cookies = cookies.query(**filters, after=after)
+        except ValueError as e:
+            return {'message': str(e)}, 400
+
+
+        if cursor is not None:
+            if per_page < 1:
+                return {'message': 'per_page must be a positive integer'}, 400
 
-            # Only apply filter if it was provided
-            if name_search and name_search.lower() not in cookie.name.lower():
-                continue
-            if min_price is not None and cookie.price < min_price:
-                continue
-            if max_price is not None and cookie.price > max_price:
-                continue
+            def cursor_of(cookie):
+                key, id = cookies.cursor_key(cookie.id, sort)
+                return encode_cursor({'sort': sort, 'key': key, 'id': id})
 
-            # Add cookie if it passes all the filter
-            filtered_cookies.append(cookie.to_dict())
+            page_cookies, next_cursor = keyset_page(matching_cookies, per_page, cursor_of)
+            headers = {'X-Next-Cursor': next_cursor} if next_cursor else {}
+            return encoded_list(page_cookies), 200, headers
 
 
         # Apply pagination
@@ -120,20 +306,28 @@ class CookieList(Resource):
             start = (page - 1) * per_page # idx of start cookie
             end = start + per_page # idx of end cookie
 
-            # Build the requested page
-            paginated_cookies = filtered_cookies[start:end]
-            return paginated_cookies, 200
-
         # No pagination if not requested
         else:
-            return filtered_cookies, 200
+            start, end = 0, None
+
+
+        # Build the requested page. Only the cookies on the page get serialized (or reuse their cached encoding)
+        page_cookies, total = paginate(matching_cookies, start, end, include_total)
+        paginated_cookies = encoded_list(page_cookies)
+
+        if include_total:
+            return paginated_cookies, 200, {'X-Total-Count': str(total)}
+        return paginated_cookies, 200
     
     
 
     # POST /cookies (add a new cookie)
-    @cookie_ns.expect(cookie_input_model, validate=True)
-    @cookie_ns.marshal_with(cookie_output_model, code=201)
+    @cookie_ns.expect(cookie_input_model)
+    @cookie_ns.response(201, 'Created', cookie_output_model)
     @cookie_ns.response(400, 'Invalid input data')
+    @validates(cookie_input_validator)     # Same 400s as validate=True, without running jsonschema
+    @sends_encoded_json
+    @invalidates('cookies')
     def post(self):
         '''
         Add a new cookie to the shop
@@ -158,10 +352,169 @@ class CookieList(Resource):
             return {'message': str(e)}, 400  # Return the validation error from the Cookie constructor
 
         # Add the new cookie
-        cookies[new_cookie.id] = new_cookie
+        cookies.add(new_cookie)
+        catalog_pricing.price_changed(new_cookie.id)
 
         # Return the newly added cookie
-        return new_cookie.to_dict(), 201
+        return encoded_record(new_cookie), 201
+
+
+
+@cookie_ns.route('/export')
+class CookieExport(Resource):
+
+
+    # GET /cookies/export (stream every matching cookie as NDJSON)
+    @cookie_ns.produces(['application/x-ndjson'])
+    @cookie_ns.param('name_search', "Filter by order name.")
+    @cookie_ns.param('min_price', 'Filter by minimum price (float)', type='float')
+    @cookie_ns.param('max_price', 'Filter by maximum price (float)', type='float')
+    @cookie_ns.param('sort', f"Sort by one of: {', '.join(SORT_KEYS)}. Prefix with '-' for descending (e.g. -price)")
+    @cookie_ns.response(200, 'One cookie (as JSON) per line', cookie_output_model)
+    @cookie_ns.response(400, 'Invalid input data')
+    def get(self):
+        '''
+        Stream every cookie matching the filters as NDJSON, without building the whole list in memory
+        '''
+        return export_cookies()
+
+
+
+# Content-Types an import body can be sent as, by format
+import_mimetypes = {
+    'text/csv': 'csv',
+    'application/x-ndjson': 'ndjson',
+    'application/jsonl': 'ndjson',
+}
+
+
+@cookie_ns.route('/import')
+class CookieImport(Resource):
+
+
+    # POST /cookies/import (add every valid cookie from an uploaded CSV or NDJSON file)
+    @cookie_ns.expect(cookie_import_parser)
+    @cookie_ns.response(200, 'Import report', cookie_import_output_model)
+    @cookie_ns.response(400, 'Missing file, unknown format or bad CSV header (nothing imported)')
+    @invalidates('cookies')
+    def post(self):
+        '''
+        Import cookies from a CSV or NDJSON file, sent as a multipart 'file' upload or as the raw body.
+        The file is streamed and added in batches. Invalid rows are skipped and listed in the report.
+        '''
+
+        upload = request.files.get('file')
+        if upload is not None:
+            stream, file_format = upload.stream, detect_format(upload.filename) or import_mimetypes.get(upload.mimetype)
+        else:
+            stream, file_format = request.stream, import_mimetypes.get(request.mimetype)
+
+        file_format = request.args.get('format', default=file_format, type=str)
+        if file_format is None:
+            return {'message': f"Can't tell the file's format, pass format ({', '.join(IMPORT_FORMATS)})"}, 400
+
+
+        # Decode as it's read, so the file is never held in memory whole
+        text = io.TextIOWrapper(stream, encoding='utf-8', newline='')
+        try:
+            report = import_cookies(text, cookies, file_format)
+        except ValueError as e:
+            return {'message': str(e)}, 400
+        finally:
+            text.detach()   # Leave closing the request's stream to Flask
+
+        return report, 200
+
+
+
+@cookie_ns.route(':batch')
+class CookieBatch(Resource):
+
+
+    # POST /cookies:batch (create, patch and delete many cookies in one request)
+    @cookie_ns.expect(cookie_batch_model)   # Validated in one pass below, not per item by RESTX
+    @cookie_ns.response(200, 'Per-operation results', cookie_batch_output_model)
+    @cookie_ns.response(400, 'Invalid input data (in atomic mode: some operation was invalid, and none were applied)')
+    @cookie_ns.response(409, 'Atomic batch not applied: a cookie was deleted while it was being applied')
+    @invalidates('cookies', 'orders')   # Price changes and deletes move order totals
+    def post(self):
+        '''
+        Create, patch and delete many cookies in one request. Every operation is validated first,
+        then the valid ones are applied as a single store write. With atomic set, one bad operation
+        means none are applied.
+        '''
+
+        # Get data from the request body
+        data = request.get_json()
+        if not isinstance(data, dict):
+            return {'message': 'Invalid or missing JSON in request body'}, 400
+
+        atomic = data.get('atomic', False)
+        operations = data.get('operations')
+        if not isinstance(atomic, bool):
+            return {'message': 'atomic must be true or false'}, 400
+        if not isinstance(operations, list) or not operations:
+            return {'message': 'operations must be a non-empty list'}, 400
+        if len(operations) > BATCH_MAX_OPERATIONS:
+            return {'message': f'A batch can hold at most {BATCH_MAX_OPERATIONS} operations, got {len(operations)}'}, 400
+
+
+        # Validate everything in one pass, keeping each operation's slot in the results
+        results = [None] * len(operations)
+        valid = []  # (index, operation for the store)
+        deleted_ids = set()
+
+        for index, operation in enumerate(operations):
+            kind = operation.get('op') if isinstance(operation, dict) else None
+            try:
+                valid.append((index, parse_batch_operation(operation, deleted_ids)))
+            except KeyError as e:
+                results[index] = {'index': index, 'op': kind, 'status': 404, 'message': f'Cookie with ID {e.args[0]} not found.'}
+            except ValueError as e:
+                results[index] = {'index': index, 'op': kind, 'status': 400, 'message': str(e)}
+
+        failed = len(operations) - len(valid)
+
+
+        def not_applied():
+            for index, operation in valid:
+                results[index] = {'index': index, 'op': operation[0], 'status': 424, 'message': 'Not applied, the batch failed.'}
+            return {'atomic': atomic, 'applied': 0, 'failed': failed, 'results': results}
+
+        if atomic and failed:
+            return not_applied(), 400
+
+
+        # Apply the valid operations as one store write
+        try:
+            applied = cookies.apply_batch([operation for _, operation in valid], atomic=atomic)
+        except KeyError as e:
+            failed += 1
+            return dict(not_applied(), message=f'Cookie with ID {e.args[0]} not found.'), 409
+
+
+        repriced_ids = set()
+        for (index, operation), result in zip(valid, applied):
+            kind = operation[0]
+            if isinstance(result, KeyError):
+                failed += 1
+                results[index] = {'index': index, 'op': kind, 'status': 404, 'message': f'Cookie with ID {operation[1]} not found.'}
+            elif isinstance(result, ValueError):
+                failed += 1
+                results[index] = {'index': index, 'op': kind, 'status': 400, 'message': str(result)}
+            elif kind == 'delete':
+                results[index] = {'index': index, 'op': kind, 'status': 204, 'id': result}
+                repriced_ids.add(result)
+            else:
+                results[index] = {'index': index, 'op': kind, 'status': 201 if kind == 'create' else 200, 'id': result.id, 'cookie': result.to_dict()}
+                if kind == 'create' or 'price' in operation[2]:
+                    repriced_ids.add(result.id)
+
+        # Refresh totals of the orders that contain the changed cookies
+        for id in repriced_ids:
+            catalog_pricing.price_changed(id)
+
+        return {'atomic': atomic, 'applied': len(operations) - failed, 'failed': failed, 'results': results}, 200
 
 
 
@@ -172,30 +525,40 @@ class CookieByID(Resource):
 
     # GET /cookies/<int:id>     (get specific cookie by id)
     @cookie_ns.response(200, 'Success', cookie_output_model)
+    @cookie_ns.response(304, 'Not modified since the ETag in If-None-Match')
     @cookie_ns.response(404, 'Cookie not found')
+    @sends_encoded_json
     def get(self, id):
         '''
-        Get a single cookie by its ID
+        Get a single cookie by its ID. Sends an ETag, and a 304 if If-None-Match already has it.
         '''
 
-        if id in cookies:
-            return cookies[id].to_dict(), 200
-
-        else:
+        cookie = cookies.get(id)
+        if cookie is None:
             return {'message': f'Cookie with ID {id} not found'}, 404
 
+        tag = cookies.record_tag(cookie)
+        if is_fresh(tag):
+            return not_modified(tag)
+
+        return encoded_record(cookie), 200, etag_header(tag)
+
 
 
 
 
     # PATCH /cookies/<int:id>    (partial (or fully) update a cookie)
-    @cookie_ns.expect(cookie_patch_model, validate=True)
+    @cookie_ns.expect(cookie_patch_model)
     @cookie_ns.response(200, 'Success', cookie_output_model)
     @cookie_ns.response(400, 'Invalid input data')
     @cookie_ns.response(404, 'Cookie not found')
+    @cookie_ns.response(412, 'The cookie has changed since the ETag in If-Match')
+    @validates(cookie_patch_validator)
+    @sends_encoded_json
+    @invalidates('cookies', 'orders')
     def patch(self, id):
         '''
-        Update a cookie by its ID
+        Update a cookie by its ID. With If-Match, only if it's still at that ETag.
         '''
 
         # Get data from the request body
@@ -212,12 +575,22 @@ class CookieByID(Resource):
             price = data.get('price')
             inventory_count = data.get('inventory_count')
 
-            # Update the cookie's details
-            updated = cookies[id].update_cookie(name, description, price, inventory_count)
+            # Update the cookie's details (only if it's still the version the client saw, when If-Match is sent)
+            try:
+                updated = cookies.update_cookie(id, name, description, price, inventory_count, expected_version(cookies, cookies[id]))
+            except VersionConflict as e:
+                return {'message': str(e)}, 412
+            except KeyError:
+                return {'message': f'Cookie with ID {id} not found.'}, 404
+
+            # Refresh totals of the orders that contain this cookie
+            if price is not None:
+                catalog_pricing.price_changed(id)
 
             # Return updated cookie
             if updated:
-                return cookies[id].to_dict(), 200
+                cookie = cookies[id]
+                return encoded_record(cookie), 200, etag_header(cookies.record_tag(cookie))
             else:
                 return {'message': 'Invalid or missing JSON in request body'}, 400
 
@@ -233,6 +606,7 @@ class CookieByID(Resource):
     # DELETE /cookies/<int:id>      (delete a specific cookie by its ID)
     @cookie_ns.response(204, 'Cookie deleted successfully')
     @cookie_ns.response(404, 'Cookie not found')
+    @invalidates('cookies', 'orders')
     def delete(self, id):
         '''
         Delete a cookie by its ID
@@ -240,7 +614,8 @@ class CookieByID(Resource):
 
         # See if the cookie exists 
         if id in cookies:
-            del cookies[id]
+            cookies.remove(id)
+            catalog_pricing.price_changed(id)
 
             # Return a 204 No Content response on success
             return '', 204
@@ -0,0 +1,56 @@
+'''
+    Streaming NDJSON (one JSON object per line) responses shared by the list endpoints
+'''
+from functools import wraps
+from flask import Response, request
+
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+STREAM_CHUNK_SIZE = 64 * 1024   # Bytes of NDJSON gathered before handing a chunk to the server
+
+
+def wants_ndjson():
+    '''
+        Whether the request's Accept header prefers NDJSON over plain JSON
+    '''
+    return request.accept_mimetypes.best_match(['application/json', NDJSON_MIMETYPE]) == NDJSON_MIMETYPE
+
+
+
+def ndjson_response(records):
+    '''
+        Stream an iterator of records (anything with to_json()) as NDJSON. Each record's cached encoding is
+        written as the client reads, so memory stays flat however many there are, and the lines are the same
+        bytes the other endpoints send.
+    '''
+    def generate():
+        lines = []
+        size = 0
+        for record in records:
+            line = record.to_json() + '\n'
+            lines.append(line)
+            size += len(line)
+            if size >= STREAM_CHUNK_SIZE:
+                yield ''.join(lines)
+                lines = []
+                size = 0
+        if lines:
+            yield ''.join(lines)
+
+    return Response(generate(), mimetype=NDJSON_MIMETYPE)
+
+
+
+def ndjson_negotiable(export):
+    '''
+        Decorate a list endpoint so a client that asks for NDJSON gets export() streamed back instead.
+        Put it above marshal_with, so the streamed response skips marshalling.
+    '''
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            if wants_ndjson():
+                return export()
+            return f(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -6,6 +6,16 @@ from flask import Blueprint, request
 from flask_restx import Namespace, Resource, fields
 from datetime import datetime
 from app.models.order import Order
+from app.routes import cookie_routes as cookie_routes_module
+from app.routes.cookie_routes import catalog_pricing
+from app.services.validation import compile_model, validates
+from app.store.base import InventoryError, VersionConflict
+from app.store.order_store import OrderStore
+from app.routes.pagination import keyset_page, encode_cursor, decode_cursor
+from app.routes.export import ndjson_response, ndjson_negotiable
+from app.routes.conditional import conditional_list, etag_header, expected_version, is_fresh, not_modified
+from app.routes.caching import cached_list, invalidates
+from app.routes.serialization import encoded_list, encoded_record, sends_encoded_json
 order_routes = Blueprint('order_routes', __name__) # Create Blueprint
 order_ns = Namespace('orders', description='Operations related to orders') # Create RESTX Namespace
 ##############################################################################################################
@@ -14,7 +24,10 @@ order_ns = Namespace('orders', description='Operations related to orders') # Cre
 
 # In-memory storage for demo 
 # ----------------------------------------------------------------- ##
-orders = {}     # Maps Order IDs to Order Objects
+orders = OrderStore(catalog_pricing)     # Maps Order IDs to Order Objects
+
+# Keep stored order totals in step with cookie price changes
+catalog_pricing.subscribe(orders.reprice_cookie)
 
 # Init some mock data to the storage
 dt = datetime.fromisoformat('2025-01-20T15:30:00Z'.replace('Z', '+00:00'))
@@ -23,7 +36,7 @@ pending_status = getattr(Order.OrderStatus, "PENDING")
 
 order_1 = Order({1: 5, 0: 2}, dt, dt2, pending_status)
 
-orders[order_1.id] = order_1
+orders.add(order_1)     # The mock inventory counts are what's left after this order's reservation
 # ----------------------------------------------------------------- ##
 
 
@@ -45,6 +58,16 @@ status_enum = ['PENDING', 'COOKING', 'SHIPPING', 'DELIVERED', 'CANCELLED']
 status_example = 'PENDING'
 
 
+# Map to define which state can transition to which
+valid_transitions = {
+    "PENDING": ["COOKING", "CANCELLED"],
+    "COOKING": ["SHIPPING", "CANCELLED"],
+    "SHIPPING": ["DELIVERED", "CANCELLED"],
+    "DELIVERED": [],
+    "CANCELLED": []
+}
+
+
 
 # === Helper class to force input to be a dict that maps int --> int === #
 class OrderDict(fields.Raw):
@@ -103,8 +126,161 @@ order_patch_model = order_ns.model('OrderPatch', {
     'status': fields.String(description=status_description, example=status_example),
 })
 
+# === Validators for the input models, compiled once (see app/services/validation.py) === #
+order_input_validator = compile_model(order_input_model)
+order_patch_validator = compile_model(order_patch_model)
+
+# === Output Model for Order Counts per Status === #
+order_stats_model = order_ns.model('OrderStats', {
+    status_name: fields.Integer(required=True, description=f'Number of {status_name} orders', example=0)
+    for status_name in status_enum
+})
+
+# === Models for the Batch Endpoints === #
+order_batch_input_model = order_ns.model('OrderBatchInput', {
+    'orders': fields.List(fields.Nested(order_input_model), required=True),
+})
+
+order_batch_change_model = order_ns.model('OrderBatchChange', {
+    'id': fields.Integer(required=True, description='ID of the order'),
+    'status': fields.String(required=True, description=status_description, enum=status_enum, example='COOKING'),
+})
+
+order_batch_patch_model = order_ns.model('OrderBatchPatch', {
+    'changes': fields.List(fields.Nested(order_batch_change_model), required=True),
+})
+
+order_batch_result_model = order_ns.model('OrderBatchResult', {
+    'index': fields.Integer(description='Position of the item in the request'),
+    'status': fields.Integer(description='HTTP status the item would have had on its own'),
+    'id': fields.Integer(description='ID of the order'),
+    'order': fields.Nested(order_output_model, allow_null=True, description='The order after the change'),
+    'message': fields.String(description='Why the item failed'),
+})
+
+order_batch_output_model = order_ns.model('OrderBatchOutput', {
+    'applied': fields.Integer(description='Number of items applied'),
+    'failed': fields.Integer(description='Number of items that failed'),
+    'results': fields.List(fields.Nested(order_batch_result_model)),
+})
+
+# ----------------------------------------------------------------- ##
+
+
+
+# Batch Operations
 # ----------------------------------------------------------------- ##
 
+BATCH_MAX_ORDERS = 10000    # Per request
+
+
+def transition_sources(status_name):
+    '''
+        Get the statuses an order can move to the given status from, per valid_transitions
+    '''
+    return [Order.OrderStatus[name] for name, next_statuses in valid_transitions.items() if status_name in next_statuses]
+
+
+def build_order(cookies_and_quantities, deliver_date):
+    '''
+        Make a new PENDING order, placed now, from request data. Raises ValueError with the same messages as POST /orders.
+    '''
+    if not isinstance(cookies_and_quantities, dict):
+        raise ValueError('Error with cookie order: cookies_and_quantities must be a dictionary.')
+    if not isinstance(deliver_date, str):
+        raise ValueError('deliver_date must be an ISO 8601 datetime string.')
+
+    # Create valid format for Order constuctor from input JSON
+    try:
+        cookies_and_quantities_dict = {
+            int(key): value
+            for key, value in cookies_and_quantities.items()
+        }
+    except ValueError as e:
+        raise ValueError(f"Error with cookie order: {str(e)}")
+
+    try:
+        deliver_date_datetime = datetime.fromisoformat(deliver_date.replace('Z', '+00:00'))
+    except ValueError:
+        raise ValueError('deliver_date must be an ISO 8601 datetime string.')
+
+    # New order starts as PENDING, made at current time
+    try:
+        return Order(cookies_and_quantities=cookies_and_quantities_dict, order_date=datetime.now(), deliver_date=deliver_date_datetime, status=Order.OrderStatus.PENDING)
+    except ValueError as e:
+        raise ValueError(f"Error creating cookie: {str(e)}")  # The validation error from the Order constructor
+
+def sum_quantities(orders_to_sum):
+    '''
+        Add up the cookies and quantities of several orders
+    '''
+    total = {}
+    for order in orders_to_sum:
+        for cookie_id, quantity in order.cookies_and_quantities.items():
+            total[cookie_id] = total.get(cookie_id, 0) + quantity
+    return total
+
+
+def batch_response(results):
+    '''
+        Wrap per-item batch results with counts of what succeeded
+    '''
+    failed = sum(1 for result in results if result['status'] >= 400)
+    return {'applied': len(results) - failed, 'failed': failed, 'results': results}
+
+# ----------------------------------------------------------------- ##
+
+
+
+def parse_date_arg(name):
+    '''
+        Read an ISO 8601 datetime query argument, or None if it wasn't given
+    '''
+    value = request.args.get(name, type=str)
+    if not value:
+        return None
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+
+
+def order_filter_args():
+    '''
+        Read the filter query arguments shared by the order listing and export, as keyword arguments for
+        the store's query(). Returns None for an unknown status, which matches no orders.
+    '''
+    status_search = request.args.get('status', type=str)
+    min_total_amount = request.args.get('min_total_amount', type=float)
+    max_total_amount = request.args.get('max_total_amount', type=float)
+
+    # Amount bounds only apply when at least one of them is non-zero
+    if not (min_total_amount or max_total_amount):
+        min_total_amount = max_total_amount = None
+
+    # Filter by order status
+    status = None
+    if status_search:
+        status = Order.OrderStatus.__members__.get(status_search.upper())
+        if status is None:
+            return None
+
+    return {
+        'status': status,
+        'min_date': parse_date_arg('min_date'),
+        'max_date': parse_date_arg('max_date'),
+        'min_deliver_date': parse_date_arg('min_deliver_date'),
+        'max_deliver_date': parse_date_arg('max_deliver_date'),
+        'min_total_amount': min_total_amount,
+        'max_total_amount': max_total_amount,
+    }
+
+
+def export_orders():
+    '''
+        Stream every order matching the request's filters as NDJSON
+    '''
+    filters = order_filter_args()
+    return ndjson_response(iter(()) if filters is None else orders.query(**filters))
+
 
 
 @order_ns.route('/')
@@ -112,108 +288,265 @@ class OrderList(Resource):
 
 
     # GET /orders (list all orders or filter by status)
-    @order_ns.marshal_list_with(order_output_model)
+    @sends_encoded_json     # Above the rest, which pass the encoded list along as data
+    @ndjson_negotiable(export_orders)
+    @conditional_list(lambda: orders)
+    @cached_list('orders', lambda: orders)
+    @order_ns.response(200, 'Success', [order_output_model])
+    @order_ns.response(304, 'Not modified since the ETag in If-None-Match')
     @order_ns.param('status', f"Filter by order status. Options: {', '.join(status_enum)}")
     @order_ns.param('min_total_amount', 'Filter by minimum total amount (float)', type='float')
     @order_ns.param('max_total_amount', 'Filter by maximum total amount (float)', type='float')
-    @order_ns.param('min_date', 'Filter by minimum total amount (float)')
-    @order_ns.param('max_date', 'Filter by maximum total amount (float)')
+    @order_ns.param('min_date', 'Filter by earliest order date (ISO 8601)')
+    @order_ns.param('max_date', 'Filter by latest order date (ISO 8601)')
+    @order_ns.param('min_deliver_date', 'Filter by earliest delivery date (ISO 8601)')
+    @order_ns.param('max_deliver_date', 'Filter by latest delivery date (ISO 8601)')
+    @order_ns.param('cursor', 'Keyset pagination: pass empty for the first page, then the X-Next-Cursor header of the previous page')
+    @order_ns.param('per_page', 'Number of orders per page when paginating (default 10)', type='int')
     def get(self):
         '''
-        Get all orders, optionally filtered by status
+        Get all orders, optionally filtered by status.
+        With Accept: application/x-ndjson every match is streamed instead, one per line (like /export, so unpaginated).
+        Sends an ETag that changes with any order, so polling with If-None-Match gets a 304 until something does.
         '''
 
-        # Get search params
-        status_search = request.args.get('status', type=str)
-        min_total_amount = request.args.get('min_total_amount', type=float)
-        max_total_amount = request.args.get('max_total_amount', type=float)
-        min_date = request.args.get('min_date', type=str)
-        max_date = request.args.get('max_date', type=str)
-        if min_date:
-            min_date = datetime.fromisoformat(min_date.replace('Z', '+00:00'))
-        if max_date:
-            max_date = datetime.fromisoformat(max_date.replace('Z', '+00:00'))
+        # Get search params (an unknown status matches no orders)
+        filters = order_filter_args()
+        if filters is None:
+            return [], 200
 
+        # Pagination (only when asked for, otherwise every match is returned)
+        cursor = request.args.get('cursor', type=str)
+        per_page = request.args.get('per_page', type=int)
 
-        filtered_orders = []
 
-        for order in orders.values():
+        # Keyset pagination: resume just past the last order of the previous page
+        after_id = None
+        if cursor:
+            try:
+                after_id = decode_cursor(cursor).get('id')
+                if not isinstance(after_id, int):
+                    raise ValueError('Cursor position is malformed.')
+            except ValueError as e:
+                order_ns.abort(400, f'Invalid cursor: {e}')
 
-            # Filter by order status
-            if status_search and status_search.upper() != order.status.name.upper():
-                continue
 
+        # Status, date and amount filters are answered by the store's buckets and sorted indexes
+        matching_orders = orders.query(**filters, after_id=after_id)
 
-            # Filter by the order date
-            if min_date is not None and order.order_date < min_date:
-                continue
-            if max_date is not None and order.order_date > max_date:
-                continue
+        if cursor is not None or per_page is not None:
+            per_page = 10 if per_page is None else per_page
+            if per_page < 1:
+                order_ns.abort(400, 'per_page must be a positive integer')
 
+            page_orders, next_cursor = keyset_page(matching_orders, per_page, lambda order: encode_cursor({'id': order.id}))
+            headers = {'X-Next-Cursor': next_cursor} if next_cursor else {}
+            return encoded_list(page_orders), 200, headers
 
-            # Filter by price
-            if min_total_amount or max_total_amount:
+        # One pass over the matches, joining each order's cached encoding
+        return encoded_list(matching_orders), 200
 
-                total_order_amount = order.get_order_total_amount()
 
-                # Filter by the total cookie amount in the order
-                if min_total_amount is not None and total_order_amount < min_total_amount:
-                    continue
-                if max_total_amount is not None and total_order_amount > max_total_amount:
-                    continue
 
 
-            filtered_orders.append(order.to_dict()) # Add valid orders
 
-        return filtered_orders, 200
+    # POST /orders (create an order given a list of product(s))
+    @order_ns.expect(order_input_model)
+    @order_ns.response(201, 'Created', order_output_model)
+    @order_ns.response(400, 'Invalid input data, or a cookie that is not in the catalog')
+    @order_ns.response(409, 'Not enough inventory for one of the cookies')
+    @validates(order_input_validator)
+    @sends_encoded_json
+    @invalidates('orders', 'cookies')   # Reserving stock changes the cookies too
+    def post(self):
 
+        # Get data from the request body
+        data = request.get_json()
 
+        # Create a new Order instance from the request data
+        try:
+            new_order = build_order(data.get('cookies_and_quantities'), data.get('deliver_date'))
+        except ValueError as e:
+            return {'message': str(e)}, 400
+        cookies_and_quantities_dict = new_order.cookies_and_quantities
 
 
+        # Check every cookie is in the catalog and in stock, and reserve it all in one step
+        cookie_store = cookie_routes_module.cookies
+        try:
+            cookie_store.reserve_inventory(cookies_and_quantities_dict)
+        except InventoryError as e:
+            order_ns.abort(400 if e.available is None else 409, f"Error with cookie order: {str(e)}")
 
-    # POST /orders (create an order given a list of product(s))
-    @order_ns.expect(order_input_model, validate=True)
-    @order_ns.marshal_with(order_output_model, code=201)
+        # Add the new order to the list (giving the stock back if that fails)
+        try:
+            orders.add(new_order)
+        except Exception:
+            cookie_store.release_inventory(cookies_and_quantities_dict)
+            raise
+
+        # Return the newly added order (Response code 201 for successful creation)
+        return encoded_record(new_order), 201
+
+
+
+
+
+@order_ns.route('/export')
+class OrderExport(Resource):
+
+
+    # GET /orders/export (stream every matching order as NDJSON)
+    @order_ns.produces(['application/x-ndjson'])
+    @order_ns.param('status', f"Filter by order status. Options: {', '.join(status_enum)}")
+    @order_ns.param('min_total_amount', 'Filter by minimum total amount (float)', type='float')
+    @order_ns.param('max_total_amount', 'Filter by maximum total amount (float)', type='float')
+    @order_ns.param('min_date', 'Filter by earliest order date (ISO 8601)')
+    @order_ns.param('max_date', 'Filter by latest order date (ISO 8601)')
+    @order_ns.param('min_deliver_date', 'Filter by earliest delivery date (ISO 8601)')
+    @order_ns.param('max_deliver_date', 'Filter by latest delivery date (ISO 8601)')
+    @order_ns.response(200, 'One order (as JSON) per line', order_output_model)
+    def get(self):
+        '''
+        Stream every order matching the filters as NDJSON, without building the whole list in memory
+        '''
+        return export_orders()
+
+
+
+@order_ns.route(':batch')
+class OrderBatch(Resource):
+
+
+    # POST /orders:batch (create many orders in one request)
+    @order_ns.expect(order_batch_input_model)   # Validated in one pass below, not per item by RESTX
+    @order_ns.response(200, 'Per-order results', order_batch_output_model)
+    @order_ns.response(400, 'Invalid input data')
+    @invalidates('orders', 'cookies')
     def post(self):
+        '''
+        Create many orders in one request. Each order is validated like POST /orders and reserves its own
+        inventory (all or nothing per order). The ones that pass are stored in a single write.
+        '''
 
         # Get data from the request body
         data = request.get_json()
+        new_orders = data.get('orders') if isinstance(data, dict) else None
+        if not isinstance(new_orders, list) or not new_orders:
+            return {'message': 'orders must be a non-empty list'}, 400
+        if len(new_orders) > BATCH_MAX_ORDERS:
+            return {'message': f'A batch can hold at most {BATCH_MAX_ORDERS} orders, got {len(new_orders)}'}, 400
+
+
+        # Validate every order in one pass
+        results = [None] * len(new_orders)
+        valid = []  # (index, Order)
+        for index, order_data in enumerate(new_orders):
+            try:
+                if not isinstance(order_data, dict):
+                    raise ValueError('Each order must be an object.')
+                valid.append((index, build_order(order_data.get('cookies_and_quantities'), order_data.get('deliver_date'))))
+            except ValueError as e:
+                results[index] = {'index': index, 'status': 400, 'message': str(e)}
+
+
+        # Reserve inventory for all of them in one write, then store the ones that got their stock in another
+        cookie_store = cookie_routes_module.cookies
+        reservations = cookie_store.reserve_inventory_batch([order.cookies_and_quantities for _, order in valid])
+
+        reserved = []
+        for (index, order), error in zip(valid, reservations):
+            if error is None:
+                reserved.append((index, order))
+            else:
+                results[index] = {'index': index, 'status': 400 if error.available is None else 409, 'message': f"Error with cookie order: {str(error)}"}
 
-        # Extract data from request (or get None)
-        cookies_and_quantities = data.get('cookies_and_quantities')
-        deliver_date = data.get('deliver_date')
+        try:
+            orders.add_many([order for _, order in reserved])
+        except Exception:
+            cookie_store.release_inventory(sum_quantities(order for _, order in reserved))
+            raise
 
+        for index, order in reserved:
+            results[index] = {'index': index, 'status': 201, 'id': order.id, 'order': order.to_dict()}
 
-        # Create valid format for Order constuctor from input JSON
-        try:
-            cookies_and_quantities_dict = {
-                int(key): value
-                for key, value in cookies_and_quantities.items()
-            }
-        except ValueError as e:
-            return {'message': f"Error with cookie order: {str(e)}"}, 400 
+        return batch_response(results), 200
 
 
-        # TODO: make sure all of the IDs are valid by calling /cookies and checking IDs
 
-        # New order made at current time
-        deliver_date_datetime = datetime.fromisoformat(deliver_date.replace('Z', '+00:00'))
+    # PATCH /orders:batch (change the status of many orders in one request)
+    @order_ns.expect(order_batch_patch_model)   # Validated in one pass below, not per item by RESTX
+    @order_ns.response(200, 'Per-change results', order_batch_output_model)
+    @order_ns.response(400, 'Invalid input data')
+    @invalidates('orders', 'cookies')
+    def patch(self):
+        '''
+        Change the status of many orders in one request, following the same transitions as PATCH /orders/<id>.
+        The valid changes are applied in a single write, and cancelled orders give their stock back.
+        '''
 
-        # New order starts as PENDING
-        pending_status = getattr(Order.OrderStatus, "PENDING")
+        # Get data from the request body
+        data = request.get_json()
+        changes = data.get('changes') if isinstance(data, dict) else None
+        if not isinstance(changes, list) or not changes:
+            return {'message': 'changes must be a non-empty list'}, 400
+        if len(changes) > BATCH_MAX_ORDERS:
+            return {'message': f'A batch can hold at most {BATCH_MAX_ORDERS} changes, got {len(changes)}'}, 400
+
+
+        # Validate every change in one pass
+        results = [None] * len(changes)
+        valid = []  # (index, (ID, status, statuses it can come from))
+        for index, change in enumerate(changes):
+            id = change.get('id') if isinstance(change, dict) else None
+            status_given = change.get('status') if isinstance(change, dict) else None
+
+            if not isinstance(id, int) or isinstance(id, bool):
+                results[index] = {'index': index, 'status': 400, 'message': "Each change needs the integer 'id' of an order."}
+            elif not isinstance(status_given, str) or not status_given:
+                results[index] = {'index': index, 'id': id, 'status': 404, 'message': 'No status to transistion to given'}
+            elif not hasattr(Order.OrderStatus, status_given.upper()):
+                results[index] = {'index': index, 'id': id, 'status': 404, 'message': f'The given status is not valid: {status_given.upper()}'}
+            else:
+                status_given = status_given.upper()
+                valid.append((index, (id, Order.OrderStatus[status_given], transition_sources(status_given))))
 
 
-        # Create a new Order instance 
-        try:
-            new_order = Order(cookies_and_quantities=cookies_and_quantities_dict, order_date=datetime.now(), deliver_date=deliver_date_datetime, status=pending_status)
-        except ValueError as e:
-            return {'message': f"Error creating cookie: {str(e)}"}, 400  # Return the validation error from the Order constructor
+        # Apply them all in one write. The store checks each transition against the order's status at that point
+        applied = orders.set_statuses([change for _, change in valid])
 
-        # Add the new order to the list
-        orders[new_order.id] = new_order
+        cancelled = []
+        for (index, (id, status, _)), result in zip(valid, applied):
+            if isinstance(result, KeyError):
+                results[index] = {'index': index, 'id': id, 'status': 404, 'message': f'order with ID {id} not found.'}
+            elif isinstance(result, ValueError):
+                results[index] = {'index': index, 'id': id, 'status': 400, 'message': str(result)}
+            else:
+                results[index] = {'index': index, 'id': id, 'status': 200, 'order': result.to_dict()}
+                if status == Order.OrderStatus.CANCELLED:
+                    cancelled.append(result)
+
+        if cancelled:
+            cookie_routes_module.cookies.release_inventory(sum_quantities(cancelled))
+
+        return batch_response(results), 200
 
-        # Return the newly added order (Response code 201 for successful creation)
-        return new_order.to_dict(), 201
+
+
+
+
+@order_ns.route('/stats')
+class OrderStats(Resource):
+
+
+    # GET /orders/stats (count the orders in each status)
+    @order_ns.response(200, 'Success', order_stats_model)
+    def get(self):
+        '''
+        Get the number of orders in each status
+        '''
+        counts = orders.count_by_status()
+        return {status.name: count for status, count in counts.items()}, 200
 
 
 
@@ -226,40 +559,41 @@ class OrderByID(Resource):
 
     # GET /orders/<int:id>     (get specific order by id)
     @order_ns.response(200, 'Success', order_output_model)
+    @order_ns.response(304, 'Not modified since the ETag in If-None-Match')
     @order_ns.response(404, 'Order not found')
+    @sends_encoded_json
     def get(self, id):
         '''
-        Get a single order by its ID
+        Get a single order by its ID. Sends an ETag, and a 304 if If-None-Match already has it.
         '''
-        if id in orders:
-            return orders[id].to_dict(), 200
-    
-        else:
+        order = orders.get(id)
+        if order is None:
             return {'message': f'Order with ID {id} not found'}, 404
 
+        tag = orders.record_tag(order)
+        if is_fresh(tag):
+            return not_modified(tag)
+
+        return encoded_record(order), 200, etag_header(tag)
+
 
 
 
     # PATCH /orders/<int:id>    (update the status of an order)
-    @order_ns.expect(order_patch_model, validate=True)
+    @order_ns.expect(order_patch_model)
     @order_ns.response(200, 'Success', order_output_model)
     @order_ns.response(400, 'Invalid input data')
     @order_ns.response(404, 'Order not found')
+    @order_ns.response(412, 'The order has changed since the ETag in If-Match')
+    @validates(order_patch_validator)
+    @sends_encoded_json
+    @invalidates('orders', 'cookies')   # Cancelling gives stock back
     def patch(self, id):
         '''
-        Update an order's status by its ID
+        Update an order's status by its ID. Cancelling an order puts its cookies back into inventory.
+        With If-Match, only if it's still at that ETag.
         '''
 
-        # Map to define which state can transition to which
-        valid_transitions = {
-            "PENDING": ["COOKING", "CANCELLED"],
-            "COOKING": ["SHIPPING", "CANCELLED"],
-            "SHIPPING": ["DELIVERED", "CANCELLED"],
-            "DELIVERED": [],
-            "CANCELLED": []
-        }
-
-
         # Get data from the request body
         data = request.get_json()
         if data is None:
@@ -271,7 +605,8 @@ class OrderByID(Resource):
             if id in orders:
 
                 status_given = status_given.upper()
-                current_status = orders[id].status.name.upper()
+                current_order = orders[id]
+                current_status = current_order.status.name.upper()
 
                 # Make sure requested status is valid
                 if not hasattr(Order.OrderStatus, status_given):
@@ -281,11 +616,24 @@ class OrderByID(Resource):
                 if status_given not in valid_transitions.get(current_status, []):
                     return {'message': f'Cannot transition from {current_status} to {status_given}.'}, 400
 
-                # Transition status
-                orders[id].set_status(getattr(Order.OrderStatus, status_given))
+                # Transition status. The store re-checks the current status (and version, for If-Match) as it
+                # changes it, so if two requests race only one wins (and a cancelled order's stock is only released once)
+                try:
+                    orders.set_status(
+                        id, getattr(Order.OrderStatus, status_given), transition_sources(status_given),
+                        expected_version(orders, current_order)
+                    )
+                except VersionConflict as e:
+                    return {'message': str(e)}, 412
+                except ValueError as e:
+                    return {'message': str(e)}, 400
+
+                if status_given == "CANCELLED":
+                    cookie_routes_module.cookies.release_inventory(orders[id].cookies_and_quantities)
 
                 # Return updated order
-                return orders[id].to_dict(), 200
+                order = orders[id]
+                return encoded_record(order), 200, etag_header(orders.record_tag(order))
 
 
             else:
@@ -0,0 +1,67 @@
+'''
+    Pagination helpers shared by the list endpoints
+'''
+import base64
+import json
+from itertools import islice
+
+
+def paginate(items, start, end, include_total=False):
+    '''
+        Lazily take items[start:end] from an iterator (end=None for no limit).
+        Skipped items are only counted, and the iterator is left alone once the page is full
+        unless include_total asks for a count of every item. Returns (page, total or None).
+    '''
+    if not include_total:
+        return list(islice(items, start, end)), None
+
+    page_items = []
+    total = 0
+    for item in items:
+        if total >= start and (end is None or total < end):
+            page_items.append(item)
+        total += 1
+
+    return page_items, total
+
+
+
+def keyset_page(items, per_page, cursor_of):
+    '''
+        Take the next per_page items from an iterator that already starts just past the previous page.
+        Reads one extra item to see if another page follows. Returns (page, next cursor or None),
+        where the next cursor is cursor_of(last item on the page).
+    '''
+    page_items = list(islice(items, per_page + 1))
+
+    if len(page_items) > per_page:
+        page_items = page_items[:per_page]
+        return page_items, cursor_of(page_items[-1])
+
+    return page_items, None
+
+
+
+def encode_cursor(position: dict):
+    '''
+        Turn a position (a JSON-able dict) into an opaque, URL-safe cursor string
+    '''
+    raw = json.dumps(position, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+
+def decode_cursor(cursor: str):
+    '''
+        Get back the position dict from a cursor made by encode_cursor. Raises ValueError if it's malformed.
+    '''
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        position = json.loads(raw)
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor.')
+
+    if not isinstance(position, dict):
+        raise ValueError('Invalid cursor.')
+
+    return position
@@ -0,0 +1,63 @@
+'''
+    Single-pass JSON responses assembled from each record's cached encoding (see Cookie.to_json / Order.to_json),
+    shared by the cookie and order endpoints. Same bytes as marshalling to_dict() through flask-restx.
+'''
+import json
+from functools import wraps
+from flask import current_app
+from flask_restx.representations import dumps, output_json
+from flask_restx.utils import unpack
+
+
+LIST_SEPARATOR = dumps([0, 0])[2:-2]    # What the JSON encoder flask-restx uses puts between list items
+
+
+class EncodedJson(str):
+    '''
+        JSON text that's already encoded, returned by a view (under sends_encoded_json) in place of the data
+        to encode. records is the number of records in it (for the list cache's size limit).
+    '''
+    records = 1
+
+
+
+def encoded_list(records):
+    '''
+        Encode records as a JSON list by joining their cached encodings, without building or marshalling dicts
+    '''
+    fragments = [record.to_json() for record in records]
+    encoded = EncodedJson('[' + LIST_SEPARATOR.join(fragments) + ']')
+    encoded.records = len(fragments)
+    return encoded
+
+
+
+def encoded_record(record):
+    '''
+        Encode one record from its cached encoding
+    '''
+    return EncodedJson(record.to_json())
+
+
+
+def sends_encoded_json(f):
+    '''
+        Decorate a view so an EncodedJson it returns (alone or in a (data, code, headers) tuple) is sent as
+        it is, with the trailing newline flask-restx adds. Anything else (e.g. an error message) is left for
+        flask-restx to encode. Put it above the other response decorators, so theirs see the tuple.
+    '''
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        result = f(*args, **kwargs)
+        data, code, headers = unpack(result)
+        if not isinstance(data, EncodedJson):
+            return result
+
+        # Custom encoder settings (or debug mode's indenting) change the format, so re-encode with them
+        if current_app.config.get('RESTX_JSON') or current_app.debug or dumps is not json.dumps:
+            return output_json(json.loads(data), code, headers)
+
+        response = current_app.response_class(data + '\n', status=code, mimetype='application/json')
+        response.headers.extend(headers or {})
+        return response
+    return wrapper
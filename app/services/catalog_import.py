@@ -0,0 +1,172 @@
+'''
+    Catalog Import Service - streams cookies in from CSV or NDJSON supplier files
+'''
+import csv
+import json
+import math
+import os
+import time
+from app.models.cookie import Cookie
+
+
+IMPORT_FORMATS = ('csv', 'ndjson')
+IMPORT_FIELDS = ('name', 'description', 'price', 'inventory_count')  # One column / key per Cookie constructor argument
+IMPORT_BATCH_SIZE = 1000    # Valid rows gathered before they're written to the store as one batch
+MAX_REPORTED_ERRORS = 100   # Row errors kept for the report, past that they're only counted
+
+
+def detect_format(filename):
+    '''
+        Guess the import format from a file name's extension. Returns None if it isn't one we know.
+    '''
+    extension = os.path.splitext(filename or '')[1].lower()
+    if extension == '.csv':
+        return 'csv'
+    if extension in ('.ndjson', '.jsonl'):
+        return 'ndjson'
+    return None
+
+
+
+def import_cookies(
+    stream,
+    store,
+    file_format: str,
+    batch_size: int = IMPORT_BATCH_SIZE,
+    max_errors: int = MAX_REPORTED_ERRORS,
+    progress=None
+):
+    '''
+        Read cookies from a text stream (CSV with a header row, or one JSON object per line), validate each row
+        with the Cookie rules and add the valid ones to the store, batch_size at a time through apply_batch.
+        The file is read a line at a time, so memory is bounded by the batch size whatever the file size.
+
+        A bad row is recorded (up to max_errors of them, with its line number) and skipped, and the import carries on.
+        Raises ValueError before importing anything if the format is unknown or the CSV header doesn't fit.
+        progress, if given, is called with the report so far after every batch.
+
+        Returns a report: {format, rows, imported, failed, errors: [{line, message}], seconds, rows_per_second}
+    '''
+    if file_format == 'csv':
+        rows, parse_row = _read_csv(stream), _cookie_from_csv
+    elif file_format == 'ndjson':
+        rows, parse_row = _read_ndjson(stream), _cookie_from_json
+    else:
+        raise ValueError(f"format must be one of {', '.join(IMPORT_FORMATS)}, got {file_format}.")
+
+    report = {'format': file_format, 'rows': 0, 'imported': 0, 'failed': 0, 'errors': [], 'seconds': 0.0, 'rows_per_second': 0.0}
+    started = time.perf_counter()
+
+    def fail(line, message):
+        report['failed'] += 1
+        if len(report['errors']) < max_errors:
+            report['errors'].append({'line': line, 'message': message})
+
+    def flush(batch):
+        # No order can contain a cookie that didn't exist yet, so there's nothing to reprice
+        store.apply_batch([('create', cookie) for cookie in batch])
+        report['imported'] += len(batch)
+        _finish(report, started)
+        if progress is not None:
+            progress(report)
+
+    batch = []
+    line = None
+    try:
+        for line, row in rows:
+            report['rows'] += 1
+            try:
+                batch.append(parse_row(row))
+            except ValueError as e:
+                fail(line, str(e))
+                continue
+
+            if len(batch) >= batch_size:
+                flush(batch)
+                batch = []
+
+    except (csv.Error, UnicodeDecodeError) as e:
+        # The file itself is unreadable from here on, so keep what was read before it and stop
+        fail(line, f"Stopped reading the file: {e}")
+
+    if batch:
+        flush(batch)
+
+    return _finish(report, started)
+
+
+
+# Helper Methods:
+# ------------------------ #
+
+def _finish(report, started):
+    # Fill in the timing figures
+    seconds = time.perf_counter() - started
+    report['seconds'] = round(seconds, 3)
+    report['rows_per_second'] = round(report['rows'] / seconds, 1) if seconds > 0 else 0.0
+    return report
+
+
+def _read_csv(stream):
+    # Check the header, then yield (line number, {column: value}) for each row
+    reader = csv.DictReader(stream)
+    header = reader.fieldnames or []
+
+    missing = [field for field in IMPORT_FIELDS if field not in header]
+    if missing:
+        raise ValueError(f"CSV header is missing column(s): {', '.join(missing)}.")
+    unknown = [field for field in header if field not in IMPORT_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown CSV column(s): {', '.join(unknown)}.")
+
+    for row in reader:
+        yield reader.line_num, row
+
+
+def _read_ndjson(stream):
+    # Yield (line number, line) for each non-blank line
+    for line_number, line in enumerate(stream, start=1):
+        if line.strip():
+            yield line_number, line
+
+
+def _cookie_from_csv(row):
+    if None in row:     # csv puts the values past the last column under None
+        raise ValueError('Row has more values than the header has columns.')
+
+    return Cookie(
+        name=row['name'],
+        description=row['description'],
+        price=_parse_number(row['price'], float, 'Cookie price must be a non-negative number'),
+        inventory_count=_parse_number(row['inventory_count'], int, 'Cookie inventory count must be a non-negative integer'),
+    )
+
+
+def _cookie_from_json(line):
+    try:
+        record = json.loads(line, parse_constant=_reject_constant)
+    except ValueError as e:
+        raise ValueError(f"Invalid JSON: {e}.")
+
+    if not isinstance(record, dict):
+        raise ValueError('Each line must be a JSON object.')
+    unknown = [field for field in record if field not in IMPORT_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown cookie field(s): {', '.join(unknown)}.")
+
+    return Cookie(**{field: record.get(field) for field in IMPORT_FIELDS})
+
+
+def _parse_number(value, number_type, message):
+    # CSV values are all strings, so convert them before the Cookie rules see them
+    try:
+        number = number_type(value.strip())
+    except (AttributeError, ValueError):
+        raise ValueError(f"{message}, got {value!r}.")
+    if not math.isfinite(number):
+        raise ValueError(f"{message}, got {value!r}.")
+    return number
+
+
+def _reject_constant(name):
+    raise ValueError(f"{name} is not a valid number")  # json.loads accepts NaN and Infinity by default
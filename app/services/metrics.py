@@ -0,0 +1,185 @@
+'''
+    Metrics Service - fixed-bucket histograms and counters, rendered in the Prometheus text format
+'''
+import threading
+import time
+from bisect import bisect_left
+from functools import wraps
+
+
+# Upper bounds (le) of the histogram buckets, per unit
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)     # Seconds
+SIZE_BUCKETS = (100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000)   # Bytes
+
+
+class Counter:
+
+    def __init__(self):
+
+        '''
+            Constructor for a counter starting at zero
+        '''
+
+        self.value = 0
+        self._lock = threading.Lock()   # Only held for the add itself
+
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+
+class Histogram:
+
+    def __init__(self, buckets):
+
+        '''
+            Constructor for a histogram with fixed, ascending bucket bounds (plus the +Inf bucket)
+        '''
+
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)    # Per bucket, not cumulative. The last is +Inf
+        self._sum = 0.0
+        self._lock = threading.Lock()   # Only held for the two adds
+
+
+    def observe(self, value):
+        '''
+            Count a value in the first bucket whose bound is >= it
+        '''
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+
+
+    def snapshot(self):
+        '''
+            Get (cumulative count per bucket bound, with +Inf last, sum of the values)
+        '''
+        with self._lock:
+            counts, total = list(self._counts), self._sum
+
+        cumulative, running = [], 0
+        for count in counts:
+            running += count
+            cumulative.append(running)
+        return cumulative, total
+
+
+
+class MetricsRegistry:
+
+    def __init__(self):
+
+        '''
+            Constructor for an empty registry. Metrics are made on first use, one per name and label set.
+        '''
+
+        self._metrics = {}  # Maps (name, labels) to a Counter or Histogram. labels is a tuple of (label, value) pairs
+        self._help = {}     # Maps names to (type, help text)
+        self._collectors = []   # Callbacks returning extra (name, type, help, [(labels, value)]) samples at render time
+        self._lock = threading.Lock()   # Only taken to add a new metric
+
+
+    def describe(self, name, metric_type, help_text):
+        '''
+            Set the TYPE and HELP lines for a metric name
+        '''
+        self._help[name] = (metric_type, help_text)
+
+
+    def counter(self, name, **labels):
+        return self._get(name, labels, Counter)
+
+
+    def histogram(self, name, buckets=LATENCY_BUCKETS, **labels):
+        return self._get(name, labels, lambda: Histogram(buckets))
+
+
+    def add_collector(self, collect):
+        '''
+            Register a callback for values that are read rather than counted (e.g. a cache's own counters)
+        '''
+        self._collectors.append(collect)
+
+
+    def timed(self, name, **labels):
+        '''
+            Decorate a function so every call's duration is observed in the named latency histogram
+        '''
+        histogram = self.histogram(name, **labels)
+
+        def decorator(f):
+            @wraps(f)
+            def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return f(*args, **kwargs)
+                finally:
+                    histogram.observe(time.perf_counter() - started)
+            return wrapper
+        return decorator
+
+
+    def render(self):
+        '''
+            Get every metric in the Prometheus text exposition format
+        '''
+        by_name = {}
+        for (name, labels), metric in list(self._metrics.items()):
+            by_name.setdefault(name, []).append((labels, metric))
+
+        lines = []
+        for name in sorted(by_name):
+            metric_type, help_text = self._help.get(name, (None, None))
+            if help_text:
+                lines.append(f'# HELP {name} {help_text}')
+            if metric_type:
+                lines.append(f'# TYPE {name} {metric_type}')
+
+            for labels, metric in sorted(by_name[name], key=lambda entry: entry[0]):
+                if isinstance(metric, Counter):
+                    lines.append(f'{name}{_format_labels(labels)} {metric.value}')
+                    continue
+
+                cumulative, total = metric.snapshot()
+                for bound, count in zip(metric.buckets + ('+Inf',), cumulative):
+                    lines.append(f'{name}_bucket{_format_labels(labels + (("le", bound),))} {count}')
+                lines.append(f'{name}_sum{_format_labels(labels)} {total}')
+                lines.append(f'{name}_count{_format_labels(labels)} {cumulative[-1]}')
+
+        for collect in self._collectors:
+            for name, metric_type, help_text, samples in collect():
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} {metric_type}')
+                for labels, value in samples:
+                    lines.append(f'{name}{_format_labels(tuple(labels.items()))} {value}')
+
+        return '\n'.join(lines) + '\n'
+
+
+    def _get(self, name, labels, make):
+        # Lock-free lookup for metrics that already exist, which is every call after the first
+        key = (name, tuple(sorted(labels.items())))
+        metric = self._metrics.get(key)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.get(key)
+                if metric is None:
+                    metric = self._metrics[key] = make()
+        return metric
+
+
+
+# Helper Methods:
+# ------------------------ #
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{label}="{_escape(value)}"' for label, value in labels) + '}'
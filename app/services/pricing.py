@@ -0,0 +1,86 @@
+'''
+    Catalog Pricing Service - direct, in-process price lookups for orders
+'''
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class CatalogPricing:
+
+    def __init__(self, catalog):
+
+        '''
+            Constructor for the pricing service. Wraps a mapping of Cookie IDs to Cookie objects
+        '''
+
+        self.catalog = catalog  # Map (Cookie ID --> Cookie)
+        self.listeners = []     # Callbacks taking a Cookie ID, run when that cookie's price may have changed
+
+
+
+    def price_of(self, cookie_ids):
+        '''
+            Look up the prices of many cookies at once.
+            Returns a dict mapping each known Cookie ID to its price (rounded to cents).
+            IDs that are missing or have an invalid price are left out and reported.
+        '''
+        prices = {}
+
+        for cookie_id in cookie_ids:
+
+            cookie = self.catalog.get(cookie_id)
+            if cookie is None:
+                logger.warning("No data or request failed when getting Cookie (id:%s) details.", cookie_id)
+                continue
+
+            # Same rule the Cookie constructor enforces on price
+            price = cookie.price
+            if not isinstance(price, (int, float)) or price < 0:
+                logger.warning("Error reading Cookie (id:%s) price: %r is not a non-negative number.", cookie_id, price)
+                continue
+
+            prices[cookie_id] = round(price, 2)
+
+        return prices
+
+
+
+    def order_total(self, cookies_and_quantities):
+        '''
+            Calculate the total price of a map (Cookie ID --> Number).
+            Cookies that can't be priced don't count towards the total.
+        '''
+        prices = self.price_of(cookies_and_quantities.keys())
+
+        total_amount = 0
+        for cookie_id, cookie_quantity in cookies_and_quantities.items():
+            if cookie_id in prices:
+                total_amount += prices[cookie_id] * cookie_quantity
+
+        return round(total_amount, 2)
+
+
+
+    def subscribe(self, listener):
+        '''
+            Register a callback to run with a Cookie ID whenever that cookie's price may have changed
+        '''
+        self.listeners.append(listener)
+
+
+
+    def unsubscribe(self, listener):
+        '''
+            Stop running a callback registered with subscribe
+        '''
+        self.listeners.remove(listener)
+
+
+
+    def price_changed(self, cookie_id):
+        '''
+            Tell subscribers that a cookie was added, re-priced, or removed from the catalog
+        '''
+        for listener in self.listeners:
+            listener(cookie_id)
@@ -0,0 +1,96 @@
+'''
+    Response Cache Service - a small LRU cache with a TTL for list query responses
+'''
+import threading
+import time
+from collections import OrderedDict
+
+
+class ResponseCache:
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 30.0):
+
+        '''
+            Constructor for an empty cache holding up to max_entries responses for ttl seconds each.
+            max_entries = 0 turns caching off.
+        '''
+
+        self.max_entries = max_entries
+        self.ttl = ttl
+
+        self._entries = OrderedDict()   # Maps (namespace, key) to (tag, expiry time, response), least recently used first
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0, 'invalidations': 0}
+
+
+
+    def configure(self, max_entries: int, ttl: float):
+        '''
+            Change the size limit and TTL, dropping whatever is cached
+        '''
+        with self._lock:
+            self.max_entries = max_entries
+            self.ttl = ttl
+            self._entries.clear()
+
+
+
+    def get(self, namespace: str, key, tag: str):
+        '''
+            Get the response cached for a key, or None. It only counts if it was cached under the same tag
+            (the collection hasn't changed since) and hasn't outlived the TTL, otherwise it's dropped.
+        '''
+        with self._lock:
+            entry = self._entries.get((namespace, key))
+            if entry is None:
+                self._counters['misses'] += 1
+                return None
+
+            entry_tag, expires, response = entry
+            if entry_tag != tag or expires <= time.monotonic():
+                del self._entries[(namespace, key)]
+                self._counters['invalidations' if entry_tag != tag else 'expirations'] += 1
+                self._counters['misses'] += 1
+                return None
+
+            self._entries.move_to_end((namespace, key))
+            self._counters['hits'] += 1
+            return response
+
+
+
+    def put(self, namespace: str, key, tag: str, response):
+        '''
+            Cache a response built while the collection was at tag, evicting the least recently used past the limit
+        '''
+        if self.max_entries <= 0:
+            return
+
+        with self._lock:
+            self._entries[(namespace, key)] = (tag, time.monotonic() + self.ttl, response)
+            self._entries.move_to_end((namespace, key))
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._counters['evictions'] += 1
+
+
+
+    def invalidate(self, *namespaces: str):
+        '''
+            Drop every response cached for the given namespaces
+        '''
+        with self._lock:
+            stale = [cache_key for cache_key in self._entries if cache_key[0] in namespaces]
+            for cache_key in stale:
+                del self._entries[cache_key]
+            self._counters['invalidations'] += len(stale)
+
+
+
+    def stats(self):
+        '''
+            Get the hit/miss/eviction/expiration/invalidation counters, with the current size and limits
+        '''
+        with self._lock:
+            return dict(self._counters, entries=len(self._entries), max_entries=self.max_entries, ttl=self.ttl)
@@ -0,0 +1,316 @@
+'''
+    Storage interface for cookies and orders. The routes only talk to these methods,
+    so any backend (in-memory, SQLite, ...) can sit behind them.
+'''
+from abc import ABC, abstractmethod
+from typing import Optional
+from app.models.cookie import Cookie
+
+
+def unchanged_patch(id):
+    '''
+        The apply_batch result for a patch that Cookie.update_cookie found nothing to change with
+    '''
+    return ValueError(f"Nothing to update for cookie with ID {id}.")
+
+
+class InventoryError(Exception):
+
+    def __init__(self, cookie_id, requested: int, available: Optional[int] = None):
+
+        '''
+            Constructor for the error raised when a reservation can't be filled (and so nothing was reserved).
+            available is None when the cookie isn't in the catalog at all.
+        '''
+
+        self.cookie_id = cookie_id
+        self.requested = requested
+        self.available = available
+
+        if available is None:
+            message = f"Cookie (id:{cookie_id}) does not exist."
+        else:
+            message = f"Not enough inventory for Cookie (id:{cookie_id}): {requested} requested, {available} available."
+        super().__init__(message)
+
+
+
+class VersionConflict(Exception):
+
+    def __init__(self, id, version: int):
+
+        '''
+            Constructor for the error raised when a conditional write finds the record at another version
+            than the one it expected (and so changed nothing)
+        '''
+
+        self.id = id
+        self.version = version
+        super().__init__(f"Record (id:{id}) has been changed since (now at version {version}).")
+
+
+
+class CookieRepository(ABC):
+
+    # Mapping Methods (Cookie ID --> Cookie)
+    # ------------------------ #
+
+    @abstractmethod
+    def __contains__(self, id): ...
+
+    @abstractmethod
+    def __getitem__(self, id): ...     # Raises KeyError if there's no such cookie
+
+    @abstractmethod
+    def __iter__(self): ...     # Cookie IDs, ascending
+
+    @abstractmethod
+    def __len__(self): ...
+
+    def get(self, id, default=None):
+        try:
+            return self[id]
+        except KeyError:
+            return default
+
+    def values(self):
+        return (self[id] for id in self)
+
+
+
+    # Write Methods
+    # ------------------------ #
+
+    @abstractmethod
+    def add(self, cookie: Cookie):
+        '''
+            Store a new cookie. Backends that hand out their own IDs set cookie.id.
+        '''
+
+    @abstractmethod
+    def update_cookie(
+        self,
+        id,
+        name: Optional[str] = None,
+        description: Optional[str] = None,
+        price: Optional[float] = None,
+        inventory_count: Optional[int] = None,
+        expected_version: Optional[int] = None
+    ):
+        '''
+            Update a stored cookie's parameters, same rules as Cookie.update_cookie. Returns whether anything changed.
+            If expected_version is given and the cookie is at another version, raises VersionConflict and changes nothing.
+        '''
+
+    @abstractmethod
+    def remove(self, id):
+        '''
+            Delete a stored cookie
+        '''
+
+    @abstractmethod
+    def apply_batch(self, operations, atomic: bool = False):
+        '''
+            Apply already validated ('create', Cookie), ('patch', ID, {field: value}) and ('delete', ID)
+            operations as one write. Returns one result per operation (the stored Cookie, the deleted ID,
+            a KeyError for a missing cookie, or a ValueError for a patch that left the cookie unchanged).
+            If atomic, a missing cookie raises KeyError and nothing is applied.
+        '''
+
+    @abstractmethod
+    def reserve_inventory(self, cookies_and_quantities):
+        '''
+            Take the given quantities (Cookie ID --> Number) out of inventory, all or nothing.
+            Raises InventoryError, without changing anything, if a cookie doesn't exist or is short.
+        '''
+
+    @abstractmethod
+    def reserve_inventory_batch(self, reservations):
+        '''
+            Make several reservations (each a Cookie ID --> Number map) as one write. Each is all or nothing
+            on its own, tried in order. Returns one result per reservation: None, or the InventoryError.
+        '''
+
+    @abstractmethod
+    def release_inventory(self, cookies_and_quantities):
+        '''
+            Put reserved quantities back into inventory. Cookies deleted since are skipped.
+        '''
+
+
+
+    # Query Methods
+    # ------------------------ #
+
+    @abstractmethod
+    def query(
+        self,
+        name_search: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        sort: str = 'id',
+        after: Optional[tuple] = None
+    ):
+        '''
+            Get an iterator over the cookies matching the filters, in sort order (see CookieStore.query)
+        '''
+
+    @abstractmethod
+    def cursor_key(self, id, sort: str = 'id'):
+        '''
+            Get the (sort key, ID) position of a stored cookie, to pass to query(after=...)
+        '''
+
+    def search_name(self, name_search):
+        '''
+            Get the cookies (in ID order) whose name contains name_search, ignoring case
+        '''
+        return list(self.query(name_search=name_search))
+
+
+
+    # Version Methods (for ETags)
+    # ------------------------ #
+
+    @abstractmethod
+    def collection_tag(self):
+        '''
+            Get an opaque tag that changes whenever any cookie is added, changed or removed
+        '''
+
+    def record_tag(self, cookie):
+        '''
+            Get an opaque tag naming this version of a stored cookie
+        '''
+        return f'{cookie.id}.{cookie.version}'
+
+
+
+class OrderRepository(ABC):
+
+    pricing = None  # CatalogPricing that stored orders' totals are settled from (set by use_stores). None keeps the totals orders come with
+
+
+    # Mapping Methods (Order ID --> Order)
+    # ------------------------ #
+
+    @abstractmethod
+    def __contains__(self, id): ...
+
+    @abstractmethod
+    def __getitem__(self, id): ...     # Raises KeyError if there's no such order
+
+    @abstractmethod
+    def __iter__(self): ...     # Order IDs, ascending
+
+    @abstractmethod
+    def __len__(self): ...
+
+    def get(self, id, default=None):
+        try:
+            return self[id]
+        except KeyError:
+            return default
+
+    def values(self):
+        return (self[id] for id in self)
+
+
+
+    # Write Methods
+    # ------------------------ #
+
+    @abstractmethod
+    def add(self, order):
+        '''
+            Store a new order. Backends that hand out their own IDs set order.id.
+        '''
+
+    @abstractmethod
+    def add_many(self, orders):
+        '''
+            Store several new orders as one write
+        '''
+
+    @abstractmethod
+    def set_cookies_and_quantities(self, id, cookies_and_quantities):
+        '''
+            Replace the cookies in a stored order, refreshing its total
+        '''
+
+    @abstractmethod
+    def set_status(self, id, status, from_statuses=None, expected_version=None):
+        '''
+            Change the status of a stored order. If from_statuses is given, the order must currently be in
+            one of them or ValueError is raised and nothing changes (checked and changed in one step).
+            Likewise if expected_version is given, the order must be at that version or VersionConflict is raised.
+        '''
+
+    @abstractmethod
+    def set_statuses(self, changes):
+        '''
+            Apply several (ID, status, from_statuses) changes, as for set_status, as one write. Returns one result
+            per change: the updated Order, or the KeyError / ValueError that stopped it.
+        '''
+
+    @abstractmethod
+    def reprice_cookie(self, cookie_id):
+        '''
+            Refresh the total of every order containing the given cookie
+        '''
+
+
+
+    # Query Methods
+    # ------------------------ #
+
+    @abstractmethod
+    def count_by_status(self):
+        '''
+            Get the number of orders in each status, as a map (OrderStatus --> Number)
+        '''
+
+    @abstractmethod
+    def query(
+        self,
+        status=None,
+        min_date=None,
+        max_date=None,
+        min_deliver_date=None,
+        max_deliver_date=None,
+        min_total_amount=None,
+        max_total_amount=None,
+        after_id=None
+    ):
+        '''
+            Get an iterator over the matching orders, in ID order (see OrderStore.query)
+        '''
+
+
+
+    # Version Methods (for ETags)
+    # ------------------------ #
+
+    @abstractmethod
+    def collection_tag(self):
+        '''
+            Get an opaque tag that changes whenever any order is added or changed, or its total moves
+        '''
+
+    def record_tag(self, order):
+        '''
+            Get an opaque tag naming this version of a stored order
+        '''
+        return f'{order.id}.{order.version}'
+
+
+
+    # Helper Methods:
+    # ------------------------ #
+
+    def _settle_total(self, order):
+        # Price an order from the store's pricing service. Call once the order is where reprice_cookie will find it,
+        # so a price change either lands before this or reaches the stored order afterwards
+        if self.pricing is not None:
+            order.refresh_total_amount(self.pricing)
+        return order.total_amount
@@ -0,0 +1,325 @@
+'''
+    Columnar in-memory Order storage for analytics-sized order tables. The fields orders are filtered on
+    (ID, dates, status and total) live in NumPy arrays, one per field, so the status, date and amount
+    filters run as vectorized masks over every order at once instead of a Python loop.
+
+    Needs numpy, which is an optional dependency (only imported when this backend is picked).
+
+    Safe to share between threads: writes take one store lock (appends have to anyway, to claim a row),
+    and readers only hold it long enough to take views of the columns.
+'''
+import copy
+import threading
+from datetime import datetime
+from typing import Optional
+import numpy as np
+from app.models.order import Order
+from app.store.base import OrderRepository, VersionConflict
+from app.store.versions import ChangeCounter
+
+
+CHUNK_SIZE = 65536  # Minimum number of rows the columns grow by when they fill up
+READ_CHUNK_SIZE = 4096  # Matching rows turned into Python ints at a time while a query's results are read
+
+
+def date_micros(date: datetime):
+    # Store dates as int64 POSIX microseconds, so naive (local) and timezone-aware datetimes compare together
+    return round(date.timestamp() * 1_000_000)
+
+
+def orders_at(orders, rows):
+    # Yield the orders at an array of row numbers, a chunk of rows at a time, so memory stays flat however many match
+    for start in range(0, len(rows), READ_CHUNK_SIZE):
+        for row in rows[start:start + READ_CHUNK_SIZE].tolist():
+            yield orders[row]
+
+
+class ColumnarOrderStore(OrderRepository):
+
+    def __init__(self, pricing=None):
+
+        '''
+            Constructor for a new, empty ColumnarOrderStore, settling order totals through the given pricing service
+        '''
+
+        self.pricing = pricing  # CatalogPricing the totals come from (None keeps the totals orders come with)
+        self._size = 0  # Rows in use. Rows past it are spare capacity
+        self._ids = np.empty(0, dtype=np.int64)
+        self._order_dates = np.empty(0, dtype=np.int64)
+        self._deliver_dates = np.empty(0, dtype=np.int64)
+        self._statuses = np.empty(0, dtype=np.int8)     # OrderStatus values
+        self._totals = np.empty(0, dtype=np.float64)
+
+        self._orders = []   # Row --> Order object, for handing back the matches
+        self._rows = {}     # Maps Order IDs to their rows
+        self._in_id_order = True    # Whether the rows are in ascending ID order, so matches need no sorting
+        self._order_ids_by_cookie = {}  # Maps Cookie IDs to the set of Order IDs containing that cookie
+
+        self._lock = threading.Lock()   # Serializes writes, and the column views readers take
+        self._changes = ChangeCounter()     # Counts writes, for the collection's ETag
+
+
+
+    # Mapping Methods (so the store reads like the plain dict it replaces)
+    # ------------------------ #
+
+    def __contains__(self, id):
+        return id in self._rows
+
+    def __getitem__(self, id):
+        return self._orders[self._rows[id]]
+
+    def __iter__(self):
+        return iter(sorted(self._rows))     # A copy, so writes on other threads can't break the iteration
+
+    def __len__(self):
+        return self._size
+
+    def get(self, id, default=None):
+        row = self._rows.get(id)
+        return default if row is None else self._orders[row]
+
+    def values(self):
+        return [self._orders[self._rows[id]] for id in sorted(self._rows)]
+
+
+
+    # Write Methods
+    # ------------------------ #
+
+    def add(self, order: Order):
+        '''
+            Store an order in a new row (or its existing one, if the ID is already stored)
+        '''
+        with self._lock:
+            self._store(order)
+        self._changes.bump()
+
+
+    def add_many(self, orders):
+        '''
+            Store several orders as one write, growing the columns once for all of them
+        '''
+        with self._lock:
+            self._reserve_rows(len(orders))
+            for order in orders:
+                self._store(order)
+        self._changes.bump()
+
+
+    def set_cookies_and_quantities(self, id, cookies_and_quantities):
+        '''
+            Replace the cookies in a stored order, refreshing its total
+        '''
+        with self._lock:
+            row = self._rows[id]
+            old_order = self._orders[row]
+
+            # Change a copy, so a bad value leaves the stored order alone and readers never see it half-changed
+            order = copy.copy(old_order)
+            order.set_cookies_and_quantities(cookies_and_quantities)
+
+            # Reverse-index the new cookies before settling the total, so a price change from here on reaches it
+            self._index_cookies(order)
+            self._settle_total(order)
+            self._unindex_cookies(old_order, keep=order.cookies_and_quantities)
+
+            self._orders[row] = order
+            self._totals[row] = order.total_amount
+        self._changes.bump()
+
+
+    def set_status(self, id, status, from_statuses=None, expected_version=None):
+        '''
+            Change the status of a stored order (see OrderRepository.set_status)
+        '''
+        with self._lock:
+            self._set_status(id, status, from_statuses, expected_version)
+        self._changes.bump()
+
+
+    def set_statuses(self, changes):
+        '''
+            Apply several (ID, status, from_statuses) changes as one write (see OrderRepository.set_statuses)
+        '''
+        with self._lock:
+            results = []
+            for id, status, from_statuses in changes:
+                try:
+                    results.append(self._set_status(id, status, from_statuses))
+                except (KeyError, ValueError) as e:
+                    results.append(e)
+        self._changes.bump()
+        return results
+
+
+    def reprice_cookie(self, cookie_id):
+        '''
+            Refresh the total of every order containing the given cookie, in the order and in the totals column
+        '''
+        with self._lock:
+            order_ids = self._order_ids_by_cookie.get(cookie_id, ())
+            for order_id in order_ids:
+                row = self._rows[order_id]
+                self._totals[row] = self._settle_total(self._orders[row])
+
+        if order_ids:
+            self._changes.bump()
+
+
+
+    # Query Methods
+    # ------------------------ #
+
+    def count_by_status(self):
+        '''
+            Get the number of orders in each status, counted in one pass over the status column
+        '''
+        with self._lock:
+            statuses = self._statuses[:self._size]
+
+        counts = np.bincount(statuses, minlength=max(status.value for status in Order.OrderStatus) + 1)
+        return {status: int(counts[status.value]) for status in Order.OrderStatus}
+
+
+    def query(
+        self,
+        status: Optional[Order.OrderStatus] = None,
+        min_date: Optional[datetime] = None,
+        max_date: Optional[datetime] = None,
+        min_deliver_date: Optional[datetime] = None,
+        max_deliver_date: Optional[datetime] = None,
+        min_total_amount: Optional[float] = None,
+        max_total_amount: Optional[float] = None,
+        after_id: Optional[int] = None
+    ):
+        '''
+            Get an iterator over the orders with the given status and within the given (inclusive) ranges, in ID order.
+            Filters left as None aren't applied. Each filter is one vectorized comparison over its column,
+            ANDed into a mask, and only the matching orders are looked up. after_id resumes just past that order ID.
+        '''
+        with self._lock:
+            size = self._size
+            ids = self._ids[:size]
+            in_id_order = self._in_id_order
+            columns = {
+                'order_date': self._order_dates[:size],
+                'deliver_date': self._deliver_dates[:size],
+                'status': self._statuses[:size],
+                'total': self._totals[:size],
+            }
+            orders = self._orders
+
+        conditions = [
+            (columns['status'], np.equal, None if status is None else status.value),
+            (columns['order_date'], np.greater_equal, None if min_date is None else date_micros(min_date)),
+            (columns['order_date'], np.less_equal, None if max_date is None else date_micros(max_date)),
+            (columns['deliver_date'], np.greater_equal, None if min_deliver_date is None else date_micros(min_deliver_date)),
+            (columns['deliver_date'], np.less_equal, None if max_deliver_date is None else date_micros(max_deliver_date)),
+            (columns['total'], np.greater_equal, min_total_amount),
+            (columns['total'], np.less_equal, max_total_amount),
+            (ids, np.greater, after_id),
+        ]
+
+        mask = None
+        for column, compare, value in conditions:
+            if value is None:
+                continue
+            matches = compare(column, value)
+            mask = matches if mask is None else np.logical_and(mask, matches, out=mask)
+
+        rows = np.arange(size) if mask is None else np.flatnonzero(mask)
+        if not in_id_order:
+            rows = rows[np.argsort(ids[rows], kind='stable')]
+
+        return orders_at(orders, rows)
+
+
+
+    # Version Methods (for ETags)
+    # ------------------------ #
+
+    def collection_tag(self):
+        return self._changes.collection_tag()
+
+    def record_tag(self, order):
+        return self._changes.record_tag(order)
+
+
+
+    # Helper Methods:
+    # ------------------------ #
+
+    # Writes, called with the store lock held
+
+    def _reserve_rows(self, count):
+        # Grow every column (geometrically, by at least a chunk) so count more rows fit
+        needed = self._size + count
+        capacity = len(self._ids)
+        if needed <= capacity:
+            return
+
+        capacity = max(needed, capacity + max(CHUNK_SIZE, capacity // 2))
+        for name in ('_ids', '_order_dates', '_deliver_dates', '_statuses', '_totals'):
+            old = getattr(self, name)
+            column = np.empty(capacity, dtype=old.dtype)
+            column[:self._size] = old[:self._size]
+            setattr(self, name, column)     # Readers holding views of the old column still see valid data
+
+    def _store(self, order):
+        # Reverse-index the cookies before settling the total, so a price change since the order was
+        # priced (or from here on) reaches it, and the totals column gets the settled total
+        self._index_cookies(order)
+        self._settle_total(order)
+
+        row = self._rows.get(order.id)
+        if row is not None:     # Replacing an order, so drop the old one's other cookies from the reverse index
+            self._unindex_cookies(self._orders[row], keep=order.cookies_and_quantities)
+            self._orders[row] = order
+        else:
+            self._reserve_rows(1)
+            row = self._size
+            if row and order.id < self._ids[row - 1]:
+                self._in_id_order = False
+            self._ids[row] = order.id
+            self._orders.append(order)
+            self._rows[order.id] = row
+
+        self._order_dates[row] = date_micros(order.order_date)
+        self._deliver_dates[row] = date_micros(order.deliver_date)
+        self._statuses[row] = order.status.value
+        self._totals[row] = order.total_amount
+
+        # Only counted once every column is written, so readers never see a half-written row
+        if row == self._size:
+            self._size += 1
+
+    def _set_status(self, id, status, from_statuses, expected_version=None):
+        row = self._rows[id]
+        old_order = self._orders[row]
+        if expected_version is not None and old_order.version != expected_version:
+            raise VersionConflict(id, old_order.version)
+        if from_statuses is not None and old_order.status not in from_statuses:
+            raise ValueError(f"Cannot transition from {old_order.status.name} to {status.name}.")
+
+        # Change a copy, so each caller keeps the order as it was right after its own change
+        order = copy.copy(old_order)
+        order.set_status(status)    # Validates the status before the column is touched
+        self._orders[row] = order
+        self._statuses[row] = status.value
+        return order
+
+    def _index_cookies(self, order):
+        for cookie_id in order.cookies_and_quantities:
+            self._order_ids_by_cookie.setdefault(cookie_id, set()).add(order.id)
+
+    def _unindex_cookies(self, order, keep=()):
+        # Cookies in keep stay indexed for this order
+        for cookie_id in order.cookies_and_quantities:
+            if cookie_id in keep:
+                continue
+            order_ids = self._order_ids_by_cookie.get(cookie_id)
+            if order_ids is not None:
+                order_ids.discard(order.id)
+                if not order_ids:
+                    del self._order_ids_by_cookie[cookie_id]
@@ -0,0 +1,378 @@
+'''
+    In-memory Cookie storage with a trigram index for name search,
+    and sorted indexes for price ranges and sorted listings.
+
+    Safe to share between threads: writes to the same cookie are serialized by a striped lock, each index
+    guards itself, and a changed cookie is swapped in whole, so readers never take a store-wide lock
+    or see a half-updated cookie.
+'''
+import copy
+from bisect import bisect_left, bisect_right
+from typing import Optional
+from app.models.cookie import Cookie
+from app.store.base import CookieRepository, InventoryError, VersionConflict, unchanged_patch
+from app.store.locks import StripedLock
+from app.store.sorted_index import SORT_LIMIT, SortedIndex
+from app.store.trigram_index import TrigramIndex
+from app.store.versions import ChangeCounter
+
+
+# Keys a cookie listing can be sorted by (prefix with '-' for descending)
+SORT_KEYS = ('id', 'name', 'price')
+
+
+def parse_sort(sort: str):
+    '''
+        Split a sort parameter like '-price' into (descending?, key). Raises ValueError for unknown keys.
+    '''
+    reverse = sort.startswith('-')
+    sort_key = sort[1:] if reverse else sort
+    if sort_key not in SORT_KEYS:
+        raise ValueError(f"sort must be one of {', '.join(SORT_KEYS)} (optionally prefixed with '-'), got {sort}.")
+    return reverse, sort_key
+
+
+def _ids_after(sorted_ids, after, reverse):
+    # Slice an ascending list of IDs to the ones past after=(key, ID) in iteration order
+    if reverse:
+        end = len(sorted_ids) if after is None else bisect_left(sorted_ids, after[1])
+        return reversed(sorted_ids[:end])
+
+    start = 0 if after is None else bisect_right(sorted_ids, after[1])
+    return sorted_ids[start:]
+
+
+class CookieStore(CookieRepository):
+
+    def __init__(self):
+
+        '''
+            Constructor for a new, empty CookieStore
+        '''
+
+        self._cookies = {}  # Maps Cookie IDs to Cookie objects
+        self._name_index = TrigramIndex()   # Lowercased cookie names, for name_search
+
+        # Sorted indexes on ID, price and lowercased name, plus the keys each cookie is indexed under
+        self._id_index = SortedIndex()
+        self._price_index = SortedIndex()
+        self._name_order_index = SortedIndex()
+        self._index_keys = {}   # Maps Cookie IDs to their (price, lowercased name) keys
+
+        self._record_locks = StripedLock()  # Serializes writes to the same cookie
+        self._changes = ChangeCounter()     # Counts writes, for the collection's ETag
+
+
+
+    # Mapping Methods (so the store reads like the plain dict it replaces)
+    # ------------------------ #
+
+    def __contains__(self, id):
+        return id in self._cookies
+
+    def __getitem__(self, id):
+        return self._cookies[id]
+
+    def __iter__(self):
+        return iter(list(self._cookies))    # A copy, so writes on other threads can't break the iteration
+
+    def __len__(self):
+        return len(self._cookies)
+
+    def get(self, id, default=None):
+        return self._cookies.get(id, default)
+
+    def values(self):
+        return list(self._cookies.values())
+
+
+
+    # Write Methods
+    # ------------------------ #
+
+    def add(self, cookie: Cookie):
+        '''
+            Store a cookie and index it
+        '''
+        with self._record_locks.lock_for(cookie.id):
+            self._store(cookie)
+
+
+    def update_cookie(
+        self,
+        id,
+        name: Optional[str] = None,
+        description: Optional[str] = None,
+        price: Optional[float] = None,
+        inventory_count: Optional[int] = None,
+        expected_version: Optional[int] = None
+    ):
+        '''
+            Update a stored cookie's parameters (see Cookie.update_cookie), re-indexing its name and price if they changed.
+            Use this rather than Cookie.update_cookie on a stored cookie so the indexes follow the change.
+            If expected_version is given, the cookie must still be at that version or VersionConflict is raised.
+        '''
+        with self._record_locks.lock_for(id):
+            return self._update(id, name, description, price, inventory_count, expected_version)
+
+
+    def remove(self, id):
+        '''
+            Delete a stored cookie and drop it from the indexes
+        '''
+        with self._record_locks.lock_for(id):
+            self._delete(id)
+
+
+    def apply_batch(self, operations, atomic: bool = False):
+        '''
+            Apply a list of already validated operations in one go. Each one is ('create', Cookie),
+            ('patch', ID, {field: value}) or ('delete', ID). Returns one result per operation:
+            the stored Cookie for a create or patch, the ID for a delete, a KeyError if the cookie to
+            patch or delete doesn't exist, or a ValueError for a patch that changed nothing. If atomic, a missing cookie raises that KeyError instead,
+            before anything is applied.
+        '''
+        ids = [operation[1].id if operation[0] == 'create' else operation[1] for operation in operations]
+
+        with self._record_locks.lock_many(ids):
+            if atomic:
+                # Make sure every operation can go through before applying any of them
+                exists = {}     # Cookie IDs the batch creates or deletes --> whether they exist at that point
+                for (kind, *_), id in zip(operations, ids):
+                    if kind != 'create' and not exists.get(id, id in self._cookies):
+                        raise KeyError(id)
+                    if kind != 'patch':
+                        exists[id] = kind == 'create'
+
+            results = []
+            for operation, id in zip(operations, ids):
+                kind = operation[0]
+                if kind == 'create':
+                    self._store(operation[1])
+                    results.append(operation[1])
+                elif id not in self._cookies:
+                    results.append(KeyError(id))
+                elif kind == 'patch':
+                    results.append(self._cookies[id] if self._update(id, **operation[2]) else unchanged_patch(id))
+                else:
+                    self._delete(id)
+                    results.append(id)
+
+            return results
+
+
+    def reserve_inventory(self, cookies_and_quantities):
+        '''
+            Take the given quantities (Cookie ID --> Number) out of inventory, all or nothing.
+            Raises InventoryError, without changing anything, if a cookie doesn't exist or is short.
+            Only the cookies involved are locked, so checkouts for other cookies carry on alongside.
+        '''
+        with self._record_locks.lock_many(cookies_and_quantities):
+            self._reserve(cookies_and_quantities)
+
+
+    def reserve_inventory_batch(self, reservations):
+        '''
+            Make several reservations as one write (see CookieRepository.reserve_inventory_batch)
+        '''
+        with self._record_locks.lock_many({id for reservation in reservations for id in reservation}):
+            results = []
+            for reservation in reservations:
+                try:
+                    self._reserve(reservation)
+                    results.append(None)
+                except InventoryError as e:
+                    results.append(e)
+            return results
+
+
+    def release_inventory(self, cookies_and_quantities):
+        '''
+            Put reserved quantities back into inventory. Cookies deleted since are skipped.
+        '''
+        with self._record_locks.lock_many(cookies_and_quantities):
+            for id, quantity in cookies_and_quantities.items():
+                if id in self._cookies:
+                    self._adjust_inventory(id, quantity)
+
+
+
+    # Query Methods
+    # ------------------------ #
+
+    def search_name(self, name_search):
+        '''
+            Get the cookies (in ID order) whose name contains name_search, ignoring case
+        '''
+        return list(self._walk(self._name_index.search(name_search), None, None, None))
+
+
+    def query(
+        self,
+        name_search: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        sort: str = 'id',
+        after: Optional[tuple] = None
+    ):
+        '''
+            Get an iterator over the cookies matching the filters, ordered by a key from SORT_KEYS ('-' prefix for descending).
+            Filters left as None aren't applied, and price bounds are inclusive.
+            Sorting by price or name walks that index, so the results come out already in order.
+            after=cursor_key(...) of a previously returned cookie resumes just past it (keyset pagination).
+        '''
+        reverse, sort_key = parse_sort(sort)
+
+        name_matches = None if not name_search else self._name_index.search(name_search)
+        has_price_range = min_price is not None or max_price is not None
+
+        # Pick the IDs to walk, in sorted order, and which filters still need checking on each
+        if sort_key == 'price':
+            ids = self._price_index.range(min_price, max_price, reverse=reverse, after=after)
+            has_price_range = False  # Already applied by the index range
+        elif sort_key == 'name':
+            ids = self._name_order_index.range(reverse=reverse, after=after)
+        elif name_matches is not None:
+            ids = _ids_after(name_matches, after, reverse)
+            name_matches = None  # Already applied
+        elif has_price_range and self._price_index.count(min_price, max_price) <= SORT_LIMIT:
+            # A narrow price range sorts its few IDs, a wider one is checked while walking the ID index below
+            ids = _ids_after(sorted(self._price_index.range(min_price, max_price)), after, reverse)
+            has_price_range = False  # Already applied
+        else:
+            ids = self._id_index.range(reverse=reverse, after=after)
+
+        name_match_set = None if name_matches is None else set(name_matches)
+        if not has_price_range:
+            min_price = max_price = None
+
+        return self._walk(ids, name_match_set, min_price, max_price)
+
+
+
+    def cursor_key(self, id, sort: str = 'id'):
+        '''
+            Get the (sort key, ID) position of a stored cookie in the given sort order, to pass to query(after=...)
+        '''
+        _, sort_key = parse_sort(sort)
+        price, lowered_name = self._index_keys[id]
+
+        if sort_key == 'price':
+            return (price, id)
+        if sort_key == 'name':
+            return (lowered_name, id)
+        return (id, id)
+
+
+
+    # Version Methods (for ETags)
+    # ------------------------ #
+
+    def collection_tag(self):
+        return self._changes.collection_tag()
+
+    def record_tag(self, cookie):
+        return self._changes.record_tag(cookie)
+
+
+
+    # Helper Methods:
+    # ------------------------ #
+
+    # Writes, called with the record lock for the cookie held
+
+    def _store(self, cookie):
+        if cookie.id in self._cookies:  # Replacing a cookie, so drop the old one from the indexes
+            self._unindex(cookie.id)
+        else:
+            self._id_index.add(cookie.id, cookie.id)
+
+        self._cookies[cookie.id] = cookie
+        self._name_index.add(cookie.id, cookie.name)
+        self._index(cookie)
+        self._changes.bump()
+
+    def _update(self, id, name=None, description=None, price=None, inventory_count=None, expected_version=None):
+        # Change a copy and swap it in, so concurrent readers see either the old cookie or the new one
+        cookie = copy.copy(self._cookies[id])
+        old_name = cookie.name
+
+        if expected_version is not None and cookie.version != expected_version:
+            raise VersionConflict(id, cookie.version)
+
+        updated = cookie.update_cookie(name, description, price, inventory_count)
+        if not updated:
+            return updated
+        self._cookies[id] = cookie
+
+        if cookie.name != old_name:
+            self._name_index.add(id, cookie.name)
+        self._reindex(cookie)
+        self._changes.bump()
+
+        return updated
+
+    def _delete(self, id):
+        del self._cookies[id]
+        self._name_index.remove(id)
+        self._unindex(id)
+        self._id_index.remove(id, id)
+        self._changes.bump()
+
+    def _reserve(self, cookies_and_quantities):
+        # Check every line before touching any
+        for id, quantity in cookies_and_quantities.items():
+            cookie = self._cookies.get(id)
+            if cookie is None:
+                raise InventoryError(id, quantity)
+            if cookie.inventory_count < quantity:
+                raise InventoryError(id, quantity, cookie.inventory_count)
+
+        for id, quantity in cookies_and_quantities.items():
+            self._adjust_inventory(id, -quantity)
+
+    def _adjust_inventory(self, id, change):
+        # Inventory isn't indexed, so only the cookie is swapped
+        if change:
+            cookie = copy.copy(self._cookies[id])
+            cookie.inventory_count += change
+            cookie.version += 1
+            self._cookies[id] = cookie
+            self._changes.bump()
+
+    def _walk(self, ids, name_match_set, min_price, max_price):
+        # Yield the cookies for the given IDs that pass the remaining filters
+        for id in ids:
+            if name_match_set is not None and id not in name_match_set:
+                continue
+
+            cookie = self._cookies.get(id)
+            if cookie is None:  # Deleted on another thread since the index was read
+                continue
+            if min_price is not None and cookie.price < min_price:
+                continue
+            if max_price is not None and cookie.price > max_price:
+                continue
+
+            yield cookie
+
+    def _index(self, cookie):
+        keys = (cookie.price, cookie.name.lower())
+        self._index_keys[cookie.id] = keys
+
+        self._price_index.add(keys[0], cookie.id)
+        self._name_order_index.add(keys[1], cookie.id)
+
+    def _reindex(self, cookie):
+        old_price, old_lowered_name = self._index_keys[cookie.id]
+        keys = (cookie.price, cookie.name.lower())
+        self._index_keys[cookie.id] = keys
+
+        self._price_index.move(old_price, keys[0], cookie.id)
+        self._name_order_index.move(old_lowered_name, keys[1], cookie.id)
+
+    def _unindex(self, id):
+        price, lowered_name = self._index_keys.pop(id)
+
+        self._price_index.remove(price, id)
+        self._name_order_index.remove(lowered_name, id)
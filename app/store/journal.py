@@ -0,0 +1,230 @@
+'''
+    Append-only write-ahead log with group commit and snapshot compaction
+'''
+import json
+import os
+import threading
+
+
+class Journal:
+
+    # How writes are made durable
+    SYNC_MODES = (
+        'group',    # commit() returns once the record is fsynced. Concurrent writers share one fsync
+        'interval', # commit() returns at once. A background thread fsyncs every sync_interval seconds
+    )
+
+    def __init__(self, directory: str, sync: str = 'group', sync_interval: float = 0.05, snapshot_every: int = 10000):
+
+        '''
+            Constructor for a journal kept in the given directory (created if missing).
+            Call load() before writing, to read back what's already there.
+        '''
+
+        if sync not in Journal.SYNC_MODES:
+            raise ValueError(f"sync must be one of {', '.join(Journal.SYNC_MODES)}, got {sync}.")
+
+        os.makedirs(directory, exist_ok=True)
+        self.log_path = os.path.join(directory, 'journal.log')
+        self.snapshot_path = os.path.join(directory, 'snapshot.json')
+
+        self.sync = sync
+        self.sync_interval = sync_interval
+        self.snapshot_every = snapshot_every   # Records between snapshots
+
+        # Held by the stores around "apply a mutation + write its record", and while taking a snapshot,
+        # so records land in the log in the same order the mutations happened
+        self.state_lock = threading.RLock()
+
+        self.snapshot_source = None     # Callable returning the full state to snapshot (set by the stores)
+
+        self._lock = threading.Lock()   # Guards the log file and the counters below
+        self._synced_cond = threading.Condition(self._lock)
+        self._file = None
+        self._written_seq = 0   # Sequence number of the last record written
+        self._synced_seq = 0    # Sequence number of the last record known to be on disk
+        self._syncing = False   # Whether some thread is in the middle of an fsync
+        self._since_snapshot = 0
+        self._closed = False
+
+
+
+    # Startup
+    # ------------------------ #
+
+    def load(self):
+        '''
+            Read back the last snapshot and the log records written after it, then open the log for appending.
+            Returns (snapshot state or None, list of records). A torn record at the end of the log
+            (from a crash mid-write, including one cut off just before its newline) is dropped.
+        '''
+        snapshot = None
+        snapshot_seq = 0
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path) as f:
+                snapshot = json.load(f)
+            snapshot_seq = snapshot['seq']
+
+        records = []
+        last_seq = snapshot_seq
+        good_length = 0
+        if os.path.exists(self.log_path):
+            with open(self.log_path, 'rb') as f:
+                for line in f:
+                    # Torn write, nothing after it was acknowledged. Without its newline even a parseable
+                    # record is cut off, and kept, the next record would be appended onto the same line
+                    if not line.endswith(b'\n'):
+                        break
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break
+                    good_length += len(line)
+
+                    # Records already folded into the snapshot are skipped
+                    if record['seq'] > snapshot_seq:
+                        records.append(record)
+                        last_seq = record['seq']
+
+            with open(self.log_path, 'r+b') as f:
+                f.truncate(good_length)
+
+        self._file = open(self.log_path, 'a')
+        self._written_seq = self._synced_seq = last_seq
+        self._since_snapshot = len(records)
+
+        if self.sync == 'interval':
+            threading.Thread(target=self._sync_periodically, name='journal-sync', daemon=True).start()
+
+        return (None if snapshot is None else snapshot['state']), records
+
+
+
+    # Writing
+    # ------------------------ #
+
+    def write(self, record: dict):
+        '''
+            Append a record to the log (not yet durable). Returns its sequence number for commit().
+            Call with state_lock held, right after applying the mutation the record describes.
+        '''
+        with self._lock:
+            self._written_seq += 1
+            self._file.write(json.dumps({'seq': self._written_seq, **record}, separators=(',', ':')) + '\n')
+            self._since_snapshot += 1
+            return self._written_seq
+
+
+    def commit(self, seq: int):
+        '''
+            Make the record with the given sequence number durable (per the sync mode), and take a snapshot
+            if enough records have piled up. Call without state_lock, so other writers aren't held up.
+        '''
+        if self.sync == 'group':
+            self._sync_through(seq)
+
+        if self._since_snapshot >= self.snapshot_every and self.snapshot_source is not None:
+            with self.state_lock:
+                if self._since_snapshot >= self.snapshot_every:    # Another writer may have just taken it
+                    self.snapshot()
+
+
+    def snapshot(self):
+        '''
+            Write the full state to a new snapshot, then empty the log.
+            Replaying the snapshot alone gives back the same state, so recovery time stays bounded.
+        '''
+        with self.state_lock:
+            state = self.snapshot_source()
+
+            with self._lock:
+                seq = self._written_seq
+                self._file.flush()
+
+            # Write to a temporary file first, so a crash leaves the old snapshot in place
+            tmp_path = self.snapshot_path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump({'seq': seq, 'state': state}, f, separators=(',', ':'))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.snapshot_path)
+            self._fsync_directory()
+
+            # Every record so far is in the snapshot. If we crash before this, load() skips them by seq
+            with self._lock:
+                self._file.truncate(0)
+                self._synced_seq = max(self._synced_seq, seq)
+                self._since_snapshot = 0
+                self._synced_cond.notify_all()
+
+
+    def close(self):
+        '''
+            Flush and fsync anything outstanding and close the log
+        '''
+        with self._lock:
+            if self._closed or self._file is None:
+                return
+            self._closed = True
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+
+
+
+    # Helper Methods:
+    # ------------------------ #
+
+    def _sync_through(self, seq):
+        # Group commit: whoever finds no fsync in progress becomes the leader and fsyncs everything
+        # written so far. Writers that arrive meanwhile wait for it (or the next one) instead of
+        # issuing their own, so N concurrent commits cost far fewer than N fsyncs.
+        with self._lock:
+            while self._synced_seq < seq:
+                if self._syncing:
+                    self._synced_cond.wait()
+                    continue
+                self._fsync_locked()
+
+
+    def _fsync_locked(self):
+        # Called with self._lock held. Drops it for the fsync itself so writers can keep appending
+        self._syncing = True
+        target = self._written_seq
+        self._file.flush()
+        fd = self._file.fileno()
+
+        self._lock.release()
+        synced = False
+        try:
+            os.fsync(fd)
+            synced = True
+        finally:
+            self._lock.acquire()
+            self._syncing = False
+            if synced:
+                self._synced_seq = max(self._synced_seq, target)
+            self._synced_cond.notify_all()
+
+
+    def _sync_periodically(self):
+        # Background fsync for the 'interval' sync mode
+        while True:
+            with self._lock:
+                self._synced_cond.wait(self.sync_interval)
+                if self._closed:
+                    return
+                if self._synced_seq < self._written_seq and not self._syncing:
+                    self._fsync_locked()
+
+
+    def _fsync_directory(self):
+        # Make the snapshot's rename itself durable
+        try:
+            fd = os.open(os.path.dirname(self.snapshot_path) or '.', os.O_RDONLY)
+        except OSError:
+            return  # Not supported on this platform
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
@@ -0,0 +1,259 @@
+'''
+    In-memory Cookie and Order stores that record every mutation in a Journal,
+    and can be rebuilt from it on startup
+'''
+from datetime import datetime
+from typing import Optional
+from app.models.cookie import Cookie
+from app.models.order import Order
+from app.services.pricing import CatalogPricing
+from app.store.cookie_store import CookieStore
+from app.store.journal import Journal
+from app.store.order_store import OrderStore
+
+
+# Records are idempotent upserts/deletes of whole objects, so replaying one twice is harmless
+
+def _cookie_record(cookie: Cookie):
+    # Versions are kept too, so ETags handed out before a restart still name the same content
+    return dict(cookie.to_dict(), version=cookie.version)
+
+
+def _order_record(order: Order):
+    return {
+        'id': order.id,
+        'cookies_and_quantities': order.cookies_and_quantities,
+        'order_date': order.order_date.isoformat(),
+        'deliver_date': order.deliver_date.isoformat(),
+        'status': order.status.name,
+        'version': order.version,
+    }
+
+
+def _order_from_record(record):
+    cookies_and_quantities = {int(cookie_id): quantity for cookie_id, quantity in record['cookies_and_quantities'].items()}
+    return Order.from_storage(
+        record['id'],
+        cookies_and_quantities,
+        datetime.fromisoformat(record['order_date']),
+        datetime.fromisoformat(record['deliver_date']),
+        Order.OrderStatus[record['status']],
+        0.0,    # Totals aren't logged, the store settles them from the prices
+        record.get('version', 1),   # Records from before versions were logged start over at 1
+    )
+
+
+
+class JournaledCookieStore(CookieStore):
+
+    def __init__(self, journal: Journal):
+
+        '''
+            Constructor for an empty cookie store that logs its mutations to the given journal
+        '''
+
+        super().__init__()
+        self.journal = journal
+
+
+    def add(self, cookie: Cookie):
+        with self.journal.state_lock:
+            super().add(cookie)
+            seq = self.journal.write({'op': 'put_cookie', 'cookie': _cookie_record(cookie)})
+        self.journal.commit(seq)
+
+
+    def update_cookie(
+        self,
+        id,
+        name: Optional[str] = None,
+        description: Optional[str] = None,
+        price: Optional[float] = None,
+        inventory_count: Optional[int] = None,
+        expected_version: Optional[int] = None
+    ):
+        with self.journal.state_lock:
+            updated = super().update_cookie(id, name, description, price, inventory_count, expected_version)
+            if not updated:
+                return updated
+            seq = self.journal.write({'op': 'put_cookie', 'cookie': _cookie_record(self[id])})
+        self.journal.commit(seq)
+        return updated
+
+
+    def remove(self, id):
+        with self.journal.state_lock:
+            super().remove(id)
+            seq = self.journal.write({'op': 'delete_cookie', 'id': id})
+        self.journal.commit(seq)
+
+
+    def apply_batch(self, operations, atomic: bool = False):
+        # The whole batch goes in one record, so replay applies all of it or (if the write was torn) none
+        with self.journal.state_lock:
+            results = super().apply_batch(operations, atomic)
+            records = []
+            for result in results:
+                if isinstance(result, Cookie):
+                    records.append({'op': 'put_cookie', 'cookie': _cookie_record(result)})
+                elif not isinstance(result, Exception):    # A missing cookie or unchanged patch wrote nothing
+                    records.append({'op': 'delete_cookie', 'id': result})
+            seq = self.journal.write({'op': 'batch', 'records': records})
+        self.journal.commit(seq)
+        return results
+
+
+    def reserve_inventory(self, cookies_and_quantities):
+        with self.journal.state_lock:
+            super().reserve_inventory(cookies_and_quantities)
+            seq = self._write_cookies(cookies_and_quantities)
+        self.journal.commit(seq)
+
+
+    def reserve_inventory_batch(self, reservations):
+        with self.journal.state_lock:
+            results = super().reserve_inventory_batch(reservations)
+            seq = self._write_cookies({id for reservation in reservations for id in reservation})
+        self.journal.commit(seq)
+        return results
+
+
+    def release_inventory(self, cookies_and_quantities):
+        with self.journal.state_lock:
+            super().release_inventory(cookies_and_quantities)
+            seq = self._write_cookies(cookies_and_quantities)
+        self.journal.commit(seq)
+
+
+    def _write_cookies(self, ids):
+        # One record for every cookie a reservation touched, so a torn write can't leave half of it
+        touched = [_cookie_record(self[id]) for id in ids if id in self]
+        return self.journal.write({'op': 'put_cookies', 'cookies': touched})
+
+
+
+class JournaledOrderStore(OrderStore):
+
+    def __init__(self, journal: Journal, pricing=None):
+
+        '''
+            Constructor for an empty order store that logs its mutations to the given journal
+        '''
+
+        super().__init__(pricing)
+        self.journal = journal
+
+
+    def add(self, order: Order):
+        with self.journal.state_lock:
+            super().add(order)
+            seq = self.journal.write({'op': 'put_order', 'order': _order_record(order)})
+        self.journal.commit(seq)
+
+
+    def add_many(self, orders):
+        with self.journal.state_lock:
+            super().add_many(orders)
+            seq = self.journal.write({'op': 'batch', 'records': [{'op': 'put_order', 'order': _order_record(order)} for order in orders]})
+        self.journal.commit(seq)
+
+
+    def set_cookies_and_quantities(self, id, cookies_and_quantities):
+        with self.journal.state_lock:
+            super().set_cookies_and_quantities(id, cookies_and_quantities)
+            seq = self.journal.write({'op': 'put_order', 'order': _order_record(self[id])})
+        self.journal.commit(seq)
+
+
+    def set_status(self, id, status, from_statuses=None, expected_version=None):
+        with self.journal.state_lock:
+            super().set_status(id, status, from_statuses, expected_version)
+            seq = self.journal.write({'op': 'put_order', 'order': _order_record(self[id])})
+        self.journal.commit(seq)
+
+    def set_statuses(self, changes):
+        with self.journal.state_lock:
+            results = super().set_statuses(changes)
+            seq = self.journal.write({'op': 'batch', 'records': [
+                {'op': 'put_order', 'order': _order_record(result)} for result in results if isinstance(result, Order)
+            ]})
+        self.journal.commit(seq)
+        return results
+
+    # reprice_cookie only changes totals, which are rebuilt from the cookie prices on replay
+
+
+
+def open_journaled_stores(journal: Journal, seed_cookies=(), seed_orders=()):
+    '''
+        Rebuild the cookie and order stores from the journal's snapshot and log tail, and hook them up
+        so later mutations get logged. If the journal is brand new, the seed cookies and orders are added
+        (and logged) instead. Returns (cookie store, order store).
+    '''
+    state, records = journal.load()
+    is_new = state is None and not records
+
+    cookie_store = JournaledCookieStore(journal)
+    order_store = JournaledOrderStore(journal, CatalogPricing(cookie_store))    # Priced from the rebuilt catalog until use_stores
+
+    if is_new:
+        # Copies, so the seed's own stores (and their indexes) aren't changed behind their back
+        for cookie in seed_cookies:
+            cookie_store.add(Cookie.from_storage(**_cookie_record(cookie)))
+        for order in seed_orders:
+            order_store.add(Order.from_storage(
+                order.id, dict(order.cookies_and_quantities), order.order_date, order.deliver_date, order.status, order.total_amount, order.version
+            ))
+
+    else:
+        state = state or {'cookies': [], 'orders': [], 'next_cookie_id': 0, 'next_order_id': 0}
+
+        # Fold the log tail into the snapshot (last write wins), then build the stores once
+        cookie_data = {cookie['id']: cookie for cookie in state['cookies']}
+        order_data = {order['id']: order for order in state['orders']}
+        next_cookie_id, next_order_id = state['next_cookie_id'], state['next_order_id']
+
+        def fold(record):
+            nonlocal next_cookie_id, next_order_id
+            op = record['op']
+            if op == 'put_cookie':
+                cookie_data[record['cookie']['id']] = record['cookie']
+                next_cookie_id = max(next_cookie_id, record['cookie']['id'] + 1)
+            elif op == 'put_cookies':
+                for cookie in record['cookies']:
+                    cookie_data[cookie['id']] = cookie
+            elif op == 'delete_cookie':
+                cookie_data.pop(record['id'], None)
+                next_cookie_id = max(next_cookie_id, record['id'] + 1)
+            elif op == 'put_order':
+                order_data[record['order']['id']] = record['order']
+                next_order_id = max(next_order_id, record['order']['id'] + 1)
+            elif op == 'batch':
+                for inner in record['records']:
+                    fold(inner)
+
+        for record in records:
+            fold(record)
+
+        # Bypass the logging overrides, these are already in the journal
+        for id in sorted(cookie_data):
+            CookieStore.add(cookie_store, Cookie.from_storage(**cookie_data[id]))
+
+        for id in sorted(order_data):
+            OrderStore.add(order_store, _order_from_record(order_data[id]))
+
+        # Never hand out an ID that's already been used
+        Cookie._id_counter.advance_to(next_cookie_id)
+        Order._id_counter.advance_to(next_order_id)
+
+    def snapshot_state():
+        return {
+            'cookies': [_cookie_record(cookie) for cookie in cookie_store.values()],
+            'orders': [_order_record(order) for order in order_store.values()],
+            'next_cookie_id': Cookie._id_counter.peek(),
+            'next_order_id': Order._id_counter.peek(),
+        }
+
+    journal.snapshot_source = snapshot_state
+
+    return cookie_store, order_store
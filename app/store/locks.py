@@ -0,0 +1,40 @@
+'''
+    Striped locks, for serializing writes to the same record without one store-wide lock
+'''
+import threading
+from contextlib import contextmanager
+
+
+class StripedLock:
+
+    def __init__(self, stripes: int = 64):
+
+        '''
+            Constructor for a fixed pool of locks that keys are hashed onto
+        '''
+
+        self._locks = tuple(threading.Lock() for _ in range(stripes))
+
+
+    def lock_for(self, key):
+        '''
+            Get the lock guarding the given key. Keys that share a stripe also share the lock,
+            which costs a little contention but never correctness.
+        '''
+        return self._locks[hash(key) % len(self._locks)]
+
+
+    @contextmanager
+    def lock_many(self, keys):
+        '''
+            Hold the locks for all the given keys at once. Stripes are always taken in the same order,
+            so two threads locking overlapping sets of keys can't deadlock.
+        '''
+        stripes = sorted({hash(key) % len(self._locks) for key in keys})
+        for stripe in stripes:
+            self._locks[stripe].acquire()
+        try:
+            yield
+        finally:
+            for stripe in reversed(stripes):
+                self._locks[stripe].release()
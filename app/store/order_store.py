@@ -0,0 +1,349 @@
+'''
+    In-memory Order storage with a reverse index for keeping order totals fresh,
+    sorted indexes for date and total amount range queries, and per-status buckets kept in ID order.
+
+    Safe to share between threads, the same way as CookieStore: a striped lock per order for writes,
+    small locks inside each index, and changed orders swapped in whole.
+'''
+import copy
+import threading
+from bisect import bisect_right
+from datetime import datetime
+from itertools import islice
+from typing import Optional
+from app.models.order import Order
+from app.store.base import OrderRepository, VersionConflict
+from app.store.locks import StripedLock
+from app.store.sorted_index import SORT_LIMIT, SortedIndex
+from app.store.versions import ChangeCounter
+
+
+def date_key(date: datetime):
+    # Index dates by POSIX timestamp so naive (local) and timezone-aware datetimes sort together
+    return date.timestamp()
+
+
+class OrderStore(OrderRepository):
+
+    def __init__(self, pricing=None):
+
+        '''
+            Constructor for a new, empty OrderStore, settling order totals through the given pricing service
+        '''
+
+        self.pricing = pricing  # CatalogPricing the totals come from (None keeps the totals orders come with)
+        self._orders = {}   # Maps Order IDs to Order objects
+        self._order_ids_by_cookie = {}  # Maps Cookie IDs to the set of Order IDs containing that cookie
+
+        # Sorted indexes for range queries on (order_date, deliver_date, total_amount), in that order
+        self._indexes = (SortedIndex(), SortedIndex(), SortedIndex())
+        self._id_index = SortedIndex()  # Order IDs, for resuming ID-ordered scans
+        self._index_keys = {}   # Maps Order IDs to the keys they are indexed under, in the same order
+
+        # One bucket of Order IDs per status, sorted so a page can resume from its cursor
+        self._ids_by_status = {status: SortedIndex() for status in Order.OrderStatus}
+
+        self._record_locks = StripedLock()  # Serializes writes to the same order
+        self._status_lock = threading.Lock()    # Guards the status buckets
+        self._cookie_index_lock = threading.Lock()  # Guards the reverse index
+        self._changes = ChangeCounter()     # Counts writes, for the collection's ETag
+
+
+
+    # Mapping Methods (so the store reads like the plain dict it replaces)
+    # ------------------------ #
+
+    def __contains__(self, id):
+        return id in self._orders
+
+    def __getitem__(self, id):
+        return self._orders[id]
+
+    def __iter__(self):
+        return iter(list(self._orders))     # A copy, so writes on other threads can't break the iteration
+
+    def __len__(self):
+        return len(self._orders)
+
+    def get(self, id, default=None):
+        return self._orders.get(id, default)
+
+    def values(self):
+        return list(self._orders.values())
+
+
+
+    # Write Methods
+    # ------------------------ #
+
+    def add(self, order: Order):
+        '''
+            Store an order and index the cookies it contains
+        '''
+        with self._record_locks.lock_for(order.id):
+            self._store(order)
+
+
+    def add_many(self, orders):
+        '''
+            Store several orders as one write
+        '''
+        with self._record_locks.lock_many([order.id for order in orders]):
+            for order in orders:
+                self._store(order)
+
+
+    def set_cookies_and_quantities(self, id, cookies_and_quantities):
+        '''
+            Replace the cookies in a stored order. Use this rather than Order.set_cookies_and_quantities
+            on a stored order so the reverse index follows the change.
+        '''
+        with self._record_locks.lock_for(id):
+            old_order = self._orders[id]
+
+            # Change a copy, so a bad value leaves the stored order alone and readers never see it half-changed
+            order = copy.copy(old_order)
+            order.set_cookies_and_quantities(cookies_and_quantities)
+
+            # Reverse-index the new cookies before settling the total, so a price change from here on reaches it
+            self._index_cookies(order)
+            self._settle_total(order)
+
+            self._orders[id] = order
+            self._reindex(order)
+            self._unindex_cookies(old_order, keep=order.cookies_and_quantities)
+            self._changes.bump()
+
+
+    def set_status(self, id, status, from_statuses=None, expected_version=None):
+        '''
+            Change the status of a stored order, moving it to the bucket for its new status.
+            If from_statuses is given, the order must currently be in one of them or ValueError is raised.
+            If expected_version is given, the order must still be at that version or VersionConflict is raised.
+        '''
+        with self._record_locks.lock_for(id):
+            self._set_status(id, status, from_statuses, expected_version)
+
+
+    def set_statuses(self, changes):
+        '''
+            Apply several (ID, status, from_statuses) changes as one write (see OrderRepository.set_statuses)
+        '''
+        with self._record_locks.lock_many([id for id, _, _ in changes]):
+            results = []
+            for id, status, from_statuses in changes:
+                try:
+                    results.append(self._set_status(id, status, from_statuses))
+                except (KeyError, ValueError) as e:
+                    results.append(e)
+            return results
+
+
+
+    def reprice_cookie(self, cookie_id):
+        '''
+            Refresh the total of every order containing the given cookie.
+            Subscribed to the catalog pricing service, so it runs whenever a cookie's price may have changed.
+        '''
+        with self._cookie_index_lock:
+            order_ids = list(self._order_ids_by_cookie.get(cookie_id, ()))
+
+        for order_id in order_ids:
+            with self._record_locks.lock_for(order_id):
+                order = self._orders.get(order_id)
+                if order is None:
+                    continue
+
+                self._settle_total(order)
+                self._reindex(order)
+
+        # The totals aren't in an order's payload, so its version stays, but the amount filters can now match differently
+        if order_ids:
+            self._changes.bump()
+
+
+
+    # Query Methods
+    # ------------------------ #
+
+    def count_by_status(self):
+        '''
+            Get the number of orders in each status
+        '''
+        with self._status_lock:
+            return {status: len(ids) for status, ids in self._ids_by_status.items()}
+
+
+
+    def query(
+        self,
+        status: Optional[Order.OrderStatus] = None,
+        min_date: Optional[datetime] = None,
+        max_date: Optional[datetime] = None,
+        min_deliver_date: Optional[datetime] = None,
+        max_deliver_date: Optional[datetime] = None,
+        min_total_amount: Optional[float] = None,
+        max_total_amount: Optional[float] = None,
+        after_id: Optional[int] = None
+    ):
+        '''
+            Get an iterator over the orders with the given status and within the given (inclusive) ranges, in ID order.
+            Filters left as None aren't applied. The orders are walked in ID order (the status bucket's, if there is one)
+            from after_id, checking the ranges as they go, so a page only costs what it reads. A range narrow enough
+            to beat that has its few matches collected and sorted instead.
+            after_id resumes just past that order ID (keyset pagination).
+        '''
+
+        # (index position, min key, max key) for each range that was asked for
+        ranges = []
+        if min_date is not None or max_date is not None:
+            ranges.append((
+                0,
+                None if min_date is None else date_key(min_date),
+                None if max_date is None else date_key(max_date),
+            ))
+        if min_deliver_date is not None or max_deliver_date is not None:
+            ranges.append((
+                1,
+                None if min_deliver_date is None else date_key(min_deliver_date),
+                None if max_deliver_date is None else date_key(max_deliver_date),
+            ))
+        if min_total_amount is not None or max_total_amount is not None:
+            ranges.append((2, min_total_amount, max_total_amount))
+
+        # Walk the status bucket, or every order, in ID order
+        id_index = self._id_index if status is None else self._ids_by_status[status]
+        after = None if after_id is None else (after_id, after_id)
+        if not ranges:
+            return self._existing_orders(id_index.range(after=after))
+
+        # ...unless the narrowest range matches few enough orders to sort
+        ranges.sort(key=lambda r: self._indexes[r[0]].count(r[1], r[2]))
+        (pos, min_key, max_key), other_ranges = ranges[0], ranges[1:]
+        count = self._indexes[pos].count(min_key, max_key)
+        if count > SORT_LIMIT or count >= len(id_index):
+            return self._existing_orders(order_id for order_id in id_index.range(after=after) if self._in_ranges(order_id, ranges))
+
+        matched_ids = sorted(
+            order_id for order_id in self._indexes[pos].range(min_key, max_key) if self._in_ranges(order_id, other_ranges)
+        )
+        orders = self._orders_after(matched_ids, after_id)
+        return orders if status is None else (order for order in orders if order.status == status)
+
+
+
+    # Version Methods (for ETags)
+    # ------------------------ #
+
+    def collection_tag(self):
+        return self._changes.collection_tag()
+
+    def record_tag(self, order):
+        return self._changes.record_tag(order)
+
+
+
+    # Helper Methods:
+    # ------------------------ #
+
+    # Writes, called with the record lock for the order held
+
+    def _store(self, order):
+        # Reverse-index the cookies before settling the total, so a price change since the order was
+        # priced (or from here on) reaches it, and the amount index gets the settled total
+        self._index_cookies(order)
+        self._settle_total(order)
+
+        old_order = self._orders.get(order.id)
+        if old_order is not None:  # Replacing an order, so drop the old one from the indexes
+            self._unindex_cookies(old_order, keep=order.cookies_and_quantities)
+            self._unindex(old_order)
+        else:
+            self._id_index.add(order.id, order.id)
+
+        self._orders[order.id] = order
+        self._index(order)
+
+        # Moved in one step, so the counts never miss the order
+        with self._status_lock:
+            if old_order is not None:
+                self._ids_by_status[old_order.status].remove(order.id, order.id)
+            self._ids_by_status[order.status].add(order.id, order.id)
+
+        self._changes.bump()
+
+    def _set_status(self, id, status, from_statuses, expected_version=None):
+        old_order = self._orders[id]
+        if expected_version is not None and old_order.version != expected_version:
+            raise VersionConflict(id, old_order.version)
+        if from_statuses is not None and old_order.status not in from_statuses:
+            raise ValueError(f"Cannot transition from {old_order.status.name} to {status.name}.")
+
+        # Change a copy, so each caller keeps the order as it was right after its own change
+        order = copy.copy(old_order)
+        order.set_status(status)  # Validates the status before either bucket is touched
+        self._orders[id] = order
+
+        with self._status_lock:
+            self._ids_by_status[old_order.status].remove(id, id)
+            self._ids_by_status[status].add(id, id)
+
+        self._changes.bump()
+        return order
+
+    def _orders_after(self, sorted_ids, after_id):
+        # Iterate the orders for an ascending list of IDs, starting past after_id
+        start = 0 if after_id is None else bisect_right(sorted_ids, after_id)
+        return self._existing_orders(islice(sorted_ids, start, None))
+
+    def _existing_orders(self, order_ids):
+        # Look up each ID, skipping any an index still held while it was being replaced on another thread
+        for order_id in order_ids:
+            order = self._orders.get(order_id)
+            if order is not None:
+                yield order
+
+    def _in_ranges(self, order_id, ranges):
+        # Whether an order's index keys are within every (index position, min key, max key) range
+        keys = self._index_keys.get(order_id)
+        if keys is None:    # Being re-indexed or removed on another thread
+            return False
+        return all((lo is None or keys[pos] >= lo) and (hi is None or keys[pos] <= hi) for pos, lo, hi in ranges)
+
+    def _index(self, order):
+        keys = (date_key(order.order_date), date_key(order.deliver_date), order.total_amount)
+        self._index_keys[order.id] = keys
+
+        for index, key in zip(self._indexes, keys):
+            index.add(key, order.id)
+
+    def _reindex(self, order):
+        old_keys = self._index_keys[order.id]
+        keys = (date_key(order.order_date), date_key(order.deliver_date), order.total_amount)
+        self._index_keys[order.id] = keys
+
+        for index, old_key, key in zip(self._indexes, old_keys, keys):
+            index.move(old_key, key, order.id)
+
+    def _unindex(self, order):
+        keys = self._index_keys.pop(order.id)
+
+        for index, key in zip(self._indexes, keys):
+            index.remove(key, order.id)
+
+    def _index_cookies(self, order):
+        with self._cookie_index_lock:
+            for cookie_id in order.cookies_and_quantities:
+                self._order_ids_by_cookie.setdefault(cookie_id, set()).add(order.id)
+
+    def _unindex_cookies(self, order, keep=()):
+        # Cookies in keep stay indexed for this order
+        with self._cookie_index_lock:
+            for cookie_id in order.cookies_and_quantities:
+                if cookie_id in keep:
+                    continue
+                order_ids = self._order_ids_by_cookie.get(cookie_id)
+                if order_ids is not None:
+                    order_ids.discard(order.id)
+                    if not order_ids:
+                        del self._order_ids_by_cookie[cookie_id]
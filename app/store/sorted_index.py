@@ -0,0 +1,107 @@
+'''
+    Sorted secondary index backed by a bisect-maintained array
+'''
+import threading
+from bisect import bisect_left, bisect_right, insort
+
+
+# How many entries range() copies out per trip under the lock
+RANGE_CHUNK_SIZE = 256
+
+# Up to how many IDs a query collects from a range and sorts into ID order. Wider ranges are cheaper to
+# check while walking the ID index from the cursor, since a page then only costs the entries it reads
+SORT_LIMIT = 1024
+
+
+class SortedIndex:
+
+    def __init__(self):
+
+        '''
+            Constructor for a new, empty SortedIndex
+        '''
+
+        self._entries = []  # Sorted list of (key, ID) pairs. The ID breaks ties so every entry is unique
+        self._lock = threading.Lock()   # Held only for the bisect + insert/delete/slice itself
+
+
+    def __len__(self):
+        return len(self._entries)
+
+
+    def add(self, key, id):
+        '''
+            Index an ID under the given key
+        '''
+        with self._lock:
+            insort(self._entries, (key, id))
+
+
+    def remove(self, key, id):
+        '''
+            Remove an ID that was indexed under the given key. Does nothing if it isn't there.
+        '''
+        with self._lock:
+            idx = bisect_left(self._entries, (key, id))
+            if idx < len(self._entries) and self._entries[idx] == (key, id):
+                del self._entries[idx]
+
+
+    def move(self, old_key, new_key, id):
+        '''
+            Re-index an ID from old_key to new_key in one step, so concurrent readers never find it missing
+        '''
+        if old_key == new_key:
+            return
+        with self._lock:
+            insort(self._entries, (new_key, id))
+            idx = bisect_left(self._entries, (old_key, id))
+            if idx < len(self._entries) and self._entries[idx] == (old_key, id):
+                del self._entries[idx]
+
+
+    def _bounds(self, min_key=None, max_key=None):
+        # First and one-past-last positions of the entries with min_key <= key <= max_key
+        start = 0 if min_key is None else bisect_left(self._entries, (min_key,))
+        end = len(self._entries) if max_key is None else bisect_right(self._entries, (max_key, float('inf')))
+        return start, max(start, end)
+
+
+    def count(self, min_key=None, max_key=None):
+        '''
+            Count the IDs with min_key <= key <= max_key (either bound may be None) in O(log n)
+        '''
+        with self._lock:
+            start, end = self._bounds(min_key, max_key)
+        return end - start
+
+
+    def range(self, min_key=None, max_key=None, reverse=False, after=None):
+        '''
+            Yield the IDs with min_key <= key <= max_key (either bound may be None), in key order
+            (or reverse key order). Entries are copied out a chunk at a time, so stopping early is cheap.
+            after=(key, ID) resumes just past that entry in iteration order, even if it has since been removed.
+
+            Safe to iterate while other threads write: each chunk re-finds its place from the last entry
+            yielded, so inserts and deletes elsewhere in the array never make it skip or repeat an entry.
+        '''
+        while True:
+            with self._lock:
+                start, end = self._bounds(min_key, max_key)
+                if after is not None:
+                    if reverse:
+                        end = min(end, bisect_left(self._entries, after))
+                    else:
+                        start = max(start, bisect_right(self._entries, after))
+
+                if reverse:
+                    chunk = self._entries[max(start, end - RANGE_CHUNK_SIZE):end][::-1]
+                else:
+                    chunk = self._entries[start:min(end, start + RANGE_CHUNK_SIZE)]
+
+            for _, id in chunk:
+                yield id
+
+            if len(chunk) < RANGE_CHUNK_SIZE:
+                return
+            after = chunk[-1]
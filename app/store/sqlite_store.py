@@ -0,0 +1,651 @@
+'''
+    SQLite storage backend for cookies and orders
+'''
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Optional
+
+from app.models.cookie import Cookie
+from app.models.order import Order
+from app.store.base import CookieRepository, InventoryError, OrderRepository, VersionConflict, unchanged_patch
+from app.store.cookie_store import parse_sort
+from app.store.order_store import date_key
+
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS cookies (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,   -- AUTOINCREMENT so deleted IDs are never handed out again
+    name TEXT NOT NULL,
+    name_lower TEXT NOT NULL,   -- Lowercased in Python, so searches match str.lower() exactly
+    description TEXT NOT NULL,
+    price NOT NULL,     -- No type affinity, so ints and floats come back as they went in
+    inventory_count INTEGER NOT NULL,
+    version INTEGER NOT NULL DEFAULT 1  -- Goes up on every change, for ETags
+);
+CREATE INDEX IF NOT EXISTS cookies_by_price ON cookies (price, id);
+CREATE INDEX IF NOT EXISTS cookies_by_name ON cookies (name_lower, id);
+
+CREATE TABLE IF NOT EXISTS orders (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    cookies_and_quantities TEXT NOT NULL,   -- JSON object (Cookie ID --> Number)
+    order_date TEXT NOT NULL,   -- ISO 8601, keeps the timezone (if any)
+    order_date_key REAL NOT NULL,   -- POSIX timestamp, for range queries
+    deliver_date TEXT NOT NULL,
+    deliver_date_key REAL NOT NULL,
+    status TEXT NOT NULL,
+    total_amount REAL NOT NULL,
+    version INTEGER NOT NULL DEFAULT 1
+);
+CREATE INDEX IF NOT EXISTS orders_by_order_date ON orders (order_date_key);
+CREATE INDEX IF NOT EXISTS orders_by_deliver_date ON orders (deliver_date_key);
+CREATE INDEX IF NOT EXISTS orders_by_total_amount ON orders (total_amount);
+CREATE INDEX IF NOT EXISTS orders_by_status ON orders (status, id);
+
+-- Reverse index (Cookie ID --> Order IDs) for re-pricing order totals
+CREATE TABLE IF NOT EXISTS order_items (
+    cookie_id INTEGER NOT NULL,
+    order_id INTEGER NOT NULL,
+    quantity INTEGER NOT NULL,
+    PRIMARY KEY (cookie_id, order_id)
+) WITHOUT ROWID;
+
+-- Write counter per table, bumped in the same transaction as every write, for the collections' ETags
+CREATE TABLE IF NOT EXISTS collection_versions (
+    name TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+) WITHOUT ROWID;
+INSERT OR IGNORE INTO collection_versions (name, version) VALUES ('cookies', 1), ('orders', 1);
+'''
+
+# Columns added since the first schema, added to databases made before them: table --> [(column, definition)]
+MIGRATIONS = {
+    'cookies': [('version', 'INTEGER NOT NULL DEFAULT 1')],
+    'orders': [('version', 'INTEGER NOT NULL DEFAULT 1')],
+}
+
+
+
+class SqliteDatabase:
+
+    def __init__(self, path: str):
+
+        '''
+            Constructor for a SQLite database at the given file path. Creates the tables if they're missing.
+        '''
+
+        self.path = path
+        self._local = threading.local()     # One connection per thread, reused across requests
+
+        conn = self.connection()
+        conn.executescript(SCHEMA)
+
+        for table, columns in MIGRATIONS.items():
+            existing = {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+            for column, definition in columns:
+                if column not in existing:
+                    conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+
+
+    def connection(self):
+        '''
+            Get this thread's connection, opening it on first use (or after a fork into a new worker)
+        '''
+        conn = getattr(self._local, 'conn', None)
+
+        if conn is None or self._local.pid != os.getpid():
+            # Autocommit mode: single statements commit on their own, transaction() groups the rest.
+            # Statements are always the same parameterized strings, so the statement cache reuses them
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, cached_statements=256)
+            conn.execute('PRAGMA journal_mode=WAL')     # Readers don't block the writer (and vice versa)
+            conn.execute('PRAGMA synchronous=NORMAL')   # Safe with WAL, far fewer fsyncs
+
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+
+        return conn
+
+
+
+    @contextmanager
+    def transaction(self):
+        '''
+            Run a block of statements as one write transaction. Takes the write lock up front
+            so read-modify-write blocks can't interleave with another worker's writes.
+        '''
+        conn = self.connection()
+
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        else:
+            conn.execute('COMMIT')
+
+
+
+def _bump_collection(conn, name):
+    # Call inside the write's transaction, so the new tag and the write become visible together
+    conn.execute('UPDATE collection_versions SET version = version + 1 WHERE name = ?', (name,))
+
+
+def _collection_tag(database, name):
+    return str(database.connection().execute('SELECT version FROM collection_versions WHERE name = ?', (name,)).fetchone()[0])
+
+
+
+# Cookies
+# ----------------------------------------------------------------- ##
+
+COOKIE_COLUMNS = 'id, name, description, price, inventory_count, version'
+
+# Column each sort key is ordered by
+COOKIE_SORT_COLUMNS = {'id': 'id', 'name': 'name_lower', 'price': 'price'}
+
+
+def _cookie_from_row(row):
+    return Cookie.from_storage(*row)
+
+
+class SqliteCookieStore(CookieRepository):
+
+    def __init__(self, database: SqliteDatabase):
+
+        '''
+            Constructor for a cookie store kept in the given database
+        '''
+
+        self.database = database
+
+
+
+    # Mapping Methods
+    # ------------------------ #
+
+    def __contains__(self, id):
+        row = self.database.connection().execute('SELECT 1 FROM cookies WHERE id = ?', (id,)).fetchone()
+        return row is not None
+
+    def __getitem__(self, id):
+        row = self.database.connection().execute(f'SELECT {COOKIE_COLUMNS} FROM cookies WHERE id = ?', (id,)).fetchone()
+        if row is None:
+            raise KeyError(id)
+        return _cookie_from_row(row)
+
+    def __iter__(self):
+        return (row[0] for row in self.database.connection().execute('SELECT id FROM cookies ORDER BY id'))
+
+    def __len__(self):
+        return self.database.connection().execute('SELECT COUNT(*) FROM cookies').fetchone()[0]
+
+    def values(self):
+        rows = self.database.connection().execute(f'SELECT {COOKIE_COLUMNS} FROM cookies ORDER BY id')
+        return (_cookie_from_row(row) for row in rows)
+
+
+
+    # Write Methods
+    # ------------------------ #
+
+    def add(self, cookie: Cookie):
+        '''
+            Store a new cookie. The database hands out the ID, so cookie.id is updated to match.
+        '''
+        with self.database.transaction() as conn:
+            self._insert(conn, cookie)
+            _bump_collection(conn, 'cookies')
+
+
+    def update_cookie(
+        self,
+        id,
+        name: Optional[str] = None,
+        description: Optional[str] = None,
+        price: Optional[float] = None,
+        inventory_count: Optional[int] = None,
+        expected_version: Optional[int] = None
+    ):
+        '''
+            Update a stored cookie's parameters (see Cookie.update_cookie). Returns whether anything changed.
+            If expected_version is given, the cookie must still be at that version or VersionConflict is raised.
+        '''
+        with self.database.transaction() as conn:
+            cookie = self[id]
+            if expected_version is not None and cookie.version != expected_version:
+                raise VersionConflict(id, cookie.version)
+
+            updated = cookie.update_cookie(name, description, price, inventory_count)
+
+            if updated:
+                self._write(conn, cookie)
+                _bump_collection(conn, 'cookies')
+
+        return updated
+
+
+    def remove(self, id):
+        '''
+            Delete a stored cookie
+        '''
+        with self.database.transaction() as conn:
+            cursor = conn.execute('DELETE FROM cookies WHERE id = ?', (id,))
+            if cursor.rowcount == 0:
+                raise KeyError(id)
+            _bump_collection(conn, 'cookies')
+
+
+    def apply_batch(self, operations, atomic: bool = False):
+        '''
+            Apply a batch of validated operations in a single transaction (see CookieStore.apply_batch),
+            so the whole batch costs one commit. If atomic, a missing cookie rolls all of it back.
+        '''
+        results = []
+        with self.database.transaction() as conn:
+            for operation in operations:
+                if operation[0] == 'create':
+                    self._insert(conn, operation[1])
+                    results.append(operation[1])
+                    continue
+
+                id = operation[1]
+                cookie = self.get(id)
+                if cookie is None:
+                    if atomic:
+                        raise KeyError(id)
+                    results.append(KeyError(id))
+                elif operation[0] == 'patch':
+                    if cookie.update_cookie(**operation[2]):
+                        self._write(conn, cookie)
+                        results.append(cookie)
+                    else:
+                        results.append(unchanged_patch(id))
+                else:
+                    conn.execute('DELETE FROM cookies WHERE id = ?', (id,))
+                    results.append(id)
+
+            _bump_collection(conn, 'cookies')
+
+        return results
+
+
+    def reserve_inventory(self, cookies_and_quantities):
+        '''
+            Take the given quantities out of inventory, all or nothing (see CookieRepository.reserve_inventory).
+            The write transaction makes the check and the decrement one step across processes too.
+        '''
+        with self.database.transaction() as conn:
+            self._reserve(conn, cookies_and_quantities)
+            _bump_collection(conn, 'cookies')
+
+
+    def reserve_inventory_batch(self, reservations):
+        '''
+            Make several reservations in a single transaction (see CookieRepository.reserve_inventory_batch)
+        '''
+        results = []
+        with self.database.transaction() as conn:
+            for reservation in reservations:
+                try:
+                    self._reserve(conn, reservation)
+                    results.append(None)
+                except InventoryError as e:
+                    results.append(e)
+            _bump_collection(conn, 'cookies')
+        return results
+
+
+    def release_inventory(self, cookies_and_quantities):
+        '''
+            Put reserved quantities back into inventory. Cookies deleted since are skipped.
+        '''
+        with self.database.transaction() as conn:
+            conn.executemany(
+                'UPDATE cookies SET inventory_count = inventory_count + ?, version = version + 1 WHERE id = ?',
+                [(quantity, id) for id, quantity in cookies_and_quantities.items() if quantity]
+            )
+            _bump_collection(conn, 'cookies')
+
+
+
+    # Query Methods
+    # ------------------------ #
+
+    def query(
+        self,
+        name_search: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        sort: str = 'id',
+        after: Optional[tuple] = None
+    ):
+        '''
+            Get an iterator over the cookies matching the filters, in sort order (same results as CookieStore.query).
+            Rows are fetched as the iterator is read, so stopping early is cheap.
+        '''
+        reverse, sort_key = parse_sort(sort)
+        column = COOKIE_SORT_COLUMNS[sort_key]
+        direction = 'DESC' if reverse else 'ASC'
+
+        conditions, params = [], []
+        if name_search:
+            conditions.append('instr(name_lower, ?) > 0')
+            params.append(name_search.lower())
+        if min_price is not None:
+            conditions.append('price >= ?')
+            params.append(min_price)
+        if max_price is not None:
+            conditions.append('price <= ?')
+            params.append(max_price)
+        if after is not None:
+            conditions.append(f'({column}, id) {"<" if reverse else ">"} (?, ?)')
+            params.extend(after)
+
+        where = f' WHERE {" AND ".join(conditions)}' if conditions else ''
+        rows = self.database.connection().execute(
+            f'SELECT {COOKIE_COLUMNS} FROM cookies{where} ORDER BY {column} {direction}, id {direction}',
+            params
+        )
+        return (_cookie_from_row(row) for row in rows)
+
+
+    def cursor_key(self, id, sort: str = 'id'):
+        '''
+            Get the (sort key, ID) position of a stored cookie, to pass to query(after=...)
+        '''
+        _, sort_key = parse_sort(sort)
+
+        row = self.database.connection().execute(
+            f'SELECT {COOKIE_SORT_COLUMNS[sort_key]} FROM cookies WHERE id = ?', (id,)
+        ).fetchone()
+        if row is None:
+            raise KeyError(id)
+
+        return (row[0], id)
+
+
+
+    # Version Methods (for ETags)
+    # ------------------------ #
+
+    def collection_tag(self):
+        return _collection_tag(self.database, 'cookies')
+
+
+
+    # Helper Methods:
+    # ------------------------ #
+
+    def _insert(self, conn, cookie):
+        # The database hands out the ID
+        cursor = conn.execute(
+            'INSERT INTO cookies (name, name_lower, description, price, inventory_count, version) VALUES (?, ?, ?, ?, ?, ?)',
+            (cookie.name, cookie.name.lower(), cookie.description, cookie.price, cookie.inventory_count, cookie.version)
+        )
+        cookie.id = cursor.lastrowid
+
+    def _reserve(self, conn, cookies_and_quantities):
+        # Check every line before touching any
+        for id, quantity in cookies_and_quantities.items():
+            row = conn.execute('SELECT inventory_count FROM cookies WHERE id = ?', (id,)).fetchone()
+            if row is None:
+                raise InventoryError(id, quantity)
+            if row[0] < quantity:
+                raise InventoryError(id, quantity, row[0])
+
+        conn.executemany(
+            'UPDATE cookies SET inventory_count = inventory_count - ?, version = version + 1 WHERE id = ?',
+            [(quantity, id) for id, quantity in cookies_and_quantities.items() if quantity]
+        )
+
+    def _write(self, conn, cookie):
+        conn.execute(
+            'UPDATE cookies SET name = ?, name_lower = ?, description = ?, price = ?, inventory_count = ?, version = ? WHERE id = ?',
+            (cookie.name, cookie.name.lower(), cookie.description, cookie.price, cookie.inventory_count, cookie.version, cookie.id)
+        )
+
+
+
+# Orders
+# ----------------------------------------------------------------- ##
+
+ORDER_COLUMNS = 'id, cookies_and_quantities, order_date, deliver_date, status, total_amount, version'
+
+
+def _order_from_row(row):
+    id, cookies_and_quantities, order_date, deliver_date, status, total_amount, version = row
+    return Order.from_storage(
+        id,
+        {int(cookie_id): quantity for cookie_id, quantity in json.loads(cookies_and_quantities).items()},
+        datetime.fromisoformat(order_date),
+        datetime.fromisoformat(deliver_date),
+        Order.OrderStatus[status],
+        total_amount,
+        version,
+    )
+
+
+class SqliteOrderStore(OrderRepository):
+
+    def __init__(self, database: SqliteDatabase, pricing=None):
+
+        '''
+            Constructor for an order store kept in the given database, settling order totals through the given pricing service
+        '''
+
+        self.database = database
+        self.pricing = pricing  # CatalogPricing the totals come from (None keeps the totals orders come with)
+
+
+
+    # Mapping Methods
+    # ------------------------ #
+
+    def __contains__(self, id):
+        row = self.database.connection().execute('SELECT 1 FROM orders WHERE id = ?', (id,)).fetchone()
+        return row is not None
+
+    def __getitem__(self, id):
+        row = self.database.connection().execute(f'SELECT {ORDER_COLUMNS} FROM orders WHERE id = ?', (id,)).fetchone()
+        if row is None:
+            raise KeyError(id)
+        return _order_from_row(row)
+
+    def __iter__(self):
+        return (row[0] for row in self.database.connection().execute('SELECT id FROM orders ORDER BY id'))
+
+    def __len__(self):
+        return self.database.connection().execute('SELECT COUNT(*) FROM orders').fetchone()[0]
+
+    def values(self):
+        rows = self.database.connection().execute(f'SELECT {ORDER_COLUMNS} FROM orders ORDER BY id')
+        return (_order_from_row(row) for row in rows)
+
+
+
+    # Write Methods
+    # ------------------------ #
+
+    def add(self, order: Order):
+        '''
+            Store a new order. The database hands out the ID, so order.id is updated to match.
+        '''
+        with self.database.transaction() as conn:
+            self._insert(conn, order)
+            _bump_collection(conn, 'orders')
+
+
+    def add_many(self, orders):
+        '''
+            Store several new orders in a single transaction. The database hands out their IDs.
+        '''
+        with self.database.transaction() as conn:
+            for order in orders:
+                self._insert(conn, order)
+            _bump_collection(conn, 'orders')
+
+
+    def set_cookies_and_quantities(self, id, cookies_and_quantities):
+        '''
+            Replace the cookies in a stored order, refreshing its total
+        '''
+        with self.database.transaction() as conn:
+            order = self[id]
+            order.set_cookies_and_quantities(cookies_and_quantities)    # Validates
+            self._settle_total(order)   # Priced in the write transaction, so no price change can land before it's stored
+
+            conn.execute(
+                'UPDATE orders SET cookies_and_quantities = ?, total_amount = ?, version = ? WHERE id = ?',
+                (json.dumps(order.cookies_and_quantities), order.total_amount, order.version, id)
+            )
+            conn.execute('DELETE FROM order_items WHERE order_id = ?', (id,))
+            self._insert_items(conn, order)
+            _bump_collection(conn, 'orders')
+
+
+    def set_status(self, id, status, from_statuses=None, expected_version=None):
+        '''
+            Change the status of a stored order. If from_statuses is given, the order must currently be in one of them,
+            and if expected_version is given, it must still be at that version.
+        '''
+        with self.database.transaction() as conn:
+            self._set_status(conn, id, status, from_statuses, expected_version)
+            _bump_collection(conn, 'orders')
+
+
+    def set_statuses(self, changes):
+        '''
+            Apply several (ID, status, from_statuses) changes in a single transaction (see OrderRepository.set_statuses)
+        '''
+        results = []
+        with self.database.transaction() as conn:
+            for id, status, from_statuses in changes:
+                try:
+                    results.append(self._set_status(conn, id, status, from_statuses))
+                except (KeyError, ValueError) as e:
+                    results.append(e)
+            _bump_collection(conn, 'orders')
+        return results
+
+
+    def reprice_cookie(self, cookie_id):
+        '''
+            Refresh the total of every order containing the given cookie
+        '''
+        with self.database.transaction() as conn:
+            rows = conn.execute(
+                f'SELECT {ORDER_COLUMNS} FROM orders WHERE id IN (SELECT order_id FROM order_items WHERE cookie_id = ?)',
+                (cookie_id,)
+            ).fetchall()
+
+            new_totals = []
+            for row in rows:
+                order = _order_from_row(row)
+                new_totals.append((self._settle_total(order), order.id))
+
+            conn.executemany('UPDATE orders SET total_amount = ? WHERE id = ?', new_totals)
+            if new_totals:
+                _bump_collection(conn, 'orders')     # For the amount filters, the payloads don't show totals
+
+
+
+    # Query Methods
+    # ------------------------ #
+
+    def count_by_status(self):
+        '''
+            Get the number of orders in each status
+        '''
+        counts = {status: 0 for status in Order.OrderStatus}
+        for status_name, count in self.database.connection().execute('SELECT status, COUNT(*) FROM orders GROUP BY status'):
+            counts[Order.OrderStatus[status_name]] = count
+        return counts
+
+
+    def query(
+        self,
+        status: Optional[Order.OrderStatus] = None,
+        min_date: Optional[datetime] = None,
+        max_date: Optional[datetime] = None,
+        min_deliver_date: Optional[datetime] = None,
+        max_deliver_date: Optional[datetime] = None,
+        min_total_amount: Optional[float] = None,
+        max_total_amount: Optional[float] = None,
+        after_id: Optional[int] = None
+    ):
+        '''
+            Get an iterator over the matching orders, in ID order (same results as OrderStore.query).
+            Rows are fetched as the iterator is read, so stopping early is cheap.
+        '''
+        conditions, params = [], []
+
+        def add_condition(condition, value):
+            if value is not None:
+                conditions.append(condition)
+                params.append(value)
+
+        add_condition('status = ?', None if status is None else status.name)
+        add_condition('order_date_key >= ?', None if min_date is None else date_key(min_date))
+        add_condition('order_date_key <= ?', None if max_date is None else date_key(max_date))
+        add_condition('deliver_date_key >= ?', None if min_deliver_date is None else date_key(min_deliver_date))
+        add_condition('deliver_date_key <= ?', None if max_deliver_date is None else date_key(max_deliver_date))
+        add_condition('total_amount >= ?', min_total_amount)
+        add_condition('total_amount <= ?', max_total_amount)
+        add_condition('id > ?', after_id)
+
+        where = f' WHERE {" AND ".join(conditions)}' if conditions else ''
+        rows = self.database.connection().execute(f'SELECT {ORDER_COLUMNS} FROM orders{where} ORDER BY id', params)
+        return (_order_from_row(row) for row in rows)
+
+
+
+    # Version Methods (for ETags)
+    # ------------------------ #
+
+    def collection_tag(self):
+        return _collection_tag(self.database, 'orders')
+
+
+
+    # Helper Methods:
+    # ------------------------ #
+
+    def _insert(self, conn, order):
+        # The database hands out the ID. Priced in the write transaction, so a price change either lands before
+        # it (and is in the total) or after it commits (and its reprice finds the order)
+        self._settle_total(order)
+        cursor = conn.execute(
+            'INSERT INTO orders (cookies_and_quantities, order_date, order_date_key, deliver_date, deliver_date_key, status, total_amount, version) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (
+                json.dumps(order.cookies_and_quantities),
+                order.order_date.isoformat(), date_key(order.order_date),
+                order.deliver_date.isoformat(), date_key(order.deliver_date),
+                order.status.name,
+                order.total_amount,
+                order.version,
+            )
+        )
+        order.id = cursor.lastrowid
+        self._insert_items(conn, order)
+
+    def _set_status(self, conn, id, status, from_statuses, expected_version=None):
+        order = self[id]
+        if expected_version is not None and order.version != expected_version:
+            raise VersionConflict(id, order.version)
+        if from_statuses is not None and order.status not in from_statuses:
+            raise ValueError(f"Cannot transition from {order.status.name} to {status.name}.")
+        order.set_status(status)    # Validates the status
+        conn.execute('UPDATE orders SET status = ?, version = ? WHERE id = ?', (status.name, order.version, id))
+        return order
+
+    def _insert_items(self, conn, order):
+        conn.executemany(
+            'INSERT INTO order_items (cookie_id, order_id, quantity) VALUES (?, ?, ?)',
+            [(cookie_id, order.id, quantity) for cookie_id, quantity in order.cookies_and_quantities.items()]
+        )
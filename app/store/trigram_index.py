@@ -0,0 +1,83 @@
+'''
+    Trigram index for case-insensitive substring search
+'''
+import threading
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class TrigramIndex:
+
+    def __init__(self):
+
+        '''
+            Constructor for a new, empty TrigramIndex
+        '''
+
+        self._texts = {}    # Maps IDs to their lowercased text
+        self._ids_by_trigram = {}   # Maps each trigram to the set of IDs whose text contains it
+        self._lock = threading.Lock()   # The ID sets are mutated in place, so searches can't read them mid-write
+
+
+    def add(self, id, text):
+        '''
+            Index (or re-index) the text for an ID
+        '''
+        lowered = text.lower()
+        with self._lock:
+            self._remove(id)
+            self._texts[id] = lowered
+            for trigram in _trigrams(lowered):
+                self._ids_by_trigram.setdefault(trigram, set()).add(id)
+
+
+    def remove(self, id):
+        '''
+            Drop an ID from the index. Does nothing if it isn't there.
+        '''
+        with self._lock:
+            self._remove(id)
+
+
+    def _remove(self, id):
+        # Called with self._lock held
+        lowered = self._texts.pop(id, None)
+        if lowered is None:
+            return
+
+        for trigram in _trigrams(lowered):
+            ids = self._ids_by_trigram[trigram]
+            ids.discard(id)
+            if not ids:
+                del self._ids_by_trigram[trigram]
+
+
+    def search(self, query):
+        '''
+            Get the IDs (in ascending order) whose text contains the query, ignoring case.
+            Same results as checking `query.lower() in text.lower()` for every text.
+        '''
+        query = query.lower()
+        trigrams = _trigrams(query)
+
+        with self._lock:
+            if trigrams:
+                # Intersect from the rarest trigram, so the candidate set only shrinks
+                id_sets = []
+                for trigram in trigrams:
+                    ids = self._ids_by_trigram.get(trigram)
+                    if not ids:
+                        return []
+                    id_sets.append(ids)
+                id_sets.sort(key=len)
+
+                candidates = set(id_sets[0])
+                for ids in id_sets[1:]:
+                    candidates &= ids
+            else:
+                candidates = self._texts  # Queries under 3 characters check every text
+
+            # Sharing trigrams doesn't guarantee a match, so confirm each candidate
+            return sorted(id for id in candidates if query in self._texts[id])
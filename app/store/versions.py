@@ -0,0 +1,42 @@
+'''
+    Change counters, so readers can tell cheaply whether an in-memory store (or one record in it) has changed
+'''
+import secrets
+import threading
+
+
+class ChangeCounter:
+
+    def __init__(self):
+
+        '''
+            Constructor for a counter of a store's writes. Its tags start with a random epoch, so tags handed out
+            before a restart (when the in-memory store starts over, reusing IDs and counts) never match again.
+        '''
+
+        self.epoch = secrets.token_hex(4)
+        self._count = 0
+        self._lock = threading.Lock()
+
+
+    def bump(self):
+        '''
+            Count a write. Call it once the write is visible, so a tag read before a response is built
+            is never newer than the data that goes into it.
+        '''
+        with self._lock:
+            self._count += 1
+
+
+    def collection_tag(self):
+        '''
+            Tag for the store as a whole, which changes on every write
+        '''
+        return f'{self.epoch}.{self._count}'
+
+
+    def record_tag(self, record):
+        '''
+            Tag for one version of a record (anything with an id and a version)
+        '''
+        return f'{self.epoch}.{record.id}.{record.version}'
@@ -0,0 +1,51 @@
+'''
+    Memory benchmark: bytes held per Cookie and per Order (run with `python -m benchmarks.model_memory`)
+'''
+import argparse
+import gc
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+from app.models.cookie import Cookie
+from app.models.order import Order
+
+
+def bytes_per(make, count):
+    '''
+        Build count objects with make(i) and return the memory they hold, per object
+    '''
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+
+    objects = [make(i) for i in range(count)]
+
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    list_overhead = 8 * count   # The list's own pointer per object isn't part of the model
+    del objects
+    return (after - before - list_overhead) / count
+
+
+def make_cookie(i):
+    return Cookie.from_storage(i, f"Cookie {i}", "A historical cookie", 1.99, 100)
+
+
+def make_order(i):
+    # Mostly one-line orders, like the historical data, with a few longer ones
+    placed = datetime(2024, 1, 1, tzinfo=timezone.utc) + timedelta(minutes=i)
+    lines = {i % 500: 1 + i % 12} if i % 4 else {i % 500: 2, (i + 1) % 500: 3, (i + 2) % 500: 1}
+    return Order.from_storage(i, lines, placed, placed + timedelta(days=3), Order.OrderStatus.DELIVERED, 9.95)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--count', type=int, default=200_000, help='Objects of each kind to build')
+    args = parser.parse_args()
+
+    print(f"Cookie: {bytes_per(make_cookie, args.count):,.0f} bytes each")
+    print(f"Order:  {bytes_per(make_order, args.count):,.0f} bytes each")
+
+
+if __name__ == '__main__':
+    main()
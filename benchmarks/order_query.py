@@ -0,0 +1,75 @@
+'''
+    Query benchmark: a filtered order listing on the row store vs the columnar store
+    (run with `python -m benchmarks.order_query`, needs numpy)
+'''
+import argparse
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from app.models.cookie import Cookie
+from app.models.order import Order
+from app.services.pricing import CatalogPricing
+from app.store.columnar_order_store import ColumnarOrderStore
+from app.store.order_store import OrderStore
+
+
+def make_catalog(count):
+    # The stores settle the order totals from this catalog, so the cookies the orders contain need prices
+    rng = random.Random(7)
+    return {id: Cookie.from_storage(id, f'Cookie {id}', 'A cookie from the benchmark catalog', round(rng.uniform(0.5, 16), 2), 10**9) for id in range(count)}
+
+
+def make_orders(count):
+    rng = random.Random(42)
+    start = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    statuses = list(Order.OrderStatus)
+    for id in range(count):
+        placed = start + timedelta(minutes=rng.randrange(5 * 365 * 24 * 60))
+        yield Order.from_storage(
+            id, {rng.randrange(500): rng.randrange(1, 12)}, placed, placed + timedelta(days=rng.randrange(1, 14)),
+            rng.choice(statuses), 0.0   # Settled by the stores
+        )
+
+
+def best_of(runs, query):
+    # Fastest of several runs of a query, read to the end, in milliseconds, and how many orders it matched
+    best, matched = float('inf'), 0
+    for _ in range(runs):
+        started = time.perf_counter()
+        matched = sum(1 for _ in query())
+        best = min(best, time.perf_counter() - started)
+    return best * 1000, matched
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--count', type=int, default=1_000_000, help='Orders to load')
+    parser.add_argument('--runs', type=int, default=5, help='Runs per query (the fastest is reported)')
+    args = parser.parse_args()
+
+    pricing = CatalogPricing(make_catalog(500))
+    orders = list(make_orders(args.count))
+    stores = {'row': OrderStore(pricing), 'columnar': ColumnarOrderStore(pricing)}
+    for store in stores.values():
+        store.add_many(orders)
+
+    filters = {
+        'status': Order.OrderStatus.DELIVERED,
+        'min_date': datetime(2022, 1, 1, tzinfo=timezone.utc),
+        'max_date': datetime(2023, 1, 1, tzinfo=timezone.utc),
+        'min_total_amount': 50.0,
+        'max_total_amount': 100.0,
+    }
+    print(f"{args.count:,} orders, status + order date + total amount filter:")
+    for name, store in stores.items():
+        ms, matched = best_of(args.runs, lambda: store.query(**filters))
+        print(f"  {name:>8}: {ms:10,.1f} ms ({matched:,} matches)")
+
+    print("Counts per status:")
+    for name, store in stores.items():
+        ms, _ = best_of(args.runs, lambda: store.count_by_status().values())
+        print(f"  {name:>8}: {ms:10,.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,300 @@
+'''
+    Benchmark suite for the API hot paths: catalog search, paginated listing, order filtering, order creation
+    and status patching, each run through the Flask test client (api) and straight against the stores (store).
+    Reports throughput and latency percentiles as JSON, to compare commits
+    (run with `python -m benchmarks.suite --cookies 100000 --orders 100000 --output before.json`)
+'''
+import argparse
+import itertools
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from app import create_app, use_stores
+from app.models.cookie import Cookie
+from app.models.order import Order
+from app.routes import cookie_routes as cookie_routes_module, order_routes as order_routes_module
+from app.store.cookie_store import CookieStore
+from app.store.order_store import OrderStore
+
+
+FLAVOURS = ('Chocolate', 'Oatmeal', 'Peanut', 'Ginger', 'Lemon', 'Almond', 'Coconut', 'Raisin', 'Maple', 'Pecan')
+STYLES = ('Chip', 'Crunch', 'Snap', 'Swirl', 'Drop', 'Bar', 'Crinkle', 'Sandwich')
+SEARCH_TERMS = ('choc', 'ginger snap', 'lemon', 'nut', 'swirl 12', 'crinkle', 'maple bar', 'zzz')
+PER_PAGE = 50
+START = datetime(2021, 1, 1, tzinfo=timezone.utc)
+
+
+# Seeding
+# ------------------------ #
+
+def seed_stores(cookie_count, order_count, seed):
+    '''
+        Build a cookie store and an order store with realistic, reproducible data, and point the app at them
+    '''
+    rng = random.Random(seed)
+
+    cookie_store = CookieStore()
+    for id in range(1, cookie_count + 1):
+        name = f'{rng.choice(FLAVOURS)} {rng.choice(STYLES)} {id}'
+        cookie_store.add(Cookie.from_storage(id, name, 'A cookie from the benchmark catalog', round(rng.uniform(0.5, 8), 2), 10**9))
+    Cookie._id_counter.reset(cookie_count + 1)
+
+    statuses = list(Order.OrderStatus)
+    orders = []
+    for id in range(1, order_count + 1):
+        placed = START + timedelta(minutes=rng.randrange(3 * 365 * 24 * 60))
+        lines = {rng.randrange(1, cookie_count + 1): rng.randrange(1, 12) for _ in range(rng.choice((1, 1, 1, 2, 3)))}
+        orders.append(Order.from_storage(id, lines, placed, placed + timedelta(days=rng.randrange(1, 14)), rng.choice(statuses), 0.0))
+
+    # The order store settles the totals through the pricing service use_stores gives it, so wire it up first
+    order_store = OrderStore()
+    use_stores(cookie_store, order_store)
+    order_store.add_many(orders)
+    Order._id_counter.reset(order_count + 1)
+    return cookie_store, order_store
+
+
+def order_filters(rng):
+    '''
+        An endless mix of status, date and amount filters, as store keyword arguments
+    '''
+    while True:
+        min_date = START + timedelta(days=rng.randrange(3 * 365 - 30))
+        low = rng.uniform(1, 60)
+        yield rng.choice((
+            {'status': rng.choice(list(Order.OrderStatus))},
+            {'min_date': min_date, 'max_date': min_date + timedelta(days=30)},
+            {'min_total_amount': low, 'max_total_amount': low + 5},
+            {'status': Order.OrderStatus.DELIVERED, 'min_date': min_date, 'max_date': min_date + timedelta(days=90), 'min_total_amount': low},
+        ))
+
+
+def query_string(filters):
+    # Store keyword arguments --> the same filters as listing query arguments
+    params = {}
+    for name, value in filters.items():
+        if isinstance(value, Order.OrderStatus):
+            value = value.name
+        elif isinstance(value, datetime):
+            value = value.isoformat()
+        params[name] = value
+    return params
+
+
+
+# Scenarios (each sets up and returns a callable doing one operation)
+# ------------------------ #
+
+def api_scenarios(client, cookie_store, order_store, rng):
+
+    def catalog_search():
+        terms = itertools.cycle(SEARCH_TERMS)
+        return lambda: client.get('/api/cookies/', query_string={'name_search': next(terms), 'per_page': PER_PAGE})
+
+    def paginated_listing():
+        cursor = ['']
+        def next_page():
+            response = client.get('/api/cookies/', query_string={'cursor': cursor[0], 'per_page': PER_PAGE, 'sort': 'price'})
+            cursor[0] = response.headers.get('X-Next-Cursor', '')
+            return response
+        return next_page
+
+    def order_filtering():
+        filters = order_filters(rng)
+        return lambda: client.get('/api/orders/', query_string=dict(query_string(next(filters)), per_page=PER_PAGE))
+
+    def order_creation():
+        deliver_date = (datetime.now(timezone.utc) + timedelta(days=3)).isoformat()
+        def create():
+            lines = {str(rng.randrange(1, len(cookie_store) + 1)): rng.randrange(1, 5)}
+            return client.post('/api/orders/', json={'cookies_and_quantities': lines, 'deliver_date': deliver_date})
+        return create
+
+    def status_patching():
+        changes = status_changes(order_store)
+        def patch():
+            id, status = next(changes)
+            return client.patch(f'/api/orders/{id}', json={'status': status})
+        return patch
+
+    return {
+        'catalog_search': catalog_search,
+        'paginated_listing': paginated_listing,
+        'order_filtering': order_filtering,
+        'order_creation': order_creation,
+        'status_patching': status_patching,
+    }
+
+
+def store_scenarios(client, cookie_store, order_store, rng):
+
+    def catalog_search():
+        terms = itertools.cycle(SEARCH_TERMS)
+        return lambda: list(itertools.islice(cookie_store.query(name_search=next(terms)), PER_PAGE))
+
+    def paginated_listing():
+        after = [None]
+        def next_page():
+            page = list(itertools.islice(cookie_store.query(sort='price', after=after[0]), PER_PAGE))
+            after[0] = cookie_store.cursor_key(page[-1].id, 'price') if len(page) == PER_PAGE else None
+            return page
+        return next_page
+
+    def order_filtering():
+        filters = order_filters(rng)
+        return lambda: list(itertools.islice(order_store.query(**next(filters)), PER_PAGE))
+
+    def order_creation():
+        deliver_date = datetime.now(timezone.utc) + timedelta(days=3)
+        def create():
+            lines = {rng.randrange(1, len(cookie_store) + 1): rng.randrange(1, 5)}
+            order = Order(lines, datetime.now(timezone.utc), deliver_date, Order.OrderStatus.PENDING)
+            cookie_store.reserve_inventory(lines)
+            order_store.add(order)
+            return order
+        return create
+
+    def status_patching():
+        changes = status_changes(order_store)
+        def patch():
+            id, status = next(changes)
+            return order_store.set_status(id, Order.OrderStatus[status], (order_store[id].status,))
+        return patch
+
+    return {
+        'catalog_search': catalog_search,
+        'paginated_listing': paginated_listing,
+        'order_filtering': order_filtering,
+        'order_creation': order_creation,
+        'status_patching': status_patching,
+    }
+
+
+def status_changes(order_store):
+    '''
+        An endless supply of (order ID, next status) moves along the valid transitions.
+        Orders are walked PENDING -> COOKING -> SHIPPING -> DELIVERED, and new PENDING orders are made as they run out.
+    '''
+    while True:
+        open_ids = [order.id for order in order_store.query(status=Order.OrderStatus.PENDING)]
+        if not open_ids:
+            order = Order.from_storage(
+                Order._id_counter.next(), {1: 1}, START, START + timedelta(days=1), Order.OrderStatus.PENDING, 0.0
+            )
+            order_store.add(order)
+            open_ids = [order.id]
+
+        for status in ('COOKING', 'SHIPPING', 'DELIVERED'):
+            for id in open_ids:
+                yield id, status
+
+
+
+# Measuring
+# ------------------------ #
+
+def measure(operation, count, warmup):
+    '''
+        Run an operation count times (after warmup untimed runs) and summarize its latencies
+    '''
+    for _ in range(warmup):
+        operation()
+
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(count):
+        op_started = time.perf_counter()
+        result = operation()
+        latencies.append(time.perf_counter() - op_started)
+        status = getattr(result, 'status_code', 200)
+        if status >= 400:
+            raise RuntimeError(f'{operation} failed with {status}: {result.get_data(as_text=True)}')
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))] * 1000
+
+    return {
+        'operations': count,
+        'seconds': round(elapsed, 4),
+        'ops_per_second': round(count / elapsed, 1),
+        'latency_ms': {
+            'mean': round(sum(latencies) / count * 1000, 4),
+            'p50': round(percentile(50), 4),
+            'p90': round(percentile(90), 4),
+            'p99': round(percentile(99), 4),
+            'max': round(latencies[-1] * 1000, 4),
+        },
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cookies', type=int, default=10_000, help='Cookies to seed')
+    parser.add_argument('--orders', type=int, default=10_000, help='Orders to seed')
+    parser.add_argument('--operations', type=int, default=500, help='Timed operations per scenario')
+    parser.add_argument('--warmup', type=int, default=20, help='Untimed operations before each scenario')
+    parser.add_argument('--layer', choices=('api', 'store', 'both'), default='both', help='Which layer to drive')
+    parser.add_argument('--scenario', action='append', help='Only run this scenario (repeatable)')
+    parser.add_argument('--cache', action='store_true', help='Keep the list response cache on (off by default, so every listing does the work)')
+    parser.add_argument('--metrics', action='store_true', help='Keep the request metrics on')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed for the data and the operations')
+    parser.add_argument('--output', help='Write the JSON report here instead of stdout')
+    args = parser.parse_args()
+
+    layers = {'api': api_scenarios, 'store': store_scenarios}
+    if args.layer != 'both':
+        layers = {args.layer: layers[args.layer]}
+
+    app = create_app({'LIST_CACHE_SIZE': 1024 if args.cache else 0, 'METRICS_ENABLED': args.metrics})
+    client = app.test_client()
+    previous_stores = (cookie_routes_module.cookies, order_routes_module.orders)
+
+    results = {}
+    for layer, scenarios in layers.items():
+        # Fresh data per layer, so one layer's writes don't skew the other's reads
+        seeding_started = time.perf_counter()
+        cookie_store, order_store = seed_stores(args.cookies, args.orders, args.seed)
+        print(f'{layer}: seeded {args.cookies:,} cookies and {args.orders:,} orders in {time.perf_counter() - seeding_started:.1f}s', file=sys.stderr)
+
+        rng = random.Random(args.seed)
+        for name, make_operation in scenarios(client, cookie_store, order_store, rng).items():
+            if args.scenario and name not in args.scenario:
+                continue
+            results[f'{layer}.{name}'] = result = measure(make_operation(), args.operations, args.warmup)
+            print(f"  {name:>18}: {result['ops_per_second']:>10,.1f} ops/s, p50 {result['latency_ms']['p50']:.3f} ms, p99 {result['latency_ms']['p99']:.3f} ms", file=sys.stderr)
+
+    use_stores(*previous_stores)
+
+    report = {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cookies': args.cookies,
+        'orders': args.orders,
+        'operations': args.operations,
+        'cache': args.cache,
+        'results': results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as output:
+            output.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -4,6 +4,7 @@ from flask import Flask
 from flask_restx import Api
 from app.routes.cookie_routes import cookie_routes, cookie_ns
 from app.routes.order_routes import order_routes, order_ns
+from app.routes.cache_routes import cache_ns
 
 @pytest.fixture
 def app():
@@ -12,6 +13,7 @@ def app():
 
     api.add_namespace(cookie_ns)
     api.add_namespace(order_ns)
+    api.add_namespace(cache_ns)
 
     app.register_blueprint(cookie_routes, url_prefix='/cookies')
     app.register_blueprint(order_routes, url_prefix='/orders')
@@ -0,0 +1,131 @@
+import random
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+pytest.importorskip('numpy')
+
+from app import create_app, use_stores
+from app.models.order import Order
+from app.routes import cookie_routes as cookie_routes_module, order_routes as order_routes_module
+from app.store import columnar_order_store as columnar_order_store_module
+from app.store.columnar_order_store import ColumnarOrderStore, CHUNK_SIZE
+from app.store.order_store import OrderStore
+
+
+def random_orders(count):
+    rng = random.Random(7)
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    orders = []
+    for id in rng.sample(range(count * 2), count):  # Not in ID order
+        placed = start + timedelta(hours=rng.randrange(24 * 60))
+        orders.append(Order.from_storage(
+            id, {rng.randrange(5): rng.randrange(1, 4)}, placed, placed + timedelta(days=rng.randrange(1, 10)),
+            rng.choice(list(Order.OrderStatus)), round(rng.uniform(1, 50), 2)
+        ))
+    return orders
+
+
+
+def test_columnar_queries_match_the_row_store():
+
+    orders = random_orders(3000)
+    rows, columns = OrderStore(), ColumnarOrderStore()
+    rows.add_many(orders)
+    columns.add_many(orders[:1000])
+    for order in orders[1000:]:
+        columns.add(order)
+
+    def ids(store, **filters):
+        return [order.id for order in store.query(**filters)]
+
+    may = datetime(2025, 2, 1, tzinfo=timezone.utc)
+    for filters in [
+        {},
+        {'status': Order.OrderStatus.PENDING},
+        {'min_date': may, 'max_total_amount': 20.0},
+        {'status': Order.OrderStatus.DELIVERED, 'min_deliver_date': may, 'max_deliver_date': may + timedelta(days=10)},
+        {'min_total_amount': 10.0, 'max_total_amount': 10.0},
+        {'status': Order.OrderStatus.CANCELLED, 'after_id': 3000},
+    ]:
+        assert ids(columns, **filters) == ids(rows, **filters)
+
+    assert columns.count_by_status() == rows.count_by_status()
+    assert list(columns) == sorted(rows)
+
+
+
+def test_columnar_results_are_read_a_chunk_at_a_time(monkeypatch):
+
+    monkeypatch.setattr(columnar_order_store_module, 'READ_CHUNK_SIZE', 7)
+
+    orders = random_orders(100)
+    rows, columns = OrderStore(), ColumnarOrderStore()
+    rows.add_many(orders)
+    columns.add_many(orders)
+
+    # Lazy: nothing is looked up until the results are read, and they come out the same across chunk boundaries
+    results = columns.query(status=Order.OrderStatus.PENDING)
+    assert iter(results) is results
+    assert [order.id for order in results] == [order.id for order in rows.query(status=Order.OrderStatus.PENDING)]
+    assert [order.id for order in columns.query()] == sorted(rows)
+
+
+
+def test_columnar_writes_update_the_columns():
+
+    store = ColumnarOrderStore()
+    orders = random_orders(CHUNK_SIZE + 10)     # Past the first chunk, so the columns have to grow
+    store.add_many(orders[:CHUNK_SIZE])
+    for order in orders[CHUNK_SIZE:]:
+        store.add(order)
+    assert len(store) == CHUNK_SIZE + 10
+
+    order = orders[-1]
+    store.set_status(order.id, Order.OrderStatus.CANCELLED)
+    assert order.id in [o.id for o in store.query(status=Order.OrderStatus.CANCELLED)]
+    assert store[order.id].version == order.version + 1
+
+    with pytest.raises(ValueError):
+        store.set_status(order.id, Order.OrderStatus.COOKING, from_statuses=[Order.OrderStatus.PENDING])
+
+    results = store.set_statuses([(order.id, Order.OrderStatus.DELIVERED, None), (-1, Order.OrderStatus.DELIVERED, None)])
+    assert results[0].status == Order.OrderStatus.DELIVERED
+    assert isinstance(results[1], KeyError)
+
+
+
+@pytest.fixture
+def columnar_client():
+
+    # Keep the in-memory stores the other tests use (and the order IDs they expect), and put them back afterwards
+    memory_stores = (cookie_routes_module.cookies, order_routes_module.orders)
+    next_order_id = Order._id_counter.peek()
+
+    app = create_app({'STORAGE_BACKEND': 'columnar'})
+    yield app.test_client()
+
+    use_stores(*memory_stores)
+    Order._id_counter.reset(next_order_id)
+
+
+def test_columnar_backend_serves_the_order_routes(columnar_client):
+
+    assert isinstance(order_routes_module.orders, ColumnarOrderStore)
+    seeded = columnar_client.get('/api/orders/').get_json()
+
+    response = columnar_client.post('/api/orders/', json={"cookies_and_quantities": {"1": 2}, "deliver_date": "2025-04-21T15:30:00Z"})
+    assert response.status_code == 201
+    order = response.get_json()
+
+    # Totals follow cookie price changes in the totals column too
+    assert [o["id"] for o in columnar_client.get('/api/orders/?min_total_amount=2.9&max_total_amount=3.1').get_json()] == [order["id"]]
+    sugar = columnar_client.get('/api/cookies/1').get_json()
+    columnar_client.patch('/api/cookies/1', json={"price": 2.00})
+    assert [o["id"] for o in columnar_client.get('/api/orders/?min_total_amount=3.9&max_total_amount=4.1').get_json()] == [order["id"]]
+    columnar_client.patch('/api/cookies/1', json={"price": sugar["price"]})
+
+    response = columnar_client.patch(f'/api/orders/{order["id"]}', json={"status": "CANCELLED"})
+    assert response.get_json()["status"] == "CANCELLED"
+    assert columnar_client.get('/api/orders/?status=CANCELLED').get_json()[-1]["id"] == order["id"]
+    assert len(columnar_client.get('/api/orders/').get_json()) == len(seeded) + 1
@@ -0,0 +1,261 @@
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+import pytest
+
+from app import use_stores
+from app.models.cookie import Cookie
+from app.models.order import Order
+from app.routes import cookie_routes as cookie_routes_module, order_routes as order_routes_module
+from app.routes.cookie_routes import catalog_pricing
+from app.store.base import InventoryError
+from app.store.cookie_store import CookieStore
+from app.store.order_store import OrderStore
+from app.store.sqlite_store import SqliteCookieStore, SqliteDatabase, SqliteOrderStore
+
+
+@pytest.fixture(autouse=True)
+def busy_threads():
+
+    # Switch threads as often as possible so races actually show up, and give back the IDs handed out here
+    switch_interval = sys.getswitchinterval()
+    next_cookie_id = Cookie._id_counter.peek()
+    sys.setswitchinterval(1e-6)
+
+    yield
+
+    sys.setswitchinterval(switch_interval)
+    Cookie._id_counter.reset(next_cookie_id)
+
+
+def run_threads(*targets):
+    errors = []
+
+    def run(target):
+        try:
+            target()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run, args=(target,)) for target in targets]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+
+
+
+def test_concurrent_creates_get_unique_ids():
+
+    store = CookieStore()
+
+    def creator():
+        for i in range(300):
+            store.add(Cookie(f"Cookie {i}", "A cookie", 1.00, 10))
+
+    run_threads(*[creator] * 8)
+
+    ids = [cookie.id for cookie in store.values()]
+    assert len(ids) == len(set(ids)) == 2400
+    assert list(store.query(sort='price')) == sorted(store.values(), key=lambda cookie: (cookie.price, cookie.id))
+
+
+
+def test_concurrent_updates_to_one_cookie_are_not_lost():
+
+    store = CookieStore()
+    for i in range(50):
+        store.add(Cookie.from_storage(i, f"Cookie {i}", "A cookie", float(i), 10))
+
+    def set_prices():
+        for i in range(2000):
+            store.update_cookie(0, price=100.0 + i)
+
+    def set_inventory():
+        for i in range(2000):
+            store.update_cookie(0, inventory_count=i)
+
+    def set_names():
+        for i in range(2000):
+            store.update_cookie(0, name=f"Renamed {i}")
+
+    def read():
+        # Listings stay sorted and complete while the writers run
+        for _ in range(200):
+            prices = [cookie.price for cookie in store.query(sort='price')]
+            assert prices == sorted(prices)
+            assert len(prices) == 50
+
+    run_threads(set_prices, set_inventory, set_names, read, read)
+
+    # Every writer's last write survived, and the indexes agree with the cookie
+    cookie = store[0]
+    assert (cookie.price, cookie.inventory_count, cookie.name) == (2099.0, 1999, "Renamed 1999")
+    assert [c.id for c in store.query(min_price=2099.0, max_price=2099.0)] == [0]
+    assert [c.id for c in store.query(name_search="renamed")] == [0]
+    assert [c.id for c in store.query(sort='-price')][0] == 0
+
+
+
+def test_concurrent_deletes_and_updates_leave_no_stale_entries():
+
+    store = CookieStore()
+    for i in range(500):
+        store.add(Cookie.from_storage(i, f"Cookie {i}", "A cookie", float(i), 10))
+
+    def delete_evens():
+        for i in range(0, 500, 2):
+            store.remove(i)
+
+    def update_all():
+        for i in range(500):
+            try:
+                store.update_cookie(i, name=f"Updated {i}", price=1000.0 + i)
+            except KeyError:
+                pass    # Already deleted
+
+    run_threads(delete_evens, update_all)
+
+    assert sorted(store) == list(range(1, 500, 2))
+    assert [c.id for c in store.query(sort='price')] == sorted(store, key=lambda id: (store[id].price, id))
+    named = [c.id for c in store.query(name_search="cookie")] + [c.id for c in store.query(name_search="updated")]
+    assert sorted(named) == sorted(store)
+
+
+
+def test_concurrent_order_writes_keep_buckets_consistent():
+
+    store = OrderStore()
+    date = datetime(2025, 4, 21, tzinfo=timezone.utc)
+    for i in range(200):
+        store.add(Order.from_storage(i, {0: 1}, date, date, Order.OrderStatus.PENDING, 0.0))
+
+    def advance(start):
+        def run():
+            for i in range(start, 200, 4):
+                store.set_status(i, Order.OrderStatus.COOKING)
+                store.set_cookies_and_quantities(i, {0: 2, 1: 1})
+                store.set_status(i, Order.OrderStatus.SHIPPING)
+        return run
+
+    def reprice():
+        for _ in range(50):
+            store.reprice_cookie(0)
+
+    def read():
+        for _ in range(100):
+            assert sum(store.count_by_status().values()) == 200
+            list(store.query(status=Order.OrderStatus.COOKING, min_total_amount=0))
+
+    run_threads(advance(0), advance(1), advance(2), advance(3), reprice, read)
+
+    assert store.count_by_status()[Order.OrderStatus.SHIPPING] == 200
+    assert [order.id for order in store.query(status=Order.OrderStatus.SHIPPING)] == list(range(200))
+
+    # Totals were refreshed from the order's current contents, not a stale copy
+    totals = {order.total_amount for order in store.values()}
+    assert len(totals) == 1
+    assert [order.id for order in store.query(min_total_amount=totals.pop())] == list(range(200))
+
+
+
+@pytest.mark.parametrize('backend', ['row', 'columnar', 'sqlite'])
+def test_repricing_reaches_orders_being_added(backend, tmp_path):
+
+    if backend == 'columnar':
+        pytest.importorskip('numpy')
+        from app.store.columnar_order_store import ColumnarOrderStore
+        cookie_store, order_store = CookieStore(), ColumnarOrderStore()
+    elif backend == 'sqlite':
+        database = SqliteDatabase(str(tmp_path / 'shop.db'))
+        cookie_store, order_store = SqliteCookieStore(database), SqliteOrderStore(database)
+    else:
+        cookie_store, order_store = CookieStore(), OrderStore()
+
+    cookie = Cookie.from_storage(0, "Popular Cookie", "Everyone wants one", 1.00, 1000)
+    cookie_store.add(cookie)     # SQLite hands out its own ID
+
+    # Price the orders from this catalog, and put the stores the other tests use back afterwards
+    memory_stores = (cookie_routes_module.cookies, order_routes_module.orders)
+    use_stores(cookie_store, order_store)
+
+    date = datetime(2025, 4, 21, tzinfo=timezone.utc)
+    rounds = iter(range(100))
+    repricing = threading.Event()
+    repricer_stopped = threading.Event()
+
+    def change_price():
+        round = next(rounds)
+        if round == 99:     # Stop the repricer first, so nothing else can catch the last change up
+            repricing.clear()
+            repricer_stopped.wait()
+        cookie_store.update_cookie(cookie.id, price=2.00 + round)
+        catalog_pricing.price_changed(cookie.id)
+
+    # Each round, every adder prices an order, the price changes, and then they all store theirs
+    priced = threading.Barrier(4, action=change_price, timeout=10)
+
+    def add(start):
+        def run():
+            for i in range(start, 400, 4):
+                total = catalog_pricing.order_total({cookie.id: 2})
+                priced.wait()
+                order_store.add(Order.from_storage(i, {cookie.id: 2}, date, date, Order.OrderStatus.PENDING, total))
+        return run
+
+    def reprice():
+        try:
+            while repricing.is_set():
+                order_store.reprice_cookie(cookie.id)
+                time.sleep(0.001)   # Leave gaps, or SQLite's busy waits never get the write lock
+        finally:
+            repricer_stopped.set()
+
+    try:
+        repricing.set()
+        run_threads(add(0), add(1), add(2), add(3), reprice)
+    finally:
+        use_stores(*memory_stores)
+
+    # Every order, and the amount index or column, has the final price
+    total = 2 * cookie_store[cookie.id].price
+    assert {order.total_amount for order in order_store.values()} == {total}
+    assert [order.id for order in order_store.query(min_total_amount=total, max_total_amount=total)] == sorted(order_store)
+    assert len(order_store) == 400
+
+
+
+def test_concurrent_checkouts_never_oversell():
+
+    store = CookieStore()
+    store.add(Cookie.from_storage(0, "Popular Cookie", "Everyone wants one", 1.00, 1000))
+    for i in range(1, 21):
+        store.add(Cookie.from_storage(i, f"Cookie {i}", "A cookie", 1.00, 1000))
+
+    reserved = {}
+
+    def checkout(cookie_id):
+        def run():
+            reserved[cookie_id] = 0
+            for _ in range(100):
+                try:
+                    store.reserve_inventory({0: 1, cookie_id: 1})
+                except InventoryError:
+                    continue
+                reserved[cookie_id] += 1
+        return run
+
+    run_threads(*[checkout(i) for i in range(1, 21)])
+
+    # 2000 tries for 1000 popular cookies: exactly 1000 went through, each taking both of its lines
+    assert sum(reserved.values()) == 1000
+    assert store[0].inventory_count == 0
+    for cookie_id, count in reserved.items():
+        assert store[cookie_id].inventory_count == 1000 - count
+
+    store.release_inventory({0: 5, 1: 5})
+    assert (store[0].inventory_count, store[1].inventory_count) == (5, 1005 - reserved[1])
@@ -1,3 +1,4 @@
+import io
 import json
 
 
@@ -133,8 +134,300 @@ def test_delete_cookie(client):
 
 
 
-# TODO: add GET /cookie price-filter test(s)
+def test_get_cookies_price_filter(client):
 
+    # Cookie 0 was patched to 3.99, cookie 1 costs 1.50
+    response = client.get('/cookies/?min_price=2')
+    assert response.status_code == 200
+    assert [cookie["id"] for cookie in response.get_json()] == [0]
+
+    response = client.get('/cookies/?max_price=1.50')
+    assert [cookie["id"] for cookie in response.get_json()] == [1]
+
+    response = client.get('/cookies/?min_price=1.50&max_price=3.99')
+    assert [cookie["id"] for cookie in response.get_json()] == [0, 1]
+
+    response = client.get('/cookies/?min_price=5')
+    assert response.get_json() == []
+
+
+
+def test_get_cookies_sorted(client):
+
+    def ids(query):
+        response = client.get(f'/cookies/?{query}')
+        assert response.status_code == 200
+        return [cookie["id"] for cookie in response.get_json()]
+
+    assert ids("sort=price") == [1, 0]
+    assert ids("sort=-price") == [0, 1]
+    assert ids("sort=name") == [0, 1]
+    assert ids("sort=-id") == [1, 0]
+    assert ids("sort=price&max_price=2") == [1]
+
+    # Re-pricing moves the cookie in the price order
+    client.patch('/cookies/1', json={"price": 5.00})
+    assert ids("sort=price") == [0, 1]
+    client.patch('/cookies/1', json={"price": 1.50})
+    assert ids("sort=price") == [1, 0]
+
+    response = client.get('/cookies/?sort=colour')
+    assert response.status_code == 400
+
+
+
+def test_get_cookies_name_filter(client):
+
+    def search(name_search):
+        response = client.get(f'/cookies/?name_search={name_search}')
+        assert response.status_code == 200
+        return [cookie["name"] for cookie in response.get_json()]
+
+    assert search("chip") == ["Chocolate Chip"]
+    assert search("SUGAR cook") == ["Sugar Cookie"]
+    assert search("co") == ["Chocolate Chip", "Sugar Cookie"]  # Shorter than a trigram
+    assert search("chocolate cookie") == []
+
+
+
+def test_get_cookies_name_filter_after_rename(client):
+
+    response = client.patch('/cookies/1', json={"name": "Frosted Sugar"})
+    assert response.status_code == 200
+
+    response = client.get('/cookies/?name_search=frost')
+    assert [cookie["id"] for cookie in response.get_json()] == [1]
+    response = client.get('/cookies/?name_search=cookie')
+    assert response.get_json() == []
+
+    # Put the name back for the other tests
+    response = client.patch('/cookies/1', json={"name": "Sugar Cookie"})
+    assert response.status_code == 200
+
+    response = client.get('/cookies/?name_search=cookie')
+    assert [cookie["id"] for cookie in response.get_json()] == [1]
+
+
+def test_get_cookies_pagination(client):
+
+    response = client.get('/cookies/?page=1&per_page=1')
+    assert [cookie["id"] for cookie in response.get_json()] == [0]
+    assert "X-Total-Count" not in response.headers
+
+    response = client.get('/cookies/?page=2&per_page=1')
+    assert [cookie["id"] for cookie in response.get_json()] == [1]
+
+    response = client.get('/cookies/?page=3&per_page=1&include_total=true')
+    assert response.get_json() == []
+    assert response.headers["X-Total-Count"] == "2"
+
+    response = client.get('/cookies/?page=1&per_page=1&include_total=true&min_price=2')
+    assert [cookie["id"] for cookie in response.get_json()] == [0]
+    assert response.headers["X-Total-Count"] == "1"
+
+    response = client.get('/cookies/?page=-1&per_page=1')
+    assert response.status_code == 400
+
+
+
+def test_get_cookies_cursor_pagination(client):
+
+    response = client.get('/cookies/?cursor=&per_page=1&sort=-price')
+    assert [cookie["id"] for cookie in response.get_json()] == [0]
+    next_cursor = response.headers["X-Next-Cursor"]
+
+    # A cookie added mid-scan doesn't shift the pages, and still shows up once in its place
+    new_cookie = {"name": "Cheap Cookie", "description": "A very cheap cookie", "price": 0.10, "inventory_count": 1}
+    new_id = client.post('/cookies/', json=new_cookie).get_json()["id"]
+
+    response = client.get(f'/cookies/?cursor={next_cursor}&per_page=1&sort=-price')
+    assert [cookie["id"] for cookie in response.get_json()] == [1]
+    next_cursor = response.headers["X-Next-Cursor"]
+
+    response = client.get(f'/cookies/?cursor={next_cursor}&per_page=1&sort=-price')
+    assert [cookie["id"] for cookie in response.get_json()] == [new_id]
+    assert "X-Next-Cursor" not in response.headers
+
+    client.delete(f'/cookies/{new_id}')
+
+    # Cursors only work with the sort order they were made for
+    response = client.get(f'/cookies/?cursor={next_cursor}&sort=name')
+    assert response.status_code == 400
+
+    response = client.get('/cookies/?cursor=not-a-cursor')
+    assert response.status_code == 400
+
+
+
+def test_cookie_batch(client):
+
+    response = client.post('/cookies:batch', json={"operations": [
+        {"op": "create", "cookie": {"name": "Batch Cookie A", "description": "First", "price": 1.234, "inventory_count": 5}},
+        {"op": "create", "cookie": {"name": "Batch Cookie B", "description": "Second", "price": 2.00, "inventory_count": 5}},
+        {"op": "create", "cookie": {"name": "Batch Cookie C", "description": "Third", "price": -1, "inventory_count": 5}},
+        {"op": "delete", "id": 9999},
+    ]})
+    assert response.status_code == 200
+    data = response.get_json()
+    assert (data["applied"], data["failed"]) == (2, 2)
+    assert [result["status"] for result in data["results"]] == [201, 201, 400, 404]
+    assert data["results"][0]["cookie"]["price"] == 1.23
+    assert data["results"][2]["message"] == "Cookie price must be a non-negative number."
+    a, b = data["results"][0]["id"], data["results"][1]["id"]
+
+    # Atomic: one bad operation and nothing is applied
+    response = client.post('/cookies:batch', json={"atomic": True, "operations": [
+        {"op": "patch", "id": a, "cookie": {"price": 3.00}},
+        {"op": "patch", "id": b, "cookie": {"inventory_count": -1}},
+    ]})
+    assert response.status_code == 400
+    assert [result["status"] for result in response.get_json()["results"]] == [424, 400]
+    assert client.get(f'/cookies/{a}').get_json()["price"] == 1.23
+
+    # An empty description would be skipped by the update, so it's refused rather than reported as applied
+    response = client.post('/cookies:batch', json={"operations": [{"op": "patch", "id": a, "cookie": {"description": ""}}]})
+    assert response.get_json()["results"][0]["status"] == 400
+    assert response.get_json()["results"][0]["message"] == "Cookie description cannot be empty."
+    assert client.get(f'/cookies/{a}').get_json()["description"] == "First"
+
+    response = client.post('/cookies:batch', json={"atomic": True, "operations": [
+        {"op": "patch", "id": a, "cookie": {"price": 3.00, "name": "Batch Cookie Z"}},
+        {"op": "delete", "id": b},
+        {"op": "patch", "id": b, "cookie": {"price": 1.00}},
+    ]})
+    assert response.status_code == 400     # b is gone by the third operation
+    assert [result["status"] for result in response.get_json()["results"]] == [424, 424, 404]
+
+    response = client.post('/cookies:batch', json={"atomic": True, "operations": [
+        {"op": "patch", "id": a, "cookie": {"price": 3.00, "name": "Batch Cookie Z"}},
+        {"op": "delete", "id": b},
+    ]})
+    assert response.status_code == 200
+    assert client.get(f'/cookies/{a}').get_json()["name"] == "Batch Cookie Z"
+    assert client.get(f'/cookies/{b}').status_code == 404
+    assert [cookie["id"] for cookie in client.get('/cookies/?name_search=batch cookie').get_json()] == [a]
+
+    # Clean up, so later tests see the same catalog
+    client.post('/cookies:batch', json={"operations": [{"op": "delete", "id": a}]})
+    assert client.get(f'/cookies/{a}').status_code == 404
+
+    response = client.post('/cookies:batch', json={"operations": [{"op": "explode"}]})
+    assert response.get_json()["results"][0]["status"] == 400
+    assert client.post('/cookies:batch', json={"operations": []}).status_code == 400
+
+
+
+def test_cookie_ndjson_export(client):
+
+    expected = client.get('/cookies/?page=0&sort=-price').get_json()
+
+    response = client.get('/cookies/export?sort=-price')
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    assert [json.loads(line) for line in response.get_data(as_text=True).splitlines()] == expected
+
+    # Same stream from the listing when asked for NDJSON, with the same filters
+    response = client.get('/cookies/?max_price=2', headers={'Accept': 'application/x-ndjson'})
+    assert response.mimetype == 'application/x-ndjson'
+    assert [json.loads(line) for line in response.get_data(as_text=True).splitlines()] == client.get('/cookies/?max_price=2').get_json()
+
+    assert client.get('/cookies/export?sort=flavor').status_code == 400
+
+
+
+def test_cookie_import(client):
+
+    body = (
+        "name,description,price,inventory_count\n"
+        "Import Cookie A,First,1.50,10\n"
+        "Import Cookie B,Second,-2,10\n"
+        "Import Cookie C,Third,abc,10\n"
+        "Import Cookie D,Fourth,2.25,3\n"
+    )
+    response = client.post('/cookies/import', data=body, content_type='text/csv')
+    assert response.status_code == 200
+    report = response.get_json()
+    assert (report["format"], report["rows"], report["imported"], report["failed"]) == ("csv", 4, 2, 2)
+    assert [error["line"] for error in report["errors"]] == [3, 4]
+    assert report["errors"][0]["message"] == "Cookie price must be a non-negative number."
+
+    imported = client.get('/cookies/?name_search=import cookie').get_json()
+    assert sorted(cookie["name"] for cookie in imported) == ["Import Cookie A", "Import Cookie D"]
+
+    # NDJSON as a multipart upload, format taken from the file name
+    lines = '{"name": "Import Cookie E", "description": "Fifth", "price": 1, "inventory_count": 1}\n\n[1, 2]\n{"flavor": "mint"}\n'
+    response = client.post('/cookies/import', data={'file': (io.BytesIO(lines.encode()), 'cookies.ndjson')}, content_type='multipart/form-data')
+    assert response.status_code == 200
+    report = response.get_json()
+    assert (report["rows"], report["imported"], report["failed"]) == (3, 1, 2)
+    assert [error["line"] for error in report["errors"]] == [3, 4]
+
+    # Nothing is imported if the format or header is wrong
+    assert client.post('/cookies/import', data=body).status_code == 400
+    assert client.post('/cookies/import?format=csv', data="name,price\nX,1\n").status_code == 400
+
+    # Clean up, so later tests see the same catalog
+    imported = client.get('/cookies/?name_search=import cookie').get_json()
+    client.post('/cookies:batch', json={"operations": [{"op": "delete", "id": cookie["id"]} for cookie in imported]})
+    assert client.get('/cookies/?name_search=import cookie').get_json() == []
+
+
+
+def test_cookie_etags(client):
+
+    response = client.post('/cookies/', json={"name": "ETag Cookie", "description": "Versioned", "price": 1.00, "inventory_count": 5})
+    id = response.get_json()["id"]
+
+    response = client.get(f'/cookies/{id}')
+    etag = response.headers["ETag"]
+
+    response = client.get(f'/cookies/{id}', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+    assert response.data == b''
+
+    # The list has its own ETag, which any change to any cookie moves
+    list_etag = client.get('/cookies/').headers["ETag"]
+    assert client.get('/cookies/?sort=-price', headers={'If-None-Match': list_etag}).status_code == 304
+
+    # If-Match: only the current version can be patched
+    response = client.patch(f'/cookies/{id}', json={"price": 2.00}, headers={'If-Match': etag})
+    assert response.status_code == 200
+    new_etag = response.headers["ETag"]
+    assert new_etag != etag
+
+    response = client.patch(f'/cookies/{id}', json={"price": 3.00}, headers={'If-Match': etag})
+    assert response.status_code == 412
+    assert client.get(f'/cookies/{id}').get_json()["price"] == 2.00
+
+    assert client.get(f'/cookies/{id}', headers={'If-None-Match': etag}).status_code == 200
+    assert client.get(f'/cookies/{id}', headers={'If-None-Match': new_etag}).status_code == 304
+    assert client.get('/cookies/', headers={'If-None-Match': list_etag}).status_code == 200
+
+    client.delete(f'/cookies/{id}')
+    assert client.get(f'/cookies/{id}', headers={'If-None-Match': new_etag}).status_code == 404
+
+
+
+def test_cookie_list_cache(client):
+
+    def stats():
+        return client.get('/cache/stats').get_json()
+
+    client.get('/cookies/?name_search=sugar&page=1')
+    before = stats()
+
+    # Same query in another argument order is a hit
+    response = client.get('/cookies/?page=1&name_search=sugar')
+    assert [cookie["name"] for cookie in response.get_json()] == ["Sugar Cookie"]
+    assert stats()["hits"] == before["hits"] + 1
 
+    # A write drops the cached lists, and the next read sees it
+    sugar_id = response.get_json()[0]["id"]
+    client.patch(f'/cookies/{sugar_id}', json={"inventory_count": 999})
+    response = client.get('/cookies/?page=1&name_search=sugar')
+    assert response.get_json()[0]["inventory_count"] == 999
+    assert stats()["misses"] > before["misses"]
 
-# TODO: add GET /cookie name-filter test(s)
\ No newline at end of file
+    client.patch(f'/cookies/{sugar_id}', json={"inventory_count": 1000})
+    assert client.get('/cookies/?page=1&name_search=sugar').get_json()[0]["inventory_count"] == 1000
@@ -0,0 +1,180 @@
+import os
+import threading
+import time
+
+import pytest
+
+from app import create_app, use_stores
+from app.models.cookie import Cookie
+from app.models.order import Order
+from app.routes import cookie_routes as cookie_routes_module, order_routes as order_routes_module
+from app.store.journal import Journal
+from app.store.journaled_store import open_journaled_stores
+
+
+@pytest.fixture(autouse=True)
+def keep_global_state():
+
+    # Journaled apps replace the stores and move the ID counters, so put them back for the other tests
+    memory_stores = (cookie_routes_module.cookies, order_routes_module.orders)
+    id_counters = (Cookie._id_counter.peek(), Order._id_counter.peek())
+
+    yield
+
+    use_stores(*memory_stores)
+    Cookie._id_counter.reset(id_counters[0])
+    Order._id_counter.reset(id_counters[1])
+
+
+def dump(cookie_store, order_store):
+    return (
+        [cookie.to_dict() for cookie in cookie_store.values()],
+        [dict(order.to_dict(), total=order.get_order_total_amount()) for order in order_store.values()],
+    )
+
+
+
+def test_journal_replays_after_restart(tmp_path):
+
+    app = create_app({'JOURNAL_DIR': str(tmp_path)})
+    client = app.test_client()
+
+    # A new journal starts from the demo data
+    assert len(client.get('/api/cookies/').get_json()) == len(cookie_routes_module.cookies)
+
+    new_id = client.post('/api/cookies/', json={
+        "name": "Ginger Snap", "description": "A spicy cookie", "price": 1.25, "inventory_count": 30
+    }).get_json()["id"]
+    client.patch(f'/api/cookies/{new_id}', json={"price": 1.75})
+    order_id = client.post('/api/orders/', json={
+        "cookies_and_quantities": {str(new_id): 4}, "deliver_date": "2025-04-21T15:30:00Z"
+    }).get_json()["id"]
+    client.patch(f'/api/orders/{order_id}', json={"status": "COOKING"})
+
+    deleted_id = client.post('/api/cookies/', json={
+        "name": "Stale Cookie", "description": "Going away", "price": 0.50, "inventory_count": 1
+    }).get_json()["id"]
+    client.delete(f'/api/cookies/{deleted_id}')
+
+    # A batch is one record
+    client.post('/api/cookies:batch', json={"operations": [
+        {"op": "create", "cookie": {"name": "Batch Cookie", "description": "From a batch", "price": 2.50, "inventory_count": 5}},
+        {"op": "patch", "id": new_id, "cookie": {"inventory_count": 12}},
+    ]})
+
+    before = dump(cookie_routes_module.cookies, order_routes_module.orders)
+    app.extensions['journal'].close()
+
+    # "Restart": rebuild the stores from the files alone
+    cookie_store, order_store = open_journaled_stores(Journal(str(tmp_path)))
+    assert dump(cookie_store, order_store) == before
+    assert order_store[order_id].get_order_total_amount() == 7.00
+    assert order_store[order_id].status == Order.OrderStatus.COOKING
+
+    # Deleted IDs aren't handed out again
+    assert Cookie._id_counter.peek() > deleted_id
+
+
+
+def test_journal_snapshot_compaction(tmp_path):
+
+    journal = Journal(str(tmp_path), snapshot_every=3)
+    cookie_store, order_store = open_journaled_stores(journal)
+
+    for i in range(10):
+        cookie_store.add(Cookie.from_storage(i, f"Cookie {i}", "A cookie", 1.00 + i, 10))
+    cookie_store.update_cookie(4, price=9.99)
+    cookie_store.remove(7)
+
+    # Snapshots keep the log short
+    assert os.path.exists(journal.snapshot_path)
+    with open(journal.log_path) as f:
+        assert len(f.readlines()) < 3
+
+    before = dump(cookie_store, order_store)
+    journal.close()
+
+    assert dump(*open_journaled_stores(Journal(str(tmp_path)))) == before
+
+
+
+def test_journal_drops_torn_record(tmp_path):
+
+    journal = Journal(str(tmp_path))
+    cookie_store, order_store = open_journaled_stores(journal)
+    cookie_store.add(Cookie.from_storage(0, "Sugar Cookie", "A regular sugar cookie", 1.50, 10))
+    journal.close()
+
+    # A crash in the middle of writing the next record
+    with open(journal.log_path, 'a') as f:
+        f.write('{"seq":2,"op":"put_coo')
+
+    journal = Journal(str(tmp_path))
+    cookie_store, _ = open_journaled_stores(journal)
+    assert [cookie.name for cookie in cookie_store.values()] == ["Sugar Cookie"]
+
+    # New records go after the last good one
+    cookie_store.add(Cookie.from_storage(1, "Mint Chip", "A mint cookie", 2.00, 10))
+    journal.close()
+
+    cookie_store, _ = open_journaled_stores(Journal(str(tmp_path)))
+    assert [cookie.name for cookie in cookie_store.values()] == ["Sugar Cookie", "Mint Chip"]
+
+
+
+def test_journal_drops_record_missing_its_newline(tmp_path):
+
+    journal = Journal(str(tmp_path))
+    cookie_store, order_store = open_journaled_stores(journal)
+    cookie_store.add(Cookie.from_storage(0, "Sugar Cookie", "A regular sugar cookie", 1.50, 10))
+    journal.close()
+
+    # A crash just before the newline of the next record: it parses, but was never acknowledged
+    with open(journal.log_path, 'a') as f:
+        f.write('{"seq":2,"op":"put_cookie","cookie":{"id":5,"name":"Torn Cookie","description":"Cut off",'
+                '"price":1.0,"inventory_count":1,"version":1}}')
+
+    journal = Journal(str(tmp_path))
+    cookie_store, _ = open_journaled_stores(journal)
+    assert [cookie.name for cookie in cookie_store.values()] == ["Sugar Cookie"]
+
+    # So the next record starts a line of its own, and both survive the next restart
+    cookie_store.add(Cookie.from_storage(1, "Mint Chip", "A mint cookie", 2.00, 10))
+    journal.close()
+
+    cookie_store, _ = open_journaled_stores(Journal(str(tmp_path)))
+    assert [cookie.name for cookie in cookie_store.values()] == ["Sugar Cookie", "Mint Chip"]
+
+
+
+def test_journal_group_commit_shares_fsyncs(tmp_path, monkeypatch):
+
+    fsync_calls = []
+    real_fsync = os.fsync
+
+    def slow_fsync(fd):
+        fsync_calls.append(fd)
+        time.sleep(0.002)
+        real_fsync(fd)
+
+    monkeypatch.setattr(os, 'fsync', slow_fsync)
+
+    journal = Journal(str(tmp_path))
+    cookie_store, _ = open_journaled_stores(journal)
+
+    def writer(start):
+        for i in range(start, start + 25):
+            cookie_store.add(Cookie.from_storage(i, f"Cookie {i}", "A cookie", 1.00, 10))
+
+    threads = [threading.Thread(target=writer, args=(n * 25,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(cookie_store) == 200
+    assert len(fsync_calls) < 200   # Commits that overlapped shared an fsync
+    journal.close()
+
+    cookie_store, _ = open_journaled_stores(Journal(str(tmp_path)))
+    assert len(cookie_store) == 200
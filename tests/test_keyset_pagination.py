@@ -0,0 +1,77 @@
+import random
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.models.cookie import Cookie
+from app.models.order import Order
+from app.store import cookie_store as cookie_store_module, order_store as order_store_module
+from app.store.cookie_store import CookieStore
+from app.store.order_store import OrderStore
+
+
+def read_pages(query, cursor, size=50):
+    # Read a query a page at a time, each page resuming just past the last item of the one before
+    items, after = [], None
+    while True:
+        page = [item for _, item in zip(range(size), query(after))]
+        items.extend(page)
+        if len(page) < size:
+            return items
+        after = cursor(page[-1])
+
+
+
+@pytest.mark.parametrize('sort_limit', [1024, 0])    # Narrow ranges sorted, or every range walked in ID order
+def test_order_pages_match_the_filters(monkeypatch, sort_limit):
+
+    monkeypatch.setattr(order_store_module, 'SORT_LIMIT', sort_limit)
+
+    rng = random.Random(11)
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    store = OrderStore()
+    for id in rng.sample(range(6000), 3000):
+        placed = start + timedelta(hours=rng.randrange(24 * 60))
+        store.add(Order.from_storage(
+            id, {rng.randrange(1, 4): rng.randrange(1, 6)}, placed, placed + timedelta(days=rng.randrange(1, 10)),
+            rng.choice(list(Order.OrderStatus)), 0.0
+        ))
+
+    may = datetime(2025, 2, 1, tzinfo=timezone.utc)
+    for filters, matches in [
+        ({'status': Order.OrderStatus.PENDING}, lambda order: order.status == Order.OrderStatus.PENDING),
+        ({'min_date': may}, lambda order: order.order_date >= may),
+        ({'min_date': may, 'max_date': may + timedelta(days=3)}, lambda order: may <= order.order_date <= may + timedelta(days=3)),
+        (
+            {'status': Order.OrderStatus.DELIVERED, 'min_deliver_date': may, 'max_total_amount': 20.0},
+            lambda order: order.status == Order.OrderStatus.DELIVERED and order.deliver_date >= may and order.total_amount <= 20.0,
+        ),
+    ]:
+        expected = sorted(order.id for order in store.values() if matches(order))
+        paged = read_pages(lambda after: store.query(after_id=after, **filters), lambda order: order.id)
+        assert [order.id for order in paged] == expected
+
+
+
+@pytest.mark.parametrize('sort_limit', [1024, 0])
+def test_cookie_price_range_pages_match_the_filters(monkeypatch, sort_limit):
+
+    monkeypatch.setattr(cookie_store_module, 'SORT_LIMIT', sort_limit)
+
+    rng = random.Random(12)
+    store = CookieStore()
+    for id in rng.sample(range(4000), 2000):
+        store.add(Cookie.from_storage(id, f"Cookie {id}", "A cookie", round(rng.uniform(0.5, 10), 2), 10))
+
+    for sort in ('id', '-id'):
+        for min_price, max_price in [(2.0, 2.5), (1.0, None), (None, 9.0)]:
+            expected = sorted(
+                (cookie.id for cookie in store.values()
+                 if (min_price is None or cookie.price >= min_price) and (max_price is None or cookie.price <= max_price)),
+                reverse=sort == '-id',
+            )
+            paged = read_pages(
+                lambda after: store.query(min_price=min_price, max_price=max_price, sort=sort, after=after),
+                lambda cookie: store.cursor_key(cookie.id, sort),
+            )
+            assert [cookie.id for cookie in paged] == expected
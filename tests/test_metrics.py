@@ -0,0 +1,55 @@
+from app import create_app
+from app.routes import order_routes as order_routes_module
+from app.routes.cookie_routes import catalog_pricing
+from app.services.metrics import Histogram, MetricsRegistry
+
+
+def test_histogram_buckets_are_cumulative():
+
+    histogram = Histogram((1, 5, 10))
+    for value in (0.5, 1, 3, 7, 50):
+        histogram.observe(value)
+
+    counts, total = histogram.snapshot()
+    assert counts == [2, 3, 4, 5]   # le=1, le=5, le=10, +Inf
+    assert total == 61.5
+
+
+
+def test_registry_renders_prometheus_text():
+
+    registry = MetricsRegistry()
+    registry.describe('jobs_total', 'counter', 'Jobs run')
+    registry.counter('jobs_total', kind='a"b').inc(2)
+    registry.histogram('job_seconds', (0.1, 1), kind='x').observe(0.5)
+
+    text = registry.render()
+    assert '# TYPE jobs_total counter' in text
+    assert 'jobs_total{kind="a\\"b"} 2' in text
+    assert 'job_seconds_bucket{kind="x",le="0.1"} 0' in text
+    assert 'job_seconds_bucket{kind="x",le="+Inf"} 1' in text
+    assert 'job_seconds_count{kind="x"} 1' in text
+
+
+
+def test_metrics_endpoint():
+
+    client = create_app().test_client()
+    order_id = next(iter(order_routes_module.orders))
+    assert client.get(f'/api/orders/{order_id}').status_code == 200
+    client.get('/api/cookies/')
+    client.get('/api/orders/9999')
+    catalog_pricing.order_total({1: 2})
+
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+
+    text = response.get_data(as_text=True)
+    assert 'http_requests_total{method="GET",route="/api/orders/<int:id>",status="200"}' in text
+    assert 'http_requests_total{method="GET",route="/api/orders/<int:id>",status="404"}' in text
+    assert 'http_request_duration_seconds_bucket{method="GET",route="/api/cookies/",le="+Inf"}' in text
+    assert 'http_response_size_bytes_count{method="GET",route="/api/cookies/"}' in text
+    assert 'store_operation_duration_seconds_count{component="cookies",operation="query"}' in text
+    assert 'store_operation_duration_seconds_count{component="pricing",operation="order_total"}' in text
+    assert 'list_cache_events_total{event="misses"}' in text
@@ -0,0 +1,75 @@
+import copy
+import json
+from datetime import datetime
+import pytest
+from flask_restx import marshal
+from app.models.cookie import Cookie
+from app.models.order import Order
+from app.routes.cookie_routes import cookie_output_model
+from app.routes.order_routes import order_output_model
+
+
+def test_models_have_no_instance_dict():
+
+    cookie = Cookie("Slotted Cookie", "No __dict__", 1.00, 1)
+    with pytest.raises(AttributeError):
+        cookie.flavor = "mint"
+    assert not hasattr(cookie, '__dict__')
+
+    # Copies (as the stores make for every write) keep every field
+    changed = copy.copy(cookie)
+    changed.update_cookie(price=2.00)
+    assert (cookie.price, changed.price, changed.version) == (1.00, 2.00, cookie.version + 1)
+
+
+
+def test_order_line_items_round_trip():
+
+    order = Order.from_storage(7, {3: 2, 0: 5}, datetime(2025, 1, 1), datetime(2025, 1, 2), Order.OrderStatus.PENDING, 0.0)
+    assert not hasattr(order, '__dict__')
+    assert order.cookies_and_quantities == {3: 2, 0: 5}
+    assert list(order.cookies_and_quantities) == [3, 0]
+    assert order.to_dict()["cookies_and_quantities"] == {3: 2, 0: 5}
+
+    # The returned dict is a copy, so editing it leaves the order alone
+    order.cookies_and_quantities[3] = 99
+    assert order.cookies_and_quantities == {3: 2, 0: 5}
+
+    with pytest.raises(ValueError):
+        order.set_cookies_and_quantities({1: 2 ** 32})
+    assert order.cookies_and_quantities == {3: 2, 0: 5}
+
+
+
+def test_cached_json_follows_changes():
+
+    cookie = Cookie("Cached Cookie", "Encoded once", 1.00, 1)
+    encoded = cookie.to_json()
+    assert json.loads(encoded) == cookie.to_dict()
+    assert cookie.to_json() is encoded
+
+    # Any change moves the version, so the next encoding is fresh (and copies don't share stale text)
+    changed = copy.copy(cookie)
+    changed.update_cookie(price=2.00)
+    assert json.loads(changed.to_json())["price"] == 2.00
+    assert cookie.to_json() is encoded
+
+    order = Order.from_storage(8, {1: 2}, datetime(2025, 1, 1), datetime(2025, 1, 2), Order.OrderStatus.PENDING, 0.0)
+    assert json.loads(order.to_json())["status"] == "PENDING"
+    order.set_status(Order.OrderStatus.COOKING)
+    assert json.loads(order.to_json())["status"] == "COOKING"
+
+
+
+def test_cached_json_matches_the_output_models():
+
+    # Same bytes as marshalling through the documented models, an integer price included
+    cookie = Cookie("Sugar Cookie", "A regular sugar cookie", 2, 10)
+    assert cookie.to_json() == json.dumps(marshal(cookie, cookie_output_model))
+    assert json.loads(cookie.to_json())["price"] == 2.0
+
+    stored = Cookie.from_storage(7, "Mint Chip", "A mint cookie", 3, 10)
+    assert stored.to_json() == json.dumps(marshal(stored, cookie_output_model))
+
+    order = Order.from_storage(3, {0: 2}, datetime(2025, 1, 20, 15, 30), datetime(2025, 2, 2, 15, 30), Order.OrderStatus.PENDING, 5.0)
+    assert order.to_json() == json.dumps(marshal(order.to_dict(), order_output_model))
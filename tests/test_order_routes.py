@@ -1,3 +1,4 @@
+import json
 import sys
 from datetime import datetime, timedelta
 
@@ -156,3 +157,230 @@ def test_get_all_orders_filter_big_amount(client):
     data = response.get_json()
     assert isinstance(data, list)
     assert len(data) == 2 # There should be two orders after the one was created  
+
+
+
+def test_order_total_follows_cookie_price_change(client):
+
+    # Order 0 is {1: 5, 0: 2}, cheap enough to be under the limit
+    response = client.get('/orders/?max_total_amount=20')
+    assert [order["id"] for order in response.get_json()] == [0]
+
+    # Raising the price of cookie 1 pushes order 0 over the limit
+    response = client.patch('/cookies/1', json={"price": 10.00})
+    assert response.status_code == 200
+
+    response = client.get('/orders/?max_total_amount=20')
+    assert response.get_json() == []
+
+    # Put the price back for the other tests
+    response = client.patch('/cookies/1', json={"price": 1.50})
+    assert response.status_code == 200
+
+    response = client.get('/orders/?max_total_amount=20')
+    assert [order["id"] for order in response.get_json()] == [0]
+
+
+
+def test_get_all_orders_filter_dates(client):
+
+    # Only the mock order was placed in January 2025
+    response = client.get('/orders/?min_date=2025-01-01T00:00:00Z&max_date=2025-01-31T00:00:00Z')
+    assert response.status_code == 200
+    assert [order["id"] for order in response.get_json()] == [0]
+
+    # The mock order is delivered in February, the created order in April
+    response = client.get('/orders/?max_deliver_date=2025-03-01T00:00:00Z')
+    assert [order["id"] for order in response.get_json()] == [0]
+
+    response = client.get('/orders/?min_deliver_date=2025-04-01T00:00:00Z&min_total_amount=1')
+    data = response.get_json()
+    assert len(data) == 1
+    assert data[0]["deliver_date"] == '2025-04-21T15:30:00+00:00'
+
+
+
+def test_get_order_stats(client):
+
+    response = client.get('/orders/stats')
+    assert response.status_code == 200
+
+    data = response.get_json()
+    assert data == {"PENDING": 2, "COOKING": 0, "SHIPPING": 0, "DELIVERED": 0, "CANCELLED": 0}
+
+
+
+def test_status_filter_follows_transition(client):
+
+    response = client.get('/orders/?status=pending')
+    assert [order["id"] for order in response.get_json()] == [0, 1]
+
+    response = client.patch('/orders/1', json={"status": "CANCELLED"})
+    assert response.status_code == 200
+
+    response = client.get('/orders/?status=PENDING')
+    assert [order["id"] for order in response.get_json()] == [0]
+
+    response = client.get('/orders/?status=CANCELLED&min_total_amount=1')
+    assert [order["id"] for order in response.get_json()] == [1]
+
+    response = client.get('/orders/?status=NOT_A_STATUS')
+    assert response.get_json() == []
+
+    response = client.get('/orders/stats')
+    assert response.get_json()["PENDING"] == 1
+    assert response.get_json()["CANCELLED"] == 1
+
+
+
+def test_get_orders_cursor_pagination(client):
+
+    response = client.get('/orders/?per_page=1')
+    assert response.status_code == 200
+    assert [order["id"] for order in response.get_json()] == [0]
+    next_cursor = response.headers["X-Next-Cursor"]
+
+    response = client.get(f'/orders/?cursor={next_cursor}&per_page=1')
+    assert [order["id"] for order in response.get_json()] == [1]
+    assert "X-Next-Cursor" not in response.headers
+
+    # Filters apply to every page
+    response = client.get(f'/orders/?cursor=&per_page=5&status=CANCELLED')
+    assert [order["id"] for order in response.get_json()] == [1]
+
+    response = client.get('/orders/?cursor=not-a-cursor')
+    assert response.status_code == 400
+    assert "Invalid cursor" in response.get_json()["message"]
+
+
+
+def test_create_order_reserves_inventory(client, caplog):
+
+    def stock(cookie_id):
+        return client.get(f'/cookies/{cookie_id}').get_json()["inventory_count"]
+
+    chip_stock, sugar_stock = stock(0), stock(1)
+
+    response = client.post('/orders/', json={"cookies_and_quantities": {"0": 3, "1": 4}, "deliver_date": "2025-04-21T15:30:00Z"})
+    assert response.status_code == 201
+    order_id = response.get_json()["id"]
+    assert (stock(0), stock(1)) == (chip_stock - 3, sugar_stock - 4)
+
+    # Unknown cookies and short stock are refused, and nothing is reserved for the lines that were fine
+    with caplog.at_level('WARNING'):
+        response = client.post('/orders/', json={"cookies_and_quantities": {"0": 1, "999": 1}, "deliver_date": "2025-04-21T15:30:00Z"})
+    assert response.status_code == 400
+    assert "does not exist" in response.get_json()["message"]
+    assert caplog.records == []     # Refused before anything tried to price the unknown cookie
+
+    response = client.post('/orders/', json={"cookies_and_quantities": {"0": 1, "1": sugar_stock}, "deliver_date": "2025-04-21T15:30:00Z"})
+    assert response.status_code == 409
+    assert (stock(0), stock(1)) == (chip_stock - 3, sugar_stock - 4)
+
+    # Cancelling gives the stock back, once
+    assert client.patch(f'/orders/{order_id}', json={"status": "CANCELLED"}).status_code == 200
+    assert (stock(0), stock(1)) == (chip_stock, sugar_stock)
+
+    assert client.patch(f'/orders/{order_id}', json={"status": "CANCELLED"}).status_code == 400
+    assert (stock(0), stock(1)) == (chip_stock, sugar_stock)
+
+
+
+def test_order_batch(client):
+
+    def stock(cookie_id):
+        return client.get(f'/cookies/{cookie_id}').get_json()["inventory_count"]
+
+    chip_stock = stock(0)
+
+    response = client.post('/orders:batch', json={"orders": [
+        {"cookies_and_quantities": {"0": 2}, "deliver_date": "2025-04-21T15:30:00Z"},
+        {"cookies_and_quantities": {"0": 1, "999": 1}, "deliver_date": "2025-04-21T15:30:00Z"},
+        {"cookies_and_quantities": {"0": chip_stock}, "deliver_date": "2025-04-21T15:30:00Z"},
+        {"cookies_and_quantities": {"0": 1}, "deliver_date": "not a date"},
+    ]})
+    assert response.status_code == 200
+    data = response.get_json()
+    assert [result["status"] for result in data["results"]] == [201, 400, 409, 400]
+    assert (data["applied"], data["failed"]) == (1, 3)
+    assert stock(0) == chip_stock - 2
+
+    new_id = data["results"][0]["id"]
+    assert client.get(f'/orders/{new_id}').get_json()["status"] == "PENDING"
+
+    # Changes apply in order, each checked against the status the one before it left
+    response = client.patch('/orders:batch', json={"changes": [
+        {"id": new_id, "status": "cooking"},
+        {"id": 0, "status": "DELIVERED"},
+        {"id": 9999, "status": "COOKING"},
+        {"id": new_id, "status": "BAKING"},
+        {"id": new_id, "status": "CANCELLED"},
+        {"id": new_id, "status": "COOKING"},
+    ]})
+    assert response.status_code == 200
+    results = response.get_json()["results"]
+    assert [result["status"] for result in results] == [200, 400, 404, 404, 200, 400]
+    assert results[0]["order"]["status"] == "COOKING"
+    assert results[1]["message"] == "Cannot transition from PENDING to DELIVERED."
+
+    # The cancellation gave the stock back
+    assert client.get(f'/orders/{new_id}').get_json()["status"] == "CANCELLED"
+    assert stock(0) == chip_stock
+
+
+
+def test_order_ndjson_export(client):
+
+    response = client.get('/orders/export')
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    assert [json.loads(line) for line in response.get_data(as_text=True).splitlines()] == client.get('/orders/').get_json()
+
+    # Each line is the same encoding the list endpoint sends for that order
+    lines = response.get_data(as_text=True).splitlines()
+    assert '[' + ', '.join(lines) + ']\n' == client.get('/orders/').get_data(as_text=True)
+
+    response = client.get('/orders/?status=CANCELLED', headers={'Accept': 'application/x-ndjson'})
+    lines = response.get_data(as_text=True).splitlines()
+    assert lines and all(json.loads(line)["status"] == "CANCELLED" for line in lines)
+
+    assert client.get('/orders/export?status=NOT_A_STATUS').get_data() == b''
+
+
+
+def test_order_etags(client):
+
+    response = client.post('/orders/', json={"cookies_and_quantities": {"1": 1}, "deliver_date": "2025-04-21T15:30:00Z"})
+    id = response.get_json()["id"]
+
+    etag = client.get(f'/orders/{id}').headers["ETag"]
+    assert client.get(f'/orders/{id}', headers={'If-None-Match': etag}).status_code == 304
+
+    list_etag = client.get('/orders/').headers["ETag"]
+    assert client.get('/orders/', headers={'If-None-Match': list_etag}).status_code == 304
+
+    # A stale If-Match is refused, and nothing changes
+    response = client.patch(f'/orders/{id}', json={"status": "COOKING"}, headers={'If-Match': '"stale"'})
+    assert response.status_code == 412
+    assert client.get(f'/orders/{id}').get_json()["status"] == "PENDING"
+
+    response = client.patch(f'/orders/{id}', json={"status": "CANCELLED"}, headers={'If-Match': etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+    assert client.get(f'/orders/{id}', headers={'If-None-Match': etag}).status_code == 200
+    assert client.get('/orders/', headers={'If-None-Match': list_etag}).status_code == 200
+
+
+
+def test_order_list_matches_the_documented_model(client):
+
+    from flask_restx import marshal
+    from app.routes import order_routes as order_routes_module
+    from app.routes.order_routes import order_output_model
+
+    # Joined from cached encodings, but the same bytes as marshalling every order through the Swagger model
+    response = client.get('/orders/')
+    expected = [order.to_dict() for order in order_routes_module.orders.values()]
+    assert response.get_data(as_text=True) == json.dumps(marshal(expected, order_output_model)) + '\n'
+    assert response.mimetype == 'application/json'
@@ -0,0 +1,43 @@
+import logging
+from types import SimpleNamespace
+
+from app.services.pricing import CatalogPricing
+
+
+# Stand-ins for Cookie objects (building real Cookies would bump Cookie._id_counter)
+catalog = {
+    0: SimpleNamespace(price=2.99),
+    1: SimpleNamespace(price=1.50),
+}
+
+
+
+def test_price_of_batch():
+
+    pricing = CatalogPricing(catalog)
+
+    prices = pricing.price_of([0, 1])
+    assert prices == {0: 2.99, 1: 1.50}
+
+
+
+def test_price_of_reports_missing_cookie(caplog):
+
+    pricing = CatalogPricing(catalog)
+
+    bad_id = 1000
+    with caplog.at_level(logging.WARNING):
+        prices = pricing.price_of([0, bad_id])
+
+    assert prices == {0: 2.99}
+    assert f"Cookie (id:{bad_id})" in caplog.text
+
+
+
+def test_order_total_skips_missing_cookie():
+
+    pricing = CatalogPricing(catalog)
+
+    # (2.99*11)+(1.50*6) = 41.89, the missing cookie adds nothing
+    total = pricing.order_total({0: 11, 1: 6, 1000: 3})
+    assert total == 41.89
@@ -0,0 +1,45 @@
+import os
+import pytest
+from app import create_app
+
+
+def test_profile_is_returned_for_the_token_only():
+
+    client = create_app({'PROFILING_ENABLED': True, 'PROFILING_TOKEN': 'secret'}).test_client()
+
+    response = client.get('/api/orders/?status=delivered', headers={'X-Profile': 'secret'})
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    assert response.headers['X-Profiled-Status'] == '200'
+
+    # Collapsed stacks: "frame;frame;... microseconds", reaching down into the store
+    lines = response.get_data(as_text=True).splitlines()
+    assert all(line.rsplit(' ', 1)[1].isdigit() for line in lines)
+    assert any('query (app/store/order_store.py' in line for line in lines)
+
+    # A wrong token or no header gets the normal response
+    assert client.get('/api/orders/?status=delivered', headers={'X-Profile': 'guess'}).mimetype == 'application/json'
+    assert client.get('/api/orders/?status=delivered').mimetype == 'application/json'
+
+
+
+def test_profiling_is_off_by_default():
+
+    client = create_app().test_client()
+    assert client.get('/api/cookies/', headers={'X-Profile': '1'}).mimetype == 'application/json'
+
+    with pytest.raises(ValueError):
+        create_app({'PROFILING_ENABLED': True, 'PROFILE_ALL_REQUESTS': True})
+
+
+
+def test_profiles_can_be_stored(tmp_path):
+
+    client = create_app({'PROFILING_ENABLED': True, 'PROFILE_ALL_REQUESTS': True, 'PROFILE_DIR': str(tmp_path)}).test_client()
+
+    response = client.get('/api/cookies/')
+    assert response.mimetype == 'application/json'
+
+    name = response.headers['X-Profile-File']
+    assert name.endswith('-GET-api_cookies.folded')
+    assert os.path.getsize(tmp_path / name) > 0
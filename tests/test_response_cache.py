@@ -0,0 +1,50 @@
+from app.services.response_cache import ResponseCache
+
+
+def test_hits_need_the_same_tag():
+
+    cache = ResponseCache(max_entries=10, ttl=60)
+    cache.put('cookies', ('page', '1'), 'v1', ['page one'])
+
+    assert cache.get('cookies', ('page', '1'), 'v1') == ['page one']
+    assert cache.get('orders', ('page', '1'), 'v1') is None
+
+    # The collection changed since, so the entry is dropped
+    assert cache.get('cookies', ('page', '1'), 'v2') is None
+    assert cache.get('cookies', ('page', '1'), 'v1') is None
+
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['invalidations'], stats['entries']) == (1, 3, 1, 0)
+
+
+
+def test_lru_eviction_and_ttl(monkeypatch):
+
+    now = [1000.0]
+    monkeypatch.setattr('app.services.response_cache.time.monotonic', lambda: now[0])
+
+    cache = ResponseCache(max_entries=2, ttl=5)
+    cache.put('cookies', 'a', 'v1', 'A')
+    cache.put('cookies', 'b', 'v1', 'B')
+    cache.get('cookies', 'a', 'v1')     # a is now the most recently used
+    cache.put('cookies', 'c', 'v1', 'C')
+
+    assert cache.get('cookies', 'b', 'v1') is None
+    assert cache.get('cookies', 'a', 'v1') == 'A'
+    assert cache.stats()['evictions'] == 1
+
+    now[0] += 6
+    assert cache.get('cookies', 'c', 'v1') is None
+    assert cache.stats()['expirations'] == 1
+
+
+
+def test_invalidate_only_drops_its_namespaces():
+
+    cache = ResponseCache()
+    cache.put('cookies', 'a', 'v1', 'A')
+    cache.put('orders', 'a', 'v1', 'A')
+
+    cache.invalidate('cookies')
+    assert cache.get('cookies', 'a', 'v1') is None
+    assert cache.get('orders', 'a', 'v1') == 'A'
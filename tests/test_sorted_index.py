@@ -0,0 +1,44 @@
+from app.store.sorted_index import SortedIndex
+
+
+def test_range_is_inclusive_and_in_key_order():
+
+    index = SortedIndex()
+    for id, key in [(0, 5.0), (1, 1.0), (2, 3.0), (3, 3.0), (4, 9.0)]:
+        index.add(key, id)
+
+    assert list(index.range(3.0, 5.0)) == [2, 3, 0]
+    assert list(index.range(max_key=3.0)) == [1, 2, 3]
+    assert list(index.range(min_key=6.0)) == [4]
+    assert list(index.range(6.0, 2.0)) == []
+    assert index.count(3.0, 5.0) == 3
+
+
+
+def test_remove():
+
+    index = SortedIndex()
+    index.add(3.0, 2)
+    index.add(3.0, 3)
+
+    index.remove(3.0, 2)
+    index.remove(3.0, 99)  # Not indexed, ignored
+
+    assert list(index.range()) == [3]
+    assert len(index) == 1
+
+
+
+def test_range_after():
+
+    index = SortedIndex()
+    for id, key in [(0, 5.0), (1, 1.0), (2, 3.0), (3, 3.0), (4, 9.0)]:
+        index.add(key, id)
+
+    assert list(index.range(after=(3.0, 2))) == [3, 0, 4]
+    assert list(index.range(reverse=True, after=(3.0, 3))) == [2, 1]
+    assert list(index.range(max_key=5.0, after=(3.0, 3))) == [0]
+
+    # Resuming still works once the entry itself is gone
+    index.remove(3.0, 2)
+    assert list(index.range(after=(3.0, 2))) == [3, 0, 4]
@@ -0,0 +1,231 @@
+import sqlite3
+import pytest
+
+from app import create_app, use_stores
+from app.routes import cookie_routes as cookie_routes_module, order_routes as order_routes_module
+from app.models.cookie import Cookie
+from app.store.cookie_store import CookieStore
+from app.store.sqlite_store import SqliteDatabase, SqliteCookieStore
+
+
+@pytest.fixture
+def sqlite_client(tmp_path):
+
+    # Keep the in-memory stores the other tests use, and put them back afterwards
+    memory_stores = (cookie_routes_module.cookies, order_routes_module.orders)
+
+    app = create_app({'STORAGE_BACKEND': 'sqlite', 'SQLITE_PATH': str(tmp_path / 'shop.db')})
+    yield app.test_client()
+
+    use_stores(*memory_stores)
+
+
+def add_cookie(client, name, price, inventory_count=10):
+    response = client.post('/api/cookies/', json={
+        "name": name,
+        "description": f"A {name.lower()}",
+        "price": price,
+        "inventory_count": inventory_count,
+    })
+    assert response.status_code == 201
+    return response.get_json()["id"]
+
+
+
+def test_sqlite_cookie_crud(sqlite_client):
+
+    id = add_cookie(sqlite_client, "Oatmeal Raisin", 2.25)
+
+    response = sqlite_client.get(f'/api/cookies/{id}')
+    assert response.status_code == 200
+    assert response.get_json() == {
+        "id": id, "name": "Oatmeal Raisin", "description": "A oatmeal raisin", "price": 2.25, "inventory_count": 10
+    }
+
+    response = sqlite_client.patch(f'/api/cookies/{id}', json={"price": 3.00, "inventory_count": 5})
+    assert response.get_json()["price"] == 3.00
+    assert response.get_json()["inventory_count"] == 5
+
+    assert sqlite_client.delete(f'/api/cookies/{id}').status_code == 204
+    assert sqlite_client.get(f'/api/cookies/{id}').status_code == 404
+
+    # Deleted IDs are never handed out again
+    assert add_cookie(sqlite_client, "Snickerdoodle", 1.75) > id
+
+
+
+def test_sqlite_cookie_queries(sqlite_client):
+
+    chip = add_cookie(sqlite_client, "Chocolate Chip", 2.99)
+    sugar = add_cookie(sqlite_client, "Sugar Cookie", 1.50)
+    mint = add_cookie(sqlite_client, "Mint Chip", 3.50)
+
+    def ids(query):
+        response = sqlite_client.get(f'/api/cookies/?{query}')
+        assert response.status_code == 200
+        return [cookie["id"] for cookie in response.get_json()]
+
+    assert ids("name_search=CHIP") == [chip, mint]
+    assert ids("min_price=2&max_price=3") == [chip]
+    assert ids("sort=-price") == [mint, chip, sugar]
+    assert ids("sort=name") == [chip, mint, sugar]
+
+    response = sqlite_client.get('/api/cookies/?cursor=&per_page=2&sort=price')
+    assert [cookie["id"] for cookie in response.get_json()] == [sugar, chip]
+    assert ids(f"cursor={response.headers['X-Next-Cursor']}&per_page=2&sort=price") == [mint]
+
+
+
+def test_sqlite_orders(sqlite_client):
+
+    chip = add_cookie(sqlite_client, "Chocolate Chip", 2.00)
+    sugar = add_cookie(sqlite_client, "Sugar Cookie", 1.00)
+
+    response = sqlite_client.post('/api/orders/', json={
+        "cookies_and_quantities": {str(chip): 2, str(sugar): 3},
+        "deliver_date": "2025-04-21T15:30:00Z",
+    })
+    assert response.status_code == 201
+    order = response.get_json()
+    assert order["cookies_and_quantities"] == {str(chip): 2, str(sugar): 3}
+    assert order["deliver_date"] == "2025-04-21T15:30:00+00:00"
+
+    # Total is 7.00, and follows price changes
+    response = sqlite_client.get('/api/orders/?min_total_amount=6.5&max_total_amount=7.5')
+    assert [o["id"] for o in response.get_json()] == [order["id"]]
+
+    sqlite_client.patch(f'/api/cookies/{sugar}', json={"price": 2.00})
+    response = sqlite_client.get('/api/orders/?min_total_amount=9.5&max_total_amount=10.5')
+    assert [o["id"] for o in response.get_json()] == [order["id"]]
+
+    # Status transitions and counts
+    response = sqlite_client.patch(f'/api/orders/{order["id"]}', json={"status": "COOKING"})
+    assert response.get_json()["status"] == "COOKING"
+    assert sqlite_client.get('/api/orders/?status=COOKING').get_json()[0]["id"] == order["id"]
+    assert sqlite_client.get('/api/orders/stats').get_json()["COOKING"] == 1
+    assert sqlite_client.get('/api/orders/?max_deliver_date=2025-01-01T00:00:00Z').get_json() == []
+
+
+
+def test_sqlite_data_outlives_the_app(tmp_path, sqlite_client):
+
+    id = add_cookie(sqlite_client, "Ginger Snap", 1.25)
+
+    # A second app (e.g. another worker) on the same file sees the same data
+    other_client = create_app({'STORAGE_BACKEND': 'sqlite', 'SQLITE_PATH': str(tmp_path / 'shop.db')}).test_client()
+    assert other_client.get(f'/api/cookies/{id}').get_json()["name"] == "Ginger Snap"
+
+
+
+def test_sqlite_cookie_batch(sqlite_client):
+
+    id = add_cookie(sqlite_client, "Ginger Snap", 1.25)
+
+    response = sqlite_client.post('/api/cookies:batch', json={"operations": [
+        {"op": "create", "cookie": {"name": "Mint Chip", "description": "A mint chip", "price": 2.00, "inventory_count": 3}},
+        {"op": "patch", "id": id, "cookie": {"price": 1.50}},
+        {"op": "delete", "id": 9999},
+    ]})
+    results = response.get_json()["results"]
+    assert [result["status"] for result in results] == [201, 200, 404]
+    assert sqlite_client.get(f'/api/cookies/{results[0]["id"]}').get_json()["name"] == "Mint Chip"
+    assert sqlite_client.get(f'/api/cookies/{id}').get_json()["price"] == 1.50
+
+    # A cookie deleted by the batch rolls the atomic batch back
+    response = sqlite_client.post('/api/cookies:batch', json={"atomic": True, "operations": [
+        {"op": "patch", "id": id, "cookie": {"price": 9.00}},
+        {"op": "delete", "id": results[0]["id"]},
+        {"op": "delete", "id": results[0]["id"]},
+    ]})
+    assert response.status_code == 400
+    assert sqlite_client.get(f'/api/cookies/{id}').get_json()["price"] == 1.50
+
+
+
+@pytest.mark.parametrize('backend', ['memory', 'sqlite'])
+def test_batch_patch_that_changes_nothing(tmp_path, backend):
+
+    store = CookieStore() if backend == 'memory' else SqliteCookieStore(SqliteDatabase(str(tmp_path / 'shop.db')))
+    cookie = Cookie("Oat Cookie", "An oat cookie", 1.00, 5)
+    store.add(cookie)
+
+    # Reported as a ValueError, not as the (unchanged) cookie
+    changed, unchanged = store.apply_batch([('patch', cookie.id, {'price': 2.00}), ('patch', cookie.id, {'description': ''})])
+    assert changed.price == 2.00
+    assert isinstance(unchanged, ValueError)
+    assert (store[cookie.id].description, store[cookie.id].version) == ("An oat cookie", changed.version)
+
+
+
+def test_sqlite_order_batch(sqlite_client):
+
+    chip = add_cookie(sqlite_client, "Chocolate Chip", 2.00, inventory_count=5)
+
+    response = sqlite_client.post('/api/orders:batch', json={"orders": [
+        {"cookies_and_quantities": {str(chip): 3}, "deliver_date": "2025-04-21T15:30:00Z"},
+        {"cookies_and_quantities": {str(chip): 3}, "deliver_date": "2025-04-21T15:30:00Z"},
+    ]})
+    results = response.get_json()["results"]
+    assert [result["status"] for result in results] == [201, 409]
+    assert sqlite_client.get(f'/api/cookies/{chip}').get_json()["inventory_count"] == 2
+
+    response = sqlite_client.patch('/api/orders:batch', json={"changes": [{"id": results[0]["id"], "status": "CANCELLED"}]})
+    assert response.get_json()["results"][0]["order"]["status"] == "CANCELLED"
+    assert sqlite_client.get(f'/api/cookies/{chip}').get_json()["inventory_count"] == 5
+
+
+
+def test_sqlite_etags(tmp_path, sqlite_client):
+
+    id = add_cookie(sqlite_client, "Ginger Snap", 1.25)
+    etag = sqlite_client.get(f'/api/cookies/{id}').headers["ETag"]
+    list_etag = sqlite_client.get('/api/cookies/').headers["ETag"]
+
+    # Versions live in the database, so another worker hands out the same ETags
+    other_client = create_app({'STORAGE_BACKEND': 'sqlite', 'SQLITE_PATH': str(tmp_path / 'shop.db')}).test_client()
+    assert other_client.get(f'/api/cookies/{id}', headers={'If-None-Match': etag}).status_code == 304
+    assert other_client.get('/api/cookies/', headers={'If-None-Match': list_etag}).status_code == 304
+
+    response = other_client.patch(f'/api/cookies/{id}', json={"price": 1.50}, headers={'If-Match': etag})
+    assert response.status_code == 200
+    assert sqlite_client.patch(f'/api/cookies/{id}', json={"price": 9.00}, headers={'If-Match': etag}).status_code == 412
+    assert sqlite_client.get(f'/api/cookies/{id}', headers={'If-None-Match': response.headers["ETag"]}).status_code == 304
+    assert sqlite_client.get('/api/cookies/', headers={'If-None-Match': list_etag}).status_code == 200
+
+
+
+def test_sqlite_adds_version_columns_to_old_databases(tmp_path):
+
+    path = str(tmp_path / 'old.db')
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE cookies (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, name_lower TEXT NOT NULL, '
+                 'description TEXT NOT NULL, price NOT NULL, inventory_count INTEGER NOT NULL)')
+    conn.execute("INSERT INTO cookies (name, name_lower, description, price, inventory_count) VALUES ('Old', 'old', 'An old cookie', 1, 1)")
+    conn.commit()
+    conn.close()
+
+    cookie = SqliteCookieStore(SqliteDatabase(path))[1]
+    assert (cookie.name, cookie.version) == ('Old', 1)
+
+
+
+def test_import_command_needs_a_persistent_store(tmp_path):
+
+    memory_stores = (cookie_routes_module.cookies, order_routes_module.orders)
+    path = tmp_path / 'suppliers.csv'
+    path.write_text("name,description,price,inventory_count\nCli Cookie,From the command line,1.25,10\n")
+
+    # The default in-memory store would lose the import as soon as the command exits
+    result = create_app().test_cli_runner().invoke(args=['import-cookies', str(path)])
+    assert result.exit_code != 0
+    assert 'JOURNAL_DIR' in result.output
+
+    try:
+        app = create_app({'STORAGE_BACKEND': 'sqlite', 'SQLITE_PATH': str(tmp_path / 'shop.db')})
+        result = app.test_cli_runner().invoke(args=['import-cookies', str(path)])
+    finally:
+        use_stores(*memory_stores)
+    assert result.exit_code == 0, result.output
+
+    cookies = SqliteCookieStore(SqliteDatabase(str(tmp_path / 'shop.db')))
+    assert [cookie.name for cookie in cookies.query(name_search='cli cookie')] == ['Cli Cookie']
@@ -0,0 +1,34 @@
+import random
+
+from app.store.trigram_index import TrigramIndex
+
+
+def test_search_matches_substring_check():
+
+    rng = random.Random(0)
+    texts = {id: "".join(rng.choice("abcAB ") for _ in range(rng.randint(0, 12))) for id in range(200)}
+
+    index = TrigramIndex()
+    for id, text in texts.items():
+        index.add(id, text)
+
+    for _ in range(200):
+        query = "".join(rng.choice("abcAB ") for _ in range(rng.randint(1, 5)))
+        expected = [id for id, text in texts.items() if query.lower() in text.lower()]
+        assert index.search(query) == expected
+
+
+
+def test_reindex_and_remove():
+
+    index = TrigramIndex()
+    index.add(0, "Chocolate Chip")
+    index.add(1, "Sugar Cookie")
+
+    index.add(0, "Oatmeal Raisin")
+    assert index.search("chip") == []
+    assert index.search("RAISIN") == [0]
+
+    index.remove(1)
+    assert index.search("cookie") == []
+    assert index.search("a") == [0]
@@ -0,0 +1,59 @@
+import pytest
+from flask import Flask
+from werkzeug.exceptions import BadRequest
+from app.routes.cookie_routes import cookie_input_model, cookie_patch_model
+from app.routes.order_routes import order_input_model, order_patch_model
+from app.services.validation import compile_model
+
+
+PAYLOADS = [
+    {'name': 'Oat', 'description': 'Oaty', 'price': 1.5, 'inventory_count': 3},
+    {'name': 'Oat', 'description': 'Oaty', 'price': 2, 'inventory_count': 3.0},
+    {'name': 7, 'description': None, 'price': '1.50', 'inventory_count': 2.5},
+    {'price': True, 'inventory_count': False, 'extra': 'ignored'},
+    {'cookies_and_quantities': {'1': 2}, 'deliver_date': '2025-01-01T00:00:00Z'},
+    {'cookies_and_quantities': [1, 2], 'deliver_date': 20250101},
+    {'cookies_and_quantities': None},
+    {'status': 'cooking'},
+    {'status': ['COOKING']},
+    {},
+    [],
+    ['name'],
+    'name',
+    42,
+    None,
+]
+
+
+def restx_errors(model, payload):
+    # What validate=True answers, straight from flask-restx and jsonschema
+    with Flask(__name__).test_request_context():
+        try:
+            model.validate(payload)
+        except BadRequest as e:
+            return e.data['errors']
+    return {}
+
+
+@pytest.mark.parametrize('model', [cookie_input_model, cookie_patch_model, order_input_model, order_patch_model], ids=lambda model: model.name)
+def test_compiled_validators_match_restx(model):
+
+    validate = compile_model(model)
+    for payload in PAYLOADS:
+        # Same errors, messages and order (which is the order they're sent in)
+        assert list(validate(payload).items()) == list(restx_errors(model, payload).items()), payload
+
+
+
+def test_validation_errors_are_sent_like_restx(client):
+
+    response = client.post('/cookies/', json={'name': 'Oat', 'price': 'free'})
+    assert response.status_code == 400
+    assert response.get_json() == {
+        'errors': {
+            'description': "'description' is a required property",
+            'inventory_count': "'inventory_count' is a required property",
+            'price': "'free' is not of type 'number'",
+        },
+        'message': 'Input payload validation failed',
+    }